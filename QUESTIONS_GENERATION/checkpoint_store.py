@@ -0,0 +1,20 @@
+"""Checkpoint store shared with the scrapers, the implementation lives in WEBSCRAPING/utils/checkpoint_store.py"""
+
+import importlib.util
+from pathlib import Path
+
+CHECKPOINT_STORE_PATH = (
+    Path(__file__).resolve().parents[1]
+    / "WEBSCRAPING"
+    / "utils"
+    / "checkpoint_store.py"
+)
+
+# loaded by path, `utils` of the scrapers is not importable from here
+spec = importlib.util.spec_from_file_location(
+    "webscraping_checkpoint_store", CHECKPOINT_STORE_PATH
+)
+checkpoint_store = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(checkpoint_store)
+
+CheckpointStore = checkpoint_store.CheckpointStore
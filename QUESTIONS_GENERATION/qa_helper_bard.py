@@ -1,6 +1,5 @@
 import fitz
 import re
-import json
 import pandas as pd
 
 from tqdm import tqdm
@@ -11,6 +10,7 @@ from threading import Thread
 from multiprocessing import Queue
 from io import BytesIO
 from pathlib import Path
+from checkpoint_store import CheckpointStore
 from g_drive_service import (
     get_files_in_folder,
     read_folder_files_content,
@@ -124,6 +124,12 @@ class QAHelper:
         self.last_file_index = 0
         self.count_filtered_texts = 0
         self.checkpoint_saver = CheckpointSaver(self)
+        self.checkpoint_store = CheckpointStore(CHECKPOINTS_DIR / "checkpoints.sqlite")
+        # import checkpoints saved by older versions as json files, once
+        for json_path in CHECKPOINTS_DIR.glob("*_context_checkpoint.json"):
+            self.checkpoint_store.migrate_json(
+                json_path, json_path.name.removesuffix("_checkpoint.json")
+            )
         self.load_checkpoint(self.save_checkpoint(0, ""))
         self.context_queue = Queue()
         self.generator = BardQAGenerator(
@@ -132,56 +138,44 @@ class QAHelper:
         self.context_queue_feeder = None
 
     def save_checkpoint(self, file_index: int, file_name: str):
-        """Saves the current state of the QAHelper. Utilizes folder name to save the checkpoint."""
+        """Saves the current state of the QAHelper. Utilizes folder name as the checkpoint key."""
         # get the last part of the folder name. Ex: if folder name is `folder1/folder2`, then `folder2` will be returned.
         dest_folder_name = self.folder_name.split("/")[-1]
-        checkpoint_path = (
-            CHECKPOINTS_DIR
-            / f"{dest_folder_name}_{self.max_chunk_length}_context_checkpoint.json"
-        )
+        checkpoint_key = f"{dest_folder_name}_{self.max_chunk_length}_context"
 
-        # check if the checkpoint directory exists
-        if not CHECKPOINTS_DIR.exists():
-            CHECKPOINTS_DIR.mkdir()
+        checkpoint = self.checkpoint_store.load(checkpoint_key)
 
-        # check if checkpoint file exists
-        if Path(checkpoint_path).exists():
-            checkpoint = self.load_checkpoint(checkpoint_path)
-
-            # check if last file index is greater than the current file index before overwriting
-            if checkpoint["last_file_index"] > file_index:
-                print(
-                    f"Current file index is {file_index}. Last file index is {checkpoint['last_file_index']}. Not overwriting the checkpoint."
-                )
-                return checkpoint_path
-
-        # save the last file name
-        with open(checkpoint_path, "w") as f:
-            json.dump(
-                {
-                    "last_file_name": file_name,
-                    "last_file_index": file_index,
-                    "count_filtered_texts": self.count_filtered_texts,
-                },
-                f,
+        # check if last file index is greater than the current file index before overwriting
+        if checkpoint and checkpoint["last_file_index"] > file_index:
+            print(
+                f"Current file index is {file_index}. Last file index is {checkpoint['last_file_index']}. Not overwriting the checkpoint."
             )
+            return checkpoint_key
+
+        # save the last file name. Committed atomically with other saves in the background
+        self.checkpoint_store.save(
+            checkpoint_key,
+            {
+                "last_file_name": file_name,
+                "last_file_index": file_index,
+                "count_filtered_texts": self.count_filtered_texts,
+            },
+        )
 
-        return checkpoint_path
+        return checkpoint_key
 
-    def load_checkpoint(self, checkpoint_path: str):
-        """Loads the checkpoint from the given path"""
+    def load_checkpoint(self, checkpoint_key: str):
+        """Loads the checkpoint of the given key"""
+        checkpoint = self.checkpoint_store.load(checkpoint_key)
 
         # check if the checkpoint exists
-        if not Path(checkpoint_path).exists():
+        if checkpoint is None:
             return
 
-        with open(checkpoint_path, "r") as f:
-            checkpoint = json.load(f)
-
-            # set the last file name and index
-            self.last_file_name = checkpoint["last_file_name"]
-            self.last_file_index = checkpoint["last_file_index"]
-            self.count_filtered_texts = checkpoint["count_filtered_texts"]
+        # set the last file name and index
+        self.last_file_name = checkpoint["last_file_name"]
+        self.last_file_index = checkpoint["last_file_index"]
+        self.count_filtered_texts = checkpoint["count_filtered_texts"]
 
         return checkpoint
 
@@ -0,0 +1,31 @@
+"""Page load time and bytes transferred of the same pages under each CDP request blocking profile.
+
+Run from WEBSCRAPING: python -m benchmarks.bench_blocking_profiles [url ...]
+Needs Chrome and network access. Bytes of cross-origin resources without Timing-Allow-Origin are reported as 0 by the browser.
+"""
+
+import sys
+from utils.selenium_helper import SeleniumHelper, BLOCKING_PROFILES, report_pages
+
+URLS = [
+    "https://legislacao.presidencia.gov.br/",
+    "http://www.planalto.gov.br/ccivil_03/leis/l9985.htm",
+    "http://www.planalto.gov.br/ccivil_03/_ato2019-2022/2019/decreto/d10088.htm",
+    "https://www.gov.br/icmbio/pt-br/assuntos/atos-normativos",
+]
+
+
+if __name__ == "__main__":
+    urls = sys.argv[1:] or URLS
+
+    for profile in BLOCKING_PROFILES:
+        browser = SeleniumHelper(blocking_profile=profile)
+        try:
+            for url in urls:
+                # fresh cache for every profile and url, otherwise only the first load transfers bytes
+                browser.get_driver().execute_cdp_cmd("Network.clearBrowserCache", {})
+                browser.get(url)
+        finally:
+            browser.get_driver().quit()
+
+    report_pages()
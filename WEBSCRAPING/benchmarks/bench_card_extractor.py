@@ -0,0 +1,79 @@
+"""Microbenchmark of search results extraction: BeautifulSoup tree vs compiled XPath on the results fragment.
+
+Run from WEBSCRAPING: python -m benchmarks.bench_card_extractor
+"""
+
+import time
+from bs4 import BeautifulSoup
+from utils.card_extractor import CARD_CLASS, extract_cards
+
+PAGES = 200
+CARDS_PER_PAGE = 10
+
+CARD = """
+<div class="card p-2 pr-3 pl-3 w-100">
+    <div class="card-body">
+        <h4 class="card-title">Decreto nº {number}, de 28 de junho de 2023</h4>
+        <p class="card-text">Dispõe sobre a estrutura regimental e o quadro demonstrativo dos cargos em comissão {number}.</p>
+        <ul class="list-inline p-0 m-0">
+            <li class="list-inline-item"><a href="https://legislacao.presidencia.gov.br/atos/?tipo=DEC&numero={number}">Detalhes</a></li>
+            <li class="list-inline-item"><a href="http://www.planalto.gov.br/ccivil_03/_ato2023-2026/2023/decreto/D{number}.htm">Texto integral</a></li>
+        </ul>
+    </div>
+</div>"""
+
+# navigation, scripts and filters surround the results in real pages
+PAGE = """<html><head>{head}</head><body>
+<nav>{nav}</nav>
+<h4 class="pb-2 fw-bold">12.345 resultados</h4>
+<div id="resultados">{cards}</div>
+<footer>{nav}</footer>
+</body></html>"""
+
+
+def make_page(page: int) -> str:
+    return PAGE.format(
+        head="<script>var x = 1;</script>" * 50,
+        nav="".join(f'<a href="/menu/{i}">Menu {i}</a>' for i in range(200)),
+        cards="".join(
+            CARD.format(number=page * CARDS_PER_PAGE + i) for i in range(CARDS_PER_PAGE)
+        ),
+    )
+
+
+def soup_cards(html_text: str) -> list[tuple]:
+    """Previous extraction path"""
+    cards = BeautifulSoup(html_text, "lxml").find_all("div", class_=CARD_CLASS)
+    return [
+        (
+            card.find("h4", class_="card-title").text.strip(),
+            card.find("ul", class_="list-inline p-0 m-0").find_all("a")[1]["href"],
+        )
+        for card in cards
+    ]
+
+
+def xpath_cards(html_text: str) -> list[tuple]:
+    return [(card.title, card.link) for card in extract_cards(html_text)]
+
+
+def bench(name: str, func, pages: list[str]) -> tuple:
+    start = time.perf_counter()
+    results = [func(page) for page in pages]
+    elapsed = time.perf_counter() - start
+
+    print(f"{name}: {len(pages) / elapsed:.1f} pages/s ({elapsed:.2f}s)")
+    return elapsed, results
+
+
+if __name__ == "__main__":
+    pages = [make_page(page) for page in range(PAGES)]
+    print(
+        f"{PAGES} pages of {len(pages[0]) / 1024:.1f} KB, {CARDS_PER_PAGE} cards each"
+    )
+
+    soup_elapsed, soup_results = bench("BeautifulSoup", soup_cards, pages)
+    xpath_elapsed, xpath_results = bench("XPath", xpath_cards, pages)
+
+    assert soup_results == xpath_results, "extractors disagree"
+    print(f"Speedup: {soup_elapsed / xpath_elapsed:.1f}x")
@@ -0,0 +1,107 @@
+"""Benchmark of the two ways to store a planalto law page: render to pdf and extract its text with fitz (current pipeline) vs store compressed html and extract text from the DOM (capture mode).
+
+Run from WEBSCRAPING: python -m benchmarks.bench_html_capture [--docs 50] [--renderers 4]
+The pdf path needs Chrome and PyMuPDF, it is skipped when they are not available.
+"""
+
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from utils.html_capture import write_capture
+from utils.pdf_renderer import PdfRenderer
+
+ARTICLE = """
+<p style="text-indent: 1cm"><a name="art{number}"></a>Art. {number}. Fica instituído o programa de que trata esta Lei, destinado a promover a conservação e o uso sustentável dos recursos naturais nas unidades de conservação federais.</p>
+<p style="text-indent: 1cm">§ 1º O regulamento disporá sobre os critérios de <strike>seleção</strike> elegibilidade dos beneficiários.</p>
+<p style="text-indent: 1cm">I - as áreas prioritárias definidas pelo órgão ambiental competente;</p>
+<p style="text-indent: 1cm">II - os instrumentos de monitoramento previstos no <a href="/ccivil_03/leis/L9985.htm">art. 27 da Lei nº 9.985, de 2000</a>.</p>"""
+
+# layout of planalto pages: tables for header and footer, inline styles, scripts
+PAGE = """<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>L{number}</title><style>p {{ font-family: Arial; font-size: 10pt }}</style>
+<script>window.onload = function () {{ return 1; }};</script></head><body>
+<table width="100%"><tr><td><img src="../Brastra.gif"></td><td><p align="center"><b>Presidência da República<br>Casa Civil<br>Subchefia para Assuntos Jurídicos</b></p></td></tr></table>
+<p align="center"><b>LEI Nº {number}, DE 28 DE JUNHO DE 2023</b></p>
+{articles}
+<p align="center">Brasília, 28 de junho de 2023; 202º da Independência e 135º da República.</p>
+</body></html>"""
+
+
+def make_page(number: int, articles: int = 60) -> str:
+    return PAGE.format(
+        number=number,
+        articles="".join(ARTICLE.format(number=i + 1) for i in range(articles)),
+    )
+
+
+def report(name: str, docs: int, elapsed: float, stored_bytes: int):
+    print(
+        f"{name}: {docs / elapsed:.1f} docs/s ({elapsed:.2f}s) | {stored_bytes / docs / 1024:.1f} KB stored per doc"
+    )
+
+
+def bench_capture(pages: list[str], output_dir: Path) -> tuple:
+    start = time.perf_counter()
+    paths = [write_capture(page, output_dir, f"L{i}") for i, page in enumerate(pages)]
+    elapsed = time.perf_counter() - start
+
+    stored_bytes = sum(path.stat().st_size for pair in paths for path in pair)
+    report("Capture (html.gz + text)", len(pages), elapsed, stored_bytes)
+
+    return elapsed, stored_bytes
+
+
+def bench_pdf(pages: list[str], output_dir: Path, renderers: int) -> tuple:
+    import fitz
+
+    renderer = PdfRenderer(workers=renderers)
+    output_paths = [output_dir / f"L{i}.pdf" for i in range(len(pages))]
+    try:
+        # warm browsers first, the pipeline keeps them running between documents
+        renderer.render(output_dir / "warmup.pdf", html_str=pages[0])
+
+        start = time.perf_counter()
+        jobs = [
+            renderer.submit(path, html_str=page)
+            for path, page in zip(output_paths, pages)
+        ]
+        for job in jobs:
+            renderer.wait(job)
+
+        stored_bytes = 0
+        for path in output_paths:
+            text_path = path.with_suffix(".txt")
+            with fitz.open(path) as doc:
+                text_path.write_text("".join(page.get_text() for page in doc))
+
+            stored_bytes += path.stat().st_size + text_path.stat().st_size
+        elapsed = time.perf_counter() - start
+    finally:
+        renderer.close()
+
+    report("Pdf (render + fitz text)", len(pages), elapsed, stored_bytes)
+
+    return elapsed, stored_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--renderers", type=int, default=4)
+    args = parser.parse_args()
+
+    pages = [make_page(number) for number in range(args.docs)]
+    print(f"{args.docs} pages of {len(pages[0].encode('utf-8')) / 1024:.1f} KB")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        capture_elapsed, capture_bytes = bench_capture(pages, Path(output_dir))
+
+        try:
+            pdf_elapsed, pdf_bytes = bench_pdf(pages, Path(output_dir), args.renderers)
+        except Exception as e:
+            print(f"Pdf path skipped: {e}")
+        else:
+            print(
+                f"Capture is {pdf_elapsed / capture_elapsed:.1f}x faster and stores {pdf_bytes / capture_bytes:.1f}x fewer bytes"
+            )
@@ -4,9 +4,12 @@ from pathlib import Path
 from io import BytesIO
 from google.colab import drive
 from tqdm import tqdm
+from utils.document_store import DocumentStore, file_sha256
 
 drive.mount("/content/drive")
 
+RAW_TEXT_CONSUMER = "raw_text"  # name of this step in the document store
+
 
 def extract_text(file_path: Path = None, file_content: BytesIO = None):
     if file_path:
@@ -28,7 +31,10 @@ def save_raw_text(file_path: Path, raw_text: str):
         f.write(raw_text)
 
 
-def pdf_to_raw_text(input_folder: Path, output_folder: Path):
+def pdf_to_raw_text(
+    input_folder: Path, output_folder: Path, document_store: DocumentStore = None
+):
+    """Extract text of pdfs. With `document_store`, copies of a document already extracted are skipped"""
     max_leis = 28913
     max_decretos = 165000
     max_files = 0
@@ -45,8 +51,14 @@ def pdf_to_raw_text(input_folder: Path, output_folder: Path):
         if not file.is_file() or not file.name.endswith(".pdf"):
             continue
         try:
+            sha256 = file_sha256(file) if document_store else None
+            if sha256 and document_store.is_processed(sha256, RAW_TEXT_CONSUMER):
+                continue
+
             raw_text = extract_text(file)
             save_raw_text(output_folder / file.name.replace(".pdf", ".txt"), raw_text)
+            if sha256:
+                document_store.mark_processed(sha256, RAW_TEXT_CONSUMER)
         except Exception as e:
             print(f"Error while processing file {file}: {e}")
             continue
@@ -58,4 +70,4 @@ output_folder = Path(
 )
 
 
-pdf_to_raw_text(folder, output_folder)
+pdf_to_raw_text(folder, output_folder, DocumentStore())
@@ -1,6 +1,7 @@
 import os
 import time
 import fitz
+import hashlib
 from pathlib import Path
 from unidecode import unidecode
 from io import BytesIO
@@ -15,9 +16,11 @@ from g_drive_service import (
 from threading import Thread
 from multiprocessing import Queue, cpu_count
 from concurrent.futures import ThreadPoolExecutor
+from utils.document_store import DocumentStore
 
 
 DATA_FOLDER_ID = "1vRRmyecRE71qKmHlmSbW29G1cPDj3E2t"  # where documents are stored
+RAW_TEXT_CONSUMER = "raw_text"  # name of this step in the document store
 
 folder = Path("legislacao_federal/leis")
 output_folder = folder / "RAW_TEXT"
@@ -123,8 +126,12 @@ def extract_text(file_path: Path = None, file_content: BytesIO = None):
 
 
 def pdf_to_raw_text(
-    contents: "list[str]", files_uploader: FilesUploader, output_folder_id: str
+    contents: "list[str]",
+    files_uploader: FilesUploader,
+    output_folder_id: str,
+    document_store: DocumentStore,
 ):
+    """Extract text of pdfs once: copies of a document already extracted, under any name or scraper, are skipped, so question generation also processes them once"""
     for file_index, file_name, file_content in contents:
         # start files_uploader only after first file is finished downloading
         if not files_uploader.is_alive():
@@ -134,6 +141,10 @@ def pdf_to_raw_text(
         if not file_name.endswith(".pdf"):
             continue
         try:
+            sha256 = hashlib.sha256(file_content).hexdigest()
+            if document_store.is_processed(sha256, RAW_TEXT_CONSUMER):
+                continue
+
             raw_text = extract_text(file_content=file_content)
             raw_text_file_path = Path(output_folder) / (
                 file_name.replace(".pdf", ".txt")
@@ -148,6 +159,7 @@ def pdf_to_raw_text(
                     "mimetype": "text/plain",
                 }
             )
+            document_store.mark_processed(sha256, RAW_TEXT_CONSUMER)
 
         except Exception as e:
             print(f"Error while processing file {file_name}: {e}")
@@ -178,7 +190,9 @@ if __name__ == "__main__":
             service, output_folder.name, folder_id
         )
 
-        pdf_to_raw_text(contents, files_uploader, output_folder_id)
+        document_store = DocumentStore()
+        pdf_to_raw_text(contents, files_uploader, output_folder_id, document_store)
+        document_store.report()
 
         # wait for threads to finish
         files_uploader.join()
@@ -0,0 +1,37 @@
+import argparse
+from scrapers.legislacao_federal import LegislacaoFederalScraper
+from scrapers.icmbio import ICMBIOScraper
+from utils.files_remover import FilesRemover
+from utils.files_uploader import FilesUploader
+
+SCRAPERS = {
+    "legislacao_federal": LegislacaoFederalScraper,
+    "icmbio": ICMBIOScraper,
+}
+
+
+if __name__ == "__main__":
+    # re-process links of failed_links.jsonl through the scraper pipeline
+    parser = argparse.ArgumentParser(description="Replay failed links")
+    parser.add_argument("scraper", choices=SCRAPERS.keys())
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--fetch-workers", type=int, default=16)
+    args = parser.parse_args()
+
+    files_remover = FilesRemover()
+    files_remover.start()
+    files_uploader = FilesUploader(files_remover)
+
+    scraper = SCRAPERS[args.scraper](
+        files_remover=files_remover,
+        files_uploader=files_uploader,
+        use_selenium=False,
+    )
+    remaining = scraper.replay_failed(
+        rounds=args.rounds, workers={"fetch": args.fetch_workers}
+    )
+    print(f"Links still failing: {remaining}")
+
+    # wait for threads to finish
+    files_remover.stop = True
+    files_remover.join()
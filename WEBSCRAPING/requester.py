@@ -1,6 +1,8 @@
 import time
 import os
+import asyncio
 import http.cookiejar
+import httpx
 import requests
 import ssl
 import certifi
@@ -9,17 +11,44 @@ from unidecode import unidecode
 from urllib.request import (
     urlopen,
     Request,
-    install_opener,
     build_opener,
     HTTPCookieProcessor,
     ProxyHandler,
 )
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit
 from urllib.error import HTTPError, URLError
+from http.client import HTTPException
 from bs4 import BeautifulSoup
 from pathlib import Path
+from threading import Thread
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import cached_property, partial
+from types import MappingProxyType
 
 from fake_useragent import UserAgent
+from utils.retry_policy import (
+    RetryPolicy,
+    RequestFailedError,
+    default_retry_policy,
+    classify_status,
+    parse_retry_after,
+    NETWORK_ERROR,
+    VERIFICATION_ERROR,
+)
+from utils.response_cache import ResponseCache
+from utils.rate_limiter import HostRateLimiter, default_rate_limiter
+from utils.proxy_pool import ProxyPool
+from utils.single_flight import SingleFlight, default_single_flight, normalize_url
+from utils.file_download import (
+    CHUNK_SIZE,
+    DownloadVerificationError,
+    download_path,
+    part_path,
+    resume_headers,
+    open_part,
+    finalize_part,
+)
 
 ua = UserAgent()
 
@@ -51,8 +80,40 @@ def get_proxies():
         return {}
 
 
+@dataclass(frozen=True)
+class Response:
+    """Immutable HTTP response. Text is decoded lazily from `content`"""
+
+    url: str
+    status: int
+    headers: MappingProxyType = field(repr=False)
+    content: bytes = field(repr=False)
+    from_cache: bool = False
+
+    @classmethod
+    def create(
+        cls, url: str, status: int, headers, content: bytes, from_cache: bool = False
+    ):
+        return cls(url, status, MappingProxyType(dict(headers)), content, from_cache)
+
+    @cached_property
+    def encoding(self) -> str:
+        for name, value in self.headers.items():
+            if name.lower() == "content-type" and "charset=" in value:
+                return value.split("charset=")[-1].split(";")[0].strip().strip('"')
+
+        return "utf-8"
+
+    @cached_property
+    def text(self) -> str:
+        try:
+            return self.content.decode(self.encoding, errors="replace")
+        except LookupError:  # unknown charset
+            return self.content.decode("utf-8", errors="replace")
+
+
 class Requester:
-    """Class used to manipulate requests and session cookies"""
+    """Class used to manipulate requests and session cookies. Thread safe: requests share no state other than the cookie jar, and each instance has its own opener"""
 
     def __init__(
         self,
@@ -64,95 +125,267 @@ class Requester:
         timeout=15,
         proxy=None,
         use_auto_proxy: bool = False,
+        proxy_pool: ProxyPool = None,
+        retry_policy: RetryPolicy = default_retry_policy,
+        response_cache: ResponseCache = None,
+        rate_limiter: HostRateLimiter = default_rate_limiter,
+        single_flight: SingleFlight = default_single_flight,
     ):
         self.data = data
         self.headers = headers
         self.cookies = cookies
         self.timeout = timeout
         self.proxy = proxy
-        self.response = None
-        self.html = None
-        self.text = None
-        self.status_code = None
-        self.error = None
         self.cookie_jar = http.cookiejar.CookieJar()
-        self.proxies = get_proxies() if use_auto_proxy else None  # https only
+        self.proxy_pool = proxy_pool
+        if use_auto_proxy and proxy_pool is None:
+            self.proxy_pool = ProxyPool(get_proxies)  # https only
+            self.proxy_pool.start()
         self.opener = build_opener(HTTPCookieProcessor(self.cookie_jar))
-        # self.retries = retries
+        self.retry_policy = retry_policy
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        self.single_flight = single_flight
 
         if cookies:
             self.set_cookie(cookies)
 
-        install_opener(self.opener)
-
     def update_proxy(self, request: Request, proxy, proxy_type):
         if proxy:
             request.set_proxy(proxy, proxy_type)
 
-    def make_request(self, url, data=None, headers=None, method: str = "GET"):
+    def get_proxy(self) -> str:
+        """Proxy for next attempt, sticky to this requester cookie jar. None when not using proxies"""
+        if not self.proxy_pool:
+            return None
+
+        return self.proxy_pool.get(session_key=id(self.cookie_jar))
+
+    def report_proxy(self, proxy: str, error_kind: str, started: float):
+        """Tell proxy pool how the attempt through proxy went. Network errors move this session to another proxy"""
+        if not proxy:
+            return
+
+        ok = error_kind != NETWORK_ERROR
+        self.proxy_pool.report(proxy, ok, time.perf_counter() - started)
+        if not ok:
+            self.proxy_pool.release_session(id(self.cookie_jar))
+
+    def make_request(self, url, data=None, headers=None, method: str = "GET") -> str:
+        """Make request and return response text"""
+        return self.request(url, data, headers, method).text
+
+    def session_key(self):
+        """Identity of the session requests are sent in: cookie jar and proxy. Requesters without cookies or proxy pool share it, so anonymous requests still coalesce"""
+        session = (
+            id(self.cookie_jar) if len(self.cookie_jar) or self.proxy_pool else None
+        )
+
+        return (session, self.proxy)
+
+    def request_key(self, url, data=None, method: str = "GET") -> tuple:
+        """Requests with the same key are coalesced while in flight. Requests of different sessions are never coalesced, the response depends on the cookies and its Set-Cookie must reach the jar of each session"""
+        if isinstance(data, dict):
+            data = urlencode(data)
+
+        return (method.upper(), normalize_url(url), data, self.session_key())
+
+    def request(self, url, data=None, headers=None, method: str = "GET") -> Response:
+        """Make request and return an immutable `Response`. Concurrent requests for the same url and data share one fetch"""
+        return self.single_flight.do(
+            self.request_key(url, data, method), self.fetch, url, data, headers, method
+        )
+
+    def fetch(self, url, data=None, headers=None, method: str = "GET") -> Response:
+        """Make request without coalescing"""
         if data is not None:
             # Processa os dados para serem enviados na requisição
             data = urlencode(data)
             data = data.encode("utf-8")
 
         headers = headers if headers else self.headers
-        request = Request(url, data, headers, method=method)
 
-        # if self.proxies:
-        #     proxy = self.proxies.pop()
-        #     # remove https:// from proxy
-        #     proxy = proxy.split("//")[1]
-        #     proxy_type = "https"
-        #     self.update_proxy(request, proxy, proxy_type)
+        # serve from cache or make the request conditional
+        cached, conditional = (
+            self.response_cache.lookup(method, url, data)
+            if self.response_cache
+            else (None, {})
+        )
+        if conditional is None:
+            return Response.create(
+                url, cached.status, cached.headers, cached.body, from_cache=True
+            )
 
+        headers = {**headers, **conditional}
+
+        host = urlsplit(url).netloc
+        attempt = 0
         while True:
+            self.retry_policy.before_attempt(url, host)
+
+            status = None
+            retry_after = None
+            error_kind = None
+            request = Request(url, data, headers, method=method)
+            proxy = self.get_proxy()
+            self.update_proxy(request, proxy, "http")
+
+            started = self.rate_limiter.acquire(host)
             try:
-                with urlopen(
+                with self.opener.open(
                     request,
                     timeout=self.timeout,
                     # context=ssl.create_default_context(cafile=certifi.where()),
-                ) as response:
-                    self.html = response.read()
-                    self.text = self.html.decode("utf-8")
-                    self.status_code = response.getcode()
-                    return self.text
+                ) as http_response:
+                    response = Response.create(
+                        http_response.geturl(),
+                        http_response.getcode(),
+                        http_response.headers,
+                        http_response.read(),
+                    )
+                    self.retry_policy.record_success(host)
+
+                    if self.response_cache:
+                        self.response_cache.store(
+                            method,
+                            url,
+                            data,
+                            response.status,
+                            response.headers,
+                            response.content,
+                            previous=cached,
+                        )
+
+                    return response
             except HTTPError as error:
+                if error.status == 304 and cached:
+                    content = self.response_cache.revalidated(cached, error.headers)
+                    self.retry_policy.record_success(host)
+                    return Response.create(
+                        url, cached.status, cached.headers, content, from_cache=True
+                    )
+
                 print(error.status, error.reason)
+                status = error.status
+                error_kind = classify_status(status)
+                retry_after = parse_retry_after(error.headers.get("Retry-After"))
             except URLError as error:
                 print(error.reason)
+                error_kind = NETWORK_ERROR
             except TimeoutError:
                 print("Request timed out")
+                error_kind = NETWORK_ERROR
+            except (ConnectionError, HTTPException) as error:
+                print(error)
+                error_kind = NETWORK_ERROR
+            finally:
+                self.rate_limiter.release(host, started, error_kind, status)
+                self.report_proxy(proxy, error_kind, started)
 
-            time.sleep(5)
+            delay = self.retry_policy.next_delay(
+                host, attempt, error_kind, status, retry_after
+            )
+            if delay is None:
+                raise RequestFailedError(url, error_kind, status)
 
-            # try again with another proxy
-            if self.proxies:
-                proxy = self.proxies.pop()
-                # remove https:// from proxy
-                proxy = proxy.split("//")[1]
-                proxy_type = "https"
-                self.update_proxy(request, proxy, proxy_type)
+            attempt += 1
+            time.sleep(delay)
+
+    def download_file(
+        self,
+        url: str,
+        filename: str,
+        output_dir: str,
+        expected_sha256: str = None,
+    ):
+        """Download file from url to file_path. Concurrent downloads of the same url to the same path share one transfer"""
+        file_path = download_path(filename, output_dir)
 
-            continue
+        return self.single_flight.do(
+            ("DOWNLOAD", normalize_url(url), str(file_path)),
+            self.fetch_file,
+            url,
+            file_path,
+            expected_sha256,
+        )
 
-    def download_file(self, url: str, filename: str, output_dir: str):
-        """Download file from url to file_path"""
-        # replace spaces with underscores and replace slashes with hifen from filename
-        filename = unidecode(filename.replace(" ", "_").replace("/", "-"))
+    def fetch_file(self, url: str, file_path: Path, expected_sha256: str = None):
+        """Download url to file_path. The body is streamed in chunks to a `.part` file, resumed with a Range request on retry, verified by size (and checksum if given) and atomically renamed, so `file_path` only exists when complete"""
+        if file_path.exists():
+            return file_path
 
-        # check if file exists. Uses pathlib
-        file_path = Path(output_dir) / filename
+        part = part_path(file_path)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            self.retry_policy.before_attempt(url, host)
 
-        # check if dirs and subdirs exists
-        file_path.parent.mkdir(parents=True, exist_ok=True)
+            status = None
+            retry_after = None
+            error_kind = None
+            proxy = self.get_proxy()
+            proxies = (
+                {"http": f"http://{proxy}", "https": f"http://{proxy}"}
+                if proxy
+                else None
+            )
 
-        if file_path.exists():
-            return
+            started = self.rate_limiter.acquire(host)
+            headers_at = None
+            try:
+                with requests.get(
+                    url,
+                    headers=resume_headers(part, self.headers),
+                    timeout=self.timeout,
+                    stream=True,
+                    proxies=proxies,
+                ) as response:
+                    headers_at = time.perf_counter()
+                    if response.status_code == 416:  # part is bigger than file
+                        part.unlink()
+                        raise DownloadVerificationError(
+                            f"{part.name}: range not satisfiable"
+                        )
+
+                    response.raise_for_status()
+
+                    f, hasher, expected_size = open_part(
+                        part, response.status_code, response.headers
+                    )
+                    with f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            hasher.update(chunk)
+
+                finalize_part(part, file_path, hasher, expected_size, expected_sha256)
 
-        # download file
-        with open(file_path, "wb") as f:
-            response = requests.get(url)
-            f.write(response.content)
+                self.retry_policy.record_success(host)
+                return file_path
+            except requests.HTTPError as error:
+                print(error)
+                status = error.response.status_code
+                error_kind = classify_status(status)
+                retry_after = parse_retry_after(
+                    error.response.headers.get("Retry-After")
+                )
+            except requests.RequestException as error:
+                print(error)
+                error_kind = NETWORK_ERROR
+            except DownloadVerificationError as error:
+                print(error)
+                error_kind = VERIFICATION_ERROR
+            finally:
+                self.rate_limiter.release(host, started, error_kind, status, headers_at)
+                self.report_proxy(proxy, error_kind, started)
+
+            delay = self.retry_policy.next_delay(
+                host, attempt, error_kind, status, retry_after
+            )
+            if delay is None:
+                raise RequestFailedError(url, error_kind, status)
+
+            attempt += 1
+            time.sleep(delay)
 
     def get_cookie(self):
         return self.cookie_jar._cookies  # type: ignore
@@ -173,8 +406,8 @@ class Requester:
             path=cookie_obj.get("path"),
             path_specified=True,
             secure=cookie_obj.get("secure"),
-            expires=None,
-            discard=True,
+            expires=cookie_obj.get("expiry"),
+            discard=cookie_obj.get("expiry") is None,
             comment=None,
             comment_url=None,
             rest={"HttpOnly": ""},
@@ -193,3 +426,286 @@ class Requester:
 
     def get_cookie_jar(self):
         return self.cookie_jar
+
+
+class AsyncRequester(Requester):
+    """Asyncio based requester. Requests run on a background event loop over a pooled httpx client (keep-alive, TLS session reuse and optional HTTP/2), so hundreds of requests can be in flight on a single core. Exposes the same `make_request`/`download_file` surface as `Requester`. Proxies are not supported since httpx binds them to the client"""
+
+    def __init__(
+        self,
+        max_connections: int = 200,
+        max_connections_per_host: int = 20,
+        max_keepalive_connections: int = 50,
+        http2: bool = False,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.max_connections_per_host = max_connections_per_host
+        self.host_semaphores = defaultdict(
+            lambda: asyncio.Semaphore(self.max_connections_per_host)
+        )
+
+        # event loop that runs all requests of this requester
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+        # httpx keeps one connection pool per origin. Client must be created inside the loop
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.client = self.run(self.create_client(limits, http2))
+
+    async def create_client(self, limits: httpx.Limits, http2: bool):
+        return httpx.AsyncClient(
+            headers=self.headers,
+            cookies=self.cookie_jar,
+            timeout=self.timeout,
+            limits=limits,
+            http2=http2,
+            follow_redirects=True,
+        )
+
+    def run(self, coroutine):
+        """Run coroutine on the requester event loop and wait for its result. Safe to call from any thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """Get semaphore that limits concurrent connections to url's host"""
+        return self.host_semaphores[urlsplit(url).netloc]
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run blocking `func` (ex: response cache sqlite I/O) in a thread, so the event loop keeps serving the requests in flight"""
+        return await self.loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def request_async(
+        self, url, data=None, headers=None, method: str = "GET"
+    ) -> Response:
+        """Make request. Concurrent requests for the same url and data share one fetch"""
+        return await self.single_flight.do_async(
+            self.request_key(url, data, method),
+            self.fetch_async,
+            url,
+            data,
+            headers,
+            method,
+        )
+
+    async def fetch_async(
+        self, url, data=None, headers=None, method: str = "GET"
+    ) -> Response:
+        headers = headers if headers else self.headers
+        host = urlsplit(url).netloc
+        attempt = 0
+
+        # serve from cache or make the request conditional
+        cached, conditional = (
+            await self.run_blocking(self.response_cache.lookup, method, url, data)
+            if self.response_cache
+            else (None, {})
+        )
+        if conditional is None:
+            return Response.create(
+                url, cached.status, cached.headers, cached.body, from_cache=True
+            )
+
+        headers = {**headers, **conditional}
+
+        while True:
+            self.retry_policy.before_attempt(url, host)
+
+            status = None
+            retry_after = None
+            error_kind = None
+            started = await self.rate_limiter.acquire_async(host)
+            try:
+                async with self.host_semaphore(url):
+                    response = await self.client.request(
+                        method, url, data=data, headers=headers
+                    )
+
+                if response.status_code == 304 and cached:
+                    self.retry_policy.record_success(host)
+                    content = await self.run_blocking(
+                        self.response_cache.revalidated, cached, response.headers
+                    )
+                    return Response.create(
+                        url, cached.status, cached.headers, content, from_cache=True
+                    )
+
+                response.raise_for_status()
+
+                self.retry_policy.record_success(host)
+                if self.response_cache:
+                    await self.run_blocking(
+                        self.response_cache.store,
+                        method,
+                        url,
+                        data,
+                        response.status_code,
+                        response.headers,
+                        response.content,
+                        previous=cached,
+                    )
+
+                return Response.create(
+                    str(response.url),
+                    response.status_code,
+                    response.headers,
+                    response.content,
+                )
+            except httpx.HTTPStatusError as error:
+                print(error.response.status_code, error.response.reason_phrase)
+                status = error.response.status_code
+                error_kind = classify_status(status)
+                retry_after = parse_retry_after(
+                    error.response.headers.get("Retry-After")
+                )
+            except httpx.TimeoutException:
+                print("Request timed out")
+                error_kind = NETWORK_ERROR
+            except httpx.TransportError as error:
+                print(error)
+                error_kind = NETWORK_ERROR
+            finally:
+                self.rate_limiter.release(host, started, error_kind, status)
+
+            delay = self.retry_policy.next_delay(
+                host, attempt, error_kind, status, retry_after
+            )
+            if delay is None:
+                raise RequestFailedError(url, error_kind, status)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def download_file_async(
+        self,
+        url: str,
+        filename: str,
+        output_dir: str,
+        expected_sha256: str = None,
+    ):
+        """Streaming, resumable and atomic download. Same behaviour as `Requester.download_file`"""
+        file_path = download_path(filename, output_dir)
+
+        return await self.single_flight.do_async(
+            ("DOWNLOAD", normalize_url(url), str(file_path)),
+            self.fetch_file_async,
+            url,
+            file_path,
+            expected_sha256,
+        )
+
+    async def fetch_file_async(
+        self, url: str, file_path: Path, expected_sha256: str = None
+    ):
+        """Same as `Requester.fetch_file`"""
+        if file_path.exists():
+            return file_path
+
+        part = part_path(file_path)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            self.retry_policy.before_attempt(url, host)
+
+            status = None
+            retry_after = None
+            error_kind = None
+            started = await self.rate_limiter.acquire_async(host)
+            headers_at = None
+            try:
+                async with self.host_semaphore(url):
+                    async with self.client.stream(
+                        "GET", url, headers=resume_headers(part, self.headers)
+                    ) as response:
+                        headers_at = time.perf_counter()
+                        if response.status_code == 416:  # part is bigger than file
+                            part.unlink()
+                            raise DownloadVerificationError(
+                                f"{part.name}: range not satisfiable"
+                            )
+
+                        response.raise_for_status()
+
+                        f, hasher, expected_size = open_part(
+                            part, response.status_code, response.headers
+                        )
+                        with f:
+                            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                f.write(chunk)
+                                hasher.update(chunk)
+
+                finalize_part(part, file_path, hasher, expected_size, expected_sha256)
+
+                self.retry_policy.record_success(host)
+                return file_path
+            except httpx.HTTPStatusError as error:
+                print(error.response.status_code, error.response.reason_phrase)
+                status = error.response.status_code
+                error_kind = classify_status(status)
+                retry_after = parse_retry_after(
+                    error.response.headers.get("Retry-After")
+                )
+            except httpx.TimeoutException:
+                print("Request timed out")
+                error_kind = NETWORK_ERROR
+            except httpx.TransportError as error:
+                print(error)
+                error_kind = NETWORK_ERROR
+            except DownloadVerificationError as error:
+                print(error)
+                error_kind = VERIFICATION_ERROR
+            finally:
+                self.rate_limiter.release(host, started, error_kind, status, headers_at)
+
+            delay = self.retry_policy.next_delay(
+                host, attempt, error_kind, status, retry_after
+            )
+            if delay is None:
+                raise RequestFailedError(url, error_kind, status)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def gather(self, coroutines: list):
+        return await asyncio.gather(*coroutines)
+
+    def request(self, url, data=None, headers=None, method: str = "GET") -> Response:
+        return self.run(self.request_async(url, data, headers, method))
+
+    def make_request(self, url, data=None, headers=None, method: str = "GET") -> str:
+        return self.request(url, data, headers, method).text
+
+    def request_many(self, requests_kwargs: list[dict]) -> list[Response]:
+        """Make all requests concurrently. Each item holds `request` kwargs. Results keep the input order"""
+        return self.run(
+            self.gather([self.request_async(**kwargs) for kwargs in requests_kwargs])
+        )
+
+    def make_requests(self, requests_kwargs: list[dict]) -> list[str]:
+        """Same as `request_many`, returning response texts"""
+        return [response.text for response in self.request_many(requests_kwargs)]
+
+    def download_file(
+        self,
+        url: str,
+        filename: str,
+        output_dir: str,
+        expected_sha256: str = None,
+    ):
+        return self.run(
+            self.download_file_async(url, filename, output_dir, expected_sha256)
+        )
+
+    def download_files(self, files_kwargs: list[dict]):
+        """Download all files concurrently. Each item holds `download_file` kwargs"""
+        return self.run(
+            self.gather([self.download_file_async(**kwargs) for kwargs in files_kwargs])
+        )
+
+    def close(self):
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -1,35 +1,62 @@
-import pdfkit
-import json
 import time
 
 from bs4 import BeautifulSoup
-from requester import Requester
-from utils.selenium_helper import SeleniumHelper
+from requester import Requester, AsyncRequester
+from utils.selenium_helper import SeleniumHelper, BrowserPool
 from pathlib import Path
 
 from g_drive_service import *
 from utils.files_remover import FilesRemover
 from utils.files_uploader import FilesUploader
 from utils.checkpoint_saver import CheckpointSaver
+from utils.response_cache import ResponseCache
 from utils import format_filename
-
+from utils.metrics import metrics
+from utils.retry_policy import full_jitter_backoff
+from utils.pipeline import Pipeline, Stage, WorkItem
+from utils.crawl_frontier import CrawlFrontier, FETCHED, RENDERED, UPLOADED, SKIPPED
+from utils.failure_journal import FailureJournal
+from utils.pdf_renderer import PdfRenderer
+from utils.document_store import DocumentStore
+
+from multiprocessing import cpu_count
 from threading import Lock
+from functools import partial
+from typing import Iterable
 
 PARENT_FOLDER_ID = "1vRRmyecRE71qKmHlmSbW29G1cPDj3E2t"
-FAILED_LINKS_JSON_PATH = Path("failed_links.json")
 
+# workers per pipeline stage, discover always runs in a single thread
+PIPELINE_WORKERS = {"fetch": 16, "render": cpu_count(), "upload": 4, "cleanup": 1}
+# items waiting between two stages before the upstream stage blocks
+PIPELINE_QUEUE_SIZE = 100
+CLAIM_BATCH_SIZE = 100  # items claimed from the crawl frontier at once
+CLAIM_POLL_INTERVAL = 1  # seconds between claims while items of the run are in flight
+BROWSER_POOL_SIZE = 4  # browsers loading document pages concurrently
+# CDP request blocking profile of browsers printing documents to pdf
+PRINT_BLOCKING_PROFILE = "print-fidelity"
+
+# frontier state reached by an item after each pipeline stage
+STAGE_STATES = {"fetch": FETCHED, "render": RENDERED, "upload": UPLOADED}
 
-# decorator to retry function n times
-def retry(n: int = 3):
+
+# decorator to retry function n times, waiting an exponential backoff with jitter between attempts
+def retry(n: int = 3, backoff_base: float = 1, backoff_max: float = 30):
     def decorator(func):
         def wrapper(*args, **kwargs):
-            for _ in range(n):
+            for attempt in range(n):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
                     print(e)
-                    continue
+                    metrics.increment(f"retry.{func.__name__}.failed")
 
+                    if attempt + 1 < n:
+                        time.sleep(
+                            full_jitter_backoff(attempt, backoff_base, backoff_max)
+                        )
+
+            metrics.increment(f"retry.{func.__name__}.gave_up")
             return None
 
         return wrapper
@@ -37,9 +64,6 @@ def retry(n: int = 3):
     return decorator
 
 
-lock = Lock()
-
-
 class BaseScraper:
     """Base class for all scrapers"""
 
@@ -49,10 +73,21 @@ class BaseScraper:
         files_remover: FilesRemover,
         files_uploader: FilesUploader,
         use_selenium: bool = False,
+        async_requests: bool = False,
+        use_cache: bool = True,
+        pdf_renderer: PdfRenderer = None,
+        browser_pool: BrowserPool = None,
+        blocking_profile: str = "none",
         **kwargs,
     ):
         self.url = url
-        self.requester = Requester()
+        self.blocking_profile = blocking_profile  # of the main driver
+        response_cache = ResponseCache() if use_cache else None
+        self.requester = (
+            AsyncRequester(response_cache=response_cache)
+            if async_requests
+            else Requester(response_cache=response_cache)
+        )
         self.driver = None
         self.html = None
         self.soup = None
@@ -63,6 +98,18 @@ class BaseScraper:
         self.checkpoint_saver = CheckpointSaver(
             Path("checkpoints") / Path(f"{self.__class__.__name__}.json")
         )
+        self.frontier = CrawlFrontier(self.__class__.__name__)
+        self.failure_journal = FailureJournal()
+        # shared by every scraper, documents found by several of them are uploaded once
+        self.document_store = DocumentStore()
+        # started on first render, scrapers that only download pdfs never launch browsers
+        self.pdf_renderer = pdf_renderer
+        self.pdf_renderer_lock = Lock()
+        # document pages are loaded by pooled browsers, `self.driver` stays on the search page
+        self.browser_pool = browser_pool
+        self.browser_pool_lock = Lock()
+        # renderer and pool given by the caller are closed by the caller
+        self.shared_browsers = (pdf_renderer, browser_pool)
 
     def clone_driver(self):
         """Clone driver to use in other thread"""
@@ -72,7 +119,9 @@ class BaseScraper:
 
     def set_driver(self, options: dict = {}, **kwargs):
         if not self.driver:
-            self.driver = SeleniumHelper(options)
+            self.driver = SeleniumHelper(
+                options, blocking_profile=self.blocking_profile
+            )
         else:
             self.driver.set_options(options, **kwargs)
 
@@ -91,30 +140,74 @@ class BaseScraper:
 
         return self.soup
 
+    def get_pdf_renderer(self) -> PdfRenderer:
+        with self.pdf_renderer_lock:
+            if self.pdf_renderer is None:
+                self.pdf_renderer = PdfRenderer(workers=PIPELINE_WORKERS["render"])
+
+            return self.pdf_renderer
+
+    def get_browser_pool(self) -> BrowserPool:
+        with self.browser_pool_lock:
+            if self.browser_pool is None:
+                self.browser_pool = BrowserPool(
+                    size=BROWSER_POOL_SIZE,
+                    driver_factory=partial(
+                        SeleniumHelper, blocking_profile=PRINT_BLOCKING_PROFILE
+                    ),
+                )
+
+            return self.browser_pool
+
+    def close_browsers(self):
+        """Quit the renderer and browser pool started by this scraper, they are started again when needed"""
+        with self.pdf_renderer_lock:
+            if self.pdf_renderer not in (None, *self.shared_browsers):
+                self.pdf_renderer.close()
+                self.pdf_renderer = None
+
+        with self.browser_pool_lock:
+            if self.browser_pool not in (None, *self.shared_browsers):
+                self.browser_pool.close()
+                self.browser_pool = None
+
     @retry()
     def html_to_pdf(
         self, url: str = None, html_str: str = None, output_path: Path = None
     ):
-        """Convert html to pdf"""
+        """Convert html to pdf with the warm browsers of the pdf renderer"""
         if not url and not html_str:
             raise Exception("Either url or html_str must be provided")
 
-        # check if dirs in output_path exists or create them
-        if output_path:
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+        return self.get_pdf_renderer().render(output_path, html_str=html_str, url=url)
 
-        if url:
-            return pdfkit.from_url(
-                url, output_path, options={"enable-local-file-access": ""}
+    def upload_file(
+        self,
+        file_path: Path,
+        folder_name: str,
+        parent_folder_name: str = "",
+        store: bool = True,
+        text_hash: str = None,
+        **kwargs,
+    ) -> bool:
+        """Upload file to Google Drive. With `store`, the file is recorded in the document store first and not uploaded if the same document (bytes or text) was already stored by any scraper. Returns False if upload was skipped"""
+        sha256 = None
+        if store:
+            sha256, stored = self.document_store.put(
+                file_path,
+                self.__class__.__name__,
+                Path(file_path).name,
+                kwargs.get("mimetype", "application/pdf"),
+                text_hash,
+                folder_name,
             )
+            if stored:
+                print(f"{Path(file_path).name} already stored as {sha256[:12]}")
+                if kwargs.get("remove_local", True):
+                    Path(file_path).unlink(missing_ok=True)
 
-        return pdfkit.from_string(
-            html_str, output_path, options={"enable-local-file-access": ""}
-        )
+                return False
 
-    def upload_file(
-        self, file_path: Path, folder_name: str, parent_folder_name: str = "", **kwargs
-    ):
         file_info = {
             "file_path": file_path,
             "folder_name": folder_name,
@@ -123,28 +216,28 @@ class BaseScraper:
         }
         self.files_uploader.upload_file(**file_info)
         # self.files_uploader.add_file_to_queue(file_info)
+        if sha256 is not None:
+            self.document_store.mark_uploaded(sha256)
+
+        return True
 
     def format_filename(self, filename: str):
         return format_filename(filename)
 
     def change_to_new_tab(self, link: str):
+        handles = self.driver.get_driver().window_handles
+
         # open new tab with link
         self.driver.get_driver().execute_script(f"window.open('{link}');")
 
-        # wait for new tab to open
-        time.sleep(1)
-
-        # change to new tab
-
-        for handle in self.driver.get_driver().window_handles:
-            self.driver.get_driver().switch_to.window(handle)
-            if self.driver.get_driver().current_url == link:
-                break
+        # wait for new tab to open and change to it
+        handle = self.driver.wait_new_window(handles, replaces=1)
+        self.driver.get_driver().switch_to.window(handle)
 
         # wait for page to load
-        time.sleep(1)
-        
-        return self.driver.get_driver().current_window_handle
+        self.driver.wait_document_ready(timeout=30, replaces=1)
+
+        return handle
 
     def save_checkpoint(self, checkpoint: dict, filt: str):
         """Save checkpoint to file."""
@@ -154,21 +247,209 @@ class BaseScraper:
         """Load checkpoint from file."""
         return self.checkpoint_saver.load_checkpoint(filt)
 
-    def add_failed_link(self, url: str, filename: str):
-        """Add failed link to failed_links.json file. It will be a list of dicts with url and filename keys"""
-        # use lock
-        with lock:
-            if not FAILED_LINKS_JSON_PATH.exists():
-                with open(FAILED_LINKS_JSON_PATH, "w") as f:
-                    json.dump([], f, indent=4)
+    def add_failed_link(
+        self,
+        url: str,
+        filename: str,
+        error: Exception = None,
+        attempts: int = 1,
+        item: WorkItem = None,
+    ):
+        """Append failed link to the failure journal. `item` keeps the fields needed to replay it through the pipeline"""
+        fields = {}
+        if item is not None:
+            fields = {
+                "output_dir": item.output_dir,
+                "folder_name": item.folder_name,
+                "parent_folder_name": item.parent_folder_name,
+                "mimetype": item.mimetype,
+            }
+
+        self.failure_journal.record(
+            url, filename, self.__class__.__name__, error, attempts, **fields
+        )
+
+    def discover(self) -> Iterable[WorkItem]:
+        """Pipeline stage: yield the documents to scrape. Implemented by each scraper"""
+        raise NotImplementedError
+
+    def fetch(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: download the document to `item.output_path` or set `item.html` to be rendered. Implemented by each scraper"""
+        raise NotImplementedError
+
+    def render(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: convert fetched html to pdf"""
+        if item.html is None:
+            return item
+
+        output_path = item.output_path or Path(item.output_dir) / f"{item.filename}.pdf"
+        if not self.html_to_pdf(html_str=item.html, output_path=output_path):
+            raise Exception(f"Failed to convert {item.url}")
+
+        item.output_path = output_path
+        item.html = None
+
+        return item
+
+    def upload(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: upload document and its attachments to Google Drive. Documents already stored by any scraper are removed and dropped, local files of the others are kept for the cleanup stage"""
+        if not self.upload_file(
+            item.output_path,
+            item.folder_name,
+            parent_folder_name=item.parent_folder_name,
+            text_hash=item.metadata.get("text_sha256"),
+            remove_local=False,
+            mimetype=item.mimetype,
+        ):
+            # same document already uploaded, nothing left to do
+            self.cleanup(item)
+            return None
+
+        for attachment in item.attachments:
+            self.upload_file(**attachment, store=False, remove_local=False)
+
+        return item
+
+    def cleanup(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: remove uploaded document and attachments from disk"""
+        item.output_path.unlink(missing_ok=True)
+        for attachment in item.attachments:
+            attachment["file_path"].unlink(missing_ok=True)
+
+        return item
+
+    def pipeline_error(self, stage: str, item: WorkItem, error: Exception):
+        print(f"Failed to {stage} {item.filename} | Error: {error}")
+        if self.frontier.fail(item.url, error):
+            self.add_failed_link(
+                item.url, item.filename, error, self.frontier.max_attempts, item
+            )
+
+    def tracked_stage(self, name: str):
+        """Stage function that records in the frontier the state reached by each item"""
+        func = getattr(self, name)
+        state = STAGE_STATES.get(name)
+        if state is None:
+            return func
+
+        def run(item: WorkItem) -> WorkItem:
+            result = func(item)
+            self.frontier.mark(item.url, state if result is not None else SKIPPED)
+
+            return result
+
+        return run
+
+    def claimed_items(
+        self, discover: bool = True, discover_func=None
+    ) -> Iterable[WorkItem]:
+        """Items to process, claimed from the frontier until the run drains: failed items released for retry are claimed again in the same run. With `discover`, items found by `discover_func` (default `self.discover`) are added to the frontier as they are found. Without it, the process only helps with a crawl discovered by another process"""
+        started = time.time()
+        if discover:
+            batch = []
+            for item in (discover_func or self.discover)():
+                batch.append(item)
+                if len(batch) < CLAIM_BATCH_SIZE:
+                    continue
+
+                self.frontier.add(batch)
+                batch = []
+                yield from self.frontier.claim(CLAIM_BATCH_SIZE)
+
+            self.frontier.add(batch)
+
+        # pending items: the rest of this run, failed attempts released for retry and abandoned claims of previous runs
+        while True:
+            claimed = self.frontier.claim(CLAIM_BATCH_SIZE)
+            if claimed:
+                yield from claimed
+                continue
+
+            # items still in the stages may fail and be released for retry
+            if not self.frontier.in_flight(since=started):
+                break
+            time.sleep(CLAIM_POLL_INTERVAL)
+
+    def run_pipeline(
+        self,
+        workers: dict = None,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        discover: bool = True,
+        discover_func=None,
+    ) -> Pipeline:
+        """Run the scraper as a staged pipeline: discover -> fetch -> render -> upload -> cleanup. Progress of every item is kept in the crawl frontier, so a run resumes where the last one stopped and several processes can share a crawl. `workers` overrides the worker count of each stage, ex: {"fetch": 32}"""
+        workers = {**PIPELINE_WORKERS, **(workers or {})}
+
+        pipeline = Pipeline(
+            lambda: self.claimed_items(discover, discover_func),
+            [
+                Stage(name, self.tracked_stage(name), workers[name], queue_size)
+                for name in ("fetch", "render", "upload", "cleanup")
+            ],
+            on_error=self.pipeline_error,
+        )
+        try:
+            pipeline.run()
+            self.frontier.report()
+            if self.requester.response_cache is not None:
+                self.requester.response_cache.report()
+            if self.pdf_renderer is not None:
+                self.pdf_renderer.report()
+            self.document_store.report()
+        finally:
+            self.close_browsers()
+
+        return pipeline
+
+    def replay_item(self, failure: dict) -> WorkItem:
+        """Work item of a journal failure. Failures recorded outside the pipeline have no item fields, scrapers override this to fill their defaults"""
+        return WorkItem(
+            failure["url"],
+            failure["filename"],
+            failure["output_dir"],
+            failure["folder_name"],
+            parent_folder_name=failure.get("parent_folder_name", ""),
+            mimetype=failure.get("mimetype", "application/pdf"),
+        )
+
+    def replay_failed(
+        self, rounds: int = 3, backoff_base: float = 30, workers: dict = None
+    ) -> int:
+        """Re-process failed links of the journal concurrently through the pipeline. Links still failing are replayed again after an exponential backoff, up to `rounds` times. Returns amount of links still failing"""
+        scraper = self.__class__.__name__
+        for attempt in range(rounds):
+            items = []
+            for failure in self.failure_journal.pending(scraper):
+                if not failure["url"]:  # nothing to replay
+                    continue
+
+                try:
+                    items.append(self.replay_item(failure))
+                except KeyError as e:
+                    print(f"Can't replay {failure['filename']}: missing {e}")
+
+            if not items:
+                return 0
+
+            print(f"Replaying {len(items)} failed links. Round {attempt + 1}/{rounds}")
+            self.frontier.requeue(items)
+            self.run_pipeline(workers, discover=False)
+
+            resolved = [
+                item.url
+                for item in items
+                if self.frontier.state(item.url) in (UPLOADED, SKIPPED)
+            ]
+            self.failure_journal.resolve(resolved, scraper)
 
-            with open(FAILED_LINKS_JSON_PATH, "r") as f:
-                failed_links = json.load(f)
+            remaining = len(items) - len(resolved)
+            if not remaining:
+                return 0
 
-            failed_links.append({"url": url, "filename": filename})
+            if attempt + 1 < rounds:
+                time.sleep(full_jitter_backoff(attempt, backoff_base, backoff_base * 8))
 
-            with open(FAILED_LINKS_JSON_PATH, "w") as f:
-                json.dump(failed_links, f, indent=4)
+        return remaining
 
     def run(self):
         """Run the scraper"""
@@ -1,21 +1,172 @@
 import re
-import time
+import concurrent.futures
 from scraper import BaseScraper
+from requester import AsyncRequester
+from utils.pipeline import WorkItem
 from selenium.webdriver.common.by import By
 from tqdm import tqdm
 from pathlib import Path
 from unidecode import unidecode
+from lxml import etree, html
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
 
 CONAMA_URL = "http://conama.mma.gov.br/atos-normativos-sistema"
 # OUTPUT_DIR = r"C:\Users\felip\OneDrive\Email attachments\Documentos\SI - 8 SEM\TCC_SEMESTRAL\CODIGOS\WEBSCRAPING\data\conama\\"
 OUTPUT_DIR = r"conama"
+MAX_CONCURRENT_PAGES = 8  # listing pages requested at once
+
+# compiled once, evaluated on every listing page
+PAGINATION_ITEMS_XPATH = etree.XPath("//ul[contains(@class, 'pagination')]/li")
+PAGINATION_LINKS_XPATH = etree.XPath("//ul[contains(@class, 'pagination')]//a[@href]")
+ROWS_XPATH = etree.XPath("//table[@id='tabela-atos-normativos']//tr[td]")
 
 
 class ConamaScraper(BaseScraper):
     """Scraper for CONAMA (Conselho Nacional do Meio Ambiente) website. The website has a table with all the resolutions and a link to download the pdf file."""
 
-    def __init__(self, url: str = CONAMA_URL):
-        super().__init__(url, use_selenium=True)
+    def __init__(self, url: str = CONAMA_URL, **kwargs):
+        # browser is only started by `run_selenium`
+        super().__init__(url, **kwargs)
+
+    def total_pages(self, root) -> int:
+        """Last page number of the pagination"""
+        numbers = [
+            int(text)
+            for text in (
+                li.text_content().strip() for li in PAGINATION_ITEMS_XPATH(root)
+            )
+            if text.isdigit()
+        ]
+
+        return max(numbers, default=1)
+
+    def page_url_builder(self, root, page_url: str):
+        """Function of page number to listing page url, reproducing the pagination links: the query parameter that changes between two numbered links is a linear function of the page number. Raises if links are built by javascript"""
+        links = {}
+        for link in PAGINATION_LINKS_XPATH(root):
+            text = link.text_content().strip()
+            href = link.get("href").strip()
+            if text.isdigit() and not href.lower().startswith(("javascript:", "#")):
+                links[int(text)] = urljoin(page_url, href)
+
+        if len(links) < 2:
+            raise Exception("Pagination links are built by javascript")
+
+        first, second = sorted(links)[:2]
+        first_query = dict(parse_qsl(urlsplit(links[first]).query))
+        second_query = dict(parse_qsl(urlsplit(links[second]).query))
+
+        # (start, step) of each parameter that changes with the page, ex: page=2&limitstart=20
+        parameters = {}
+        for name, value in second_query.items():
+            first_value = first_query.get(name, "0")
+            if value != first_value and value.isdigit() and first_value.isdigit():
+                step = (int(value) - int(first_value)) // (second - first)
+                parameters[name] = (int(first_value) - (first - 1) * step, step)
+
+        if not parameters:
+            raise Exception("No pagination parameter found in links")
+
+        base = urlsplit(links[second])
+
+        def page_url(page: int) -> str:
+            query = {
+                **second_query,
+                **{
+                    name: str(start + (page - 1) * step)
+                    for name, (start, step) in parameters.items()
+                },
+            }
+            return urlunsplit(base._replace(query=urlencode(query)))
+
+        return page_url
+
+    def page_items(
+        self, root, page_url: str, output_dir: str = OUTPUT_DIR
+    ) -> list[WorkItem]:
+        """Work items of the resolutions of a listing page"""
+        items = []
+        for row in ROWS_XPATH(root):
+            cell = row.find("td")
+            link = cell.find(".//a[@href]")
+            name = cell.find(".//b")
+            if link is None or name is None or ".download" not in link.get("href"):
+                continue
+
+            # keep the names of files already uploaded by the browser crawler
+            items.append(
+                WorkItem(
+                    urljoin(page_url, link.get("href")),
+                    name.text_content(),
+                    output_dir,
+                    output_dir,
+                )
+            )
+
+        return items
+
+    def listing_pages(self, urls: list[str]) -> list[str]:
+        """Html of listing pages, requested concurrently"""
+        if isinstance(self.requester, AsyncRequester):
+            return self.requester.make_requests([{"url": url} for url in urls])
+
+        with concurrent.futures.ThreadPoolExecutor(MAX_CONCURRENT_PAGES) as executor:
+            return list(executor.map(self.requester.make_request, urls))
+
+    def discover(self):
+        """Pipeline stage: yield a work item for every resolution pdf of every listing page, pages are requested concurrently over HTTP"""
+        response = self.requester.request(self.url)
+        root = html.document_fromstring(response.content)
+        total_pages = self.total_pages(root)
+        page_url = self.page_url_builder(root, response.url)
+
+        seen = set()
+        roots = [root]
+        pages = list(range(2, total_pages + 1))
+        with tqdm(total=total_pages, desc=f"Número de páginas: {total_pages}") as bar:
+            while True:
+                for page_root in roots:
+                    for item in self.page_items(page_root, response.url):
+                        if item.url not in seen:
+                            seen.add(item.url)
+                            yield item
+                bar.update(len(roots))
+
+                if not pages:
+                    break
+
+                batch, pages = (
+                    pages[:MAX_CONCURRENT_PAGES],
+                    pages[MAX_CONCURRENT_PAGES:],
+                )
+                roots = [
+                    html.document_fromstring(page_html)
+                    for page_html in self.listing_pages(
+                        [page_url(page) for page in batch]
+                    )
+                ]
+
+    def fetch(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: download pdf file"""
+        item.output_path = self.requester.download_file(
+            item.url, f"{item.filename}.pdf", item.output_dir
+        )
+
+        return item
+
+    def run(self, output_dir: str = OUTPUT_DIR, workers: dict = None):
+        """Run the scraper over HTTP through the pipeline, listing pages are fetched concurrently and pdfs downloaded by the fetch workers. Falls back to the browser crawler if the pagination can't be reproduced"""
+        try:
+            root = html.document_fromstring(self.requester.request(self.url).content)
+            self.page_url_builder(root, self.url)
+        except Exception as e:
+            print(f"Can't crawl CONAMA over HTTP: {e}. Using browser")
+            return self.run_selenium(output_dir)
+
+        self.run_pipeline(workers)
+
+    def run_selenium(self, output_dir: str = OUTPUT_DIR):
+        """Run the scraper: Download all pdf files from the website"""
         self.set_driver(
             options={
                 "download.default_directory": OUTPUT_DIR,
@@ -24,11 +175,8 @@ class ConamaScraper(BaseScraper):
                 "plugins.always_open_pdf_externally": True,
             }
         )
-
-    def run(self, output_dir: str = OUTPUT_DIR):
-        """Run the scraper: Download all pdf files from the website"""
         self.driver.get(self.url)
-        time.sleep(1)
+        self.driver.wait_document_ready(replaces=1)
         self.html = self.driver.get_driver().page_source
         self.set_soup()
 
@@ -67,9 +215,9 @@ class ConamaScraper(BaseScraper):
                 next_page_link = "//*[@id='content-section']/div/div/div[2]/div/fieldset/div/div[1]/div[3]/div[2]/ul/li[9]/a"
                 self.driver.click(By.XPATH, next_page_link)  # type: ignore
 
-                # wait for the page to load
+                # wait for the next page requests to finish before reading it
+                self.driver.wait_network_idle(replaces=0.5)
                 self.set_soup(self.driver.get_driver().page_source)
-                time.sleep(0.5)
 
             except Exception as e:
                 print(f"Error while processing page {page}: {e}")
@@ -1,13 +1,16 @@
+import concurrent.futures
 from scraper import BaseScraper
 from tqdm import tqdm
 from pathlib import Path
 from bs4 import BeautifulSoup
+from utils.pipeline import WorkItem
 
 ICMBIO_URL_INST_NORMATIVAS = "https://www.gov.br/icmbio/pt-br/acesso-a-informacao/legislacao/instrucoes-normativas"
 ICMBIO_URL_PORTARIAS = (
     "https://www.gov.br/icmbio/pt-br/acesso-a-informacao/legislacao/portarias"
 )
 OUTPUT_DIR = r"icmbio"
+MAX_CONCURRENT_PAGES = 8  # portaria pages requested at once
 
 
 class ICMBIOScraper(BaseScraper):
@@ -94,6 +97,78 @@ class ICMBIOScraper(BaseScraper):
             except Exception as e:
                 print(f"Error downloading file: {e}")
 
+    def pdf_item(self, pdf_link: BeautifulSoup, filt_dir: str) -> WorkItem:
+        return WorkItem(
+            pdf_link["href"],
+            self.format_filename(pdf_link.text),
+            OUTPUT_DIR,
+            OUTPUT_DIR,
+            parent_folder_name=filt_dir,
+        )
+
+    def portaria_pdf_links(self, portaria_link: str) -> list[BeautifulSoup]:
+        soup = BeautifulSoup(self.requester.make_request(portaria_link), "lxml")
+
+        # some portaria links are in a table, others are in a div
+        table = soup.find("table")
+        if table:
+            return table.find_all("a", href=True)
+
+        return soup.find("div", id="parent-fieldname-text").find_all("a", href=True)
+
+    def discover(self):
+        """Pipeline stage: yield a work item for every Instrução Normativa and Portaria pdf. Portaria pages are requested concurrently and pdf links found in more than one page are yielded once, with the folder of the first page"""
+        seen = set()
+
+        def unseen(items):
+            for item in items:
+                if item.url not in seen:
+                    seen.add(item.url)
+                    yield item
+
+        soup = BeautifulSoup(
+            self.requester.make_request(ICMBIO_URL_INST_NORMATIVAS), "lxml"
+        )
+        yield from unseen(
+            self.pdf_item(link, "instrucoes_normativas")
+            for link in soup.find("table").find_all("a", href=True)
+        )
+
+        soup = BeautifulSoup(self.requester.make_request(ICMBIO_URL_PORTARIAS), "lxml")
+        portaria_links = [
+            card.find("a").get("href") for card in soup.find_all("div", class_="card")
+        ]
+
+        with concurrent.futures.ThreadPoolExecutor(MAX_CONCURRENT_PAGES) as executor:
+            futures = {
+                executor.submit(self.portaria_pdf_links, link): link
+                for link in portaria_links
+            }
+            for future in tqdm(
+                concurrent.futures.as_completed(futures), total=len(futures)
+            ):
+                try:
+                    pdf_links = future.result()
+                except Exception as e:
+                    print(f"Error getting portaria links of {futures[future]}: {e}")
+                    continue
+
+                yield from unseen(
+                    self.pdf_item(pdf_link, "portarias") for pdf_link in pdf_links
+                )
+
+    def fetch(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: download pdf file"""
+        item.output_path = self.requester.download_file(
+            item.url, f"{item.filename}.pdf", output_dir=item.output_dir
+        )
+
+        return item
+
+    def run_concurrent(self, workers: dict = None):
+        """Run the scraper through the pipeline: pages are requested concurrently and pdfs downloaded and uploaded by bounded worker pools, ex: workers={"fetch": 8, "upload": 4}"""
+        self.run_pipeline(workers)
+
     def run(self):
         """Run the scraper: Download all pdf files from the website"""
 
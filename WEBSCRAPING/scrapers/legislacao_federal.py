@@ -2,22 +2,63 @@ import time
 import base64
 import re
 import concurrent.futures
-from scraper import BaseScraper
+from scraper import BaseScraper, PARENT_FOLDER_ID
+from requester import Requester, AsyncRequester
+from utils.session_bootstrap import SessionBootstrap
+from utils.selenium_helper import SeleniumHelper, report_pages
+from utils.senado_resolver import SenadoResolver, NeedsBrowserError
+from utils.document_store import text_sha256
+from utils.pipeline import WorkItem
+from utils.card_extractor import CardRecord, extract_cards, extract_total_results
+from utils.crawl_frontier import UPLOADED
+from utils.metrics import metrics
+from utils.html_capture import (
+    RAW_TEXT_DIR,
+    CAPTURE_SUFFIX,
+    read_capture,
+    write_capture,
+)
 from tqdm import tqdm
 from pathlib import Path
 from unidecode import unidecode
-from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 from multiprocessing import cpu_count
-from datetime import datetime
-
+from datetime import datetime, date, timedelta
+from queue import Queue, Empty
+from urllib.parse import urlsplit
 
 LEGISLACAO_FEDERAL_URL = "https://legislacao.presidencia.gov.br/"
 SEARCH_URL = "https://legislacao.presidencia.gov.br/pesquisa/ajax/resultado_pesquisa_legislacao.php"
 RESULTS_PER_PAGE = 10  # amount of results that the website shows per page
-CONCURRENT_REQUESTS = 10  # amount of concurrent requests to be made
+MAX_CONCURRENT_REQUESTS = 64  # upper bound of concurrent requests, the actual amount is adapted by the requester rate limiter
 OUTPUT_DIR = r"legislacao_federal"
 
+# only laws that are still active
+CONTENT_FILTER = "NÃO CONSTA REVOGAÇÃO EXPRESSA|1;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO ALTERAÇÃO)|13;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO CORRELAÇÃO)|14;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO OBSERVAÇÃO)|15"
+
+LOADING_XPATH = (
+    "//div[contains(text(), 'Carregando...')]"  # shown while search results load
+)
+SEARCH_LOAD_TIMEOUT = 30  # seconds to wait for search results before reloading the page
+
+INCREMENTAL_CHECKPOINT = "incremental"  # checkpoint key prefix of incremental runs
+
+SHARD_START_DATE = date(1800, 1, 1)  # older than the oldest act of the website
+MAX_SHARD_RESULTS = 2000  # date windows with more results are split in two
+SESSION_RETRIES = 3  # new sessions harvested for a shard page before giving up
+
+# "pdf" renders html pages to pdf, "html" stores them compressed along with their text
+CAPTURE_MODES = ("pdf", "html")
+
+# search form fields set by checking a filter box
+FILTER_FIELDS = (
+    "tipo_macro_ato",
+    "tipo_ato",
+    "conteudo_tipo_macro_ato",
+    "conteudo_tipo_ato",
+)
+
 DATES = {
     "janeiro": "01",
     "fevereiro": "02",
@@ -35,20 +76,552 @@ DATES = {
 }
 
 
+def date_str(day: date) -> str:
+    """Date in the format of the search form. Ex: 29/06/2023"""
+    return day.strftime("%d/%m/%Y")
+
+
+def build_search_data(page: int = 0, **fields) -> dict:
+    """Form data sent to SEARCH_URL. `fields` override the defaults, ex: dat_inicio='01/01/2023'"""
+    situacao_ato = ",".join([x.split("|")[1] for x in CONTENT_FILTER.split(";")])
+
+    data = {
+        "pagina": page,
+        "posicao": page * RESULTS_PER_PAGE,
+        "termo": "",
+        "num_ato": "",
+        "ano_ato": "",
+        "dat_inicio": "",
+        "dat_termino": "",
+        "tipo_macro_ato": "",
+        "tipo_ato": "",
+        "situacao_ato": situacao_ato,
+        "presidente_exercicio": "",
+        "chefe_governo": "",
+        "dsc_referenda_ministerial": "",
+        "referenda_ministerial": "",
+        "origem": "",
+        "diario_extra": "",
+        "data_resenha": "",
+        "num_mes_resenha": "",
+        "num_ano_resenha": "",
+        "ordenacao": "maior_data",
+        "conteudo_tipo_macro_ato": "",
+        "conteudo_tipo_ato": "",
+        "conteudo_situacao_ato": CONTENT_FILTER,
+        "conteudo_presidente_exercicio": "",
+        "conteudo_chefe_governo": "",
+        "conteudo_referenda_ministerial": "",
+        "conteudo_origem": "",
+        "conteudo_diario_extra": "",
+    }
+    data.update(fields)
+
+    return data
+
+
 class LegislacaoFederalScraper(BaseScraper):
     """Scraper for Legislação Federal Brasileira website. The website has a form to search for laws and each result is represented by a div card, which contains a link to a html website containing the law specs."""
 
-    def __init__(self, url: str = LEGISLACAO_FEDERAL_URL, **kwargs):
-        super().__init__(url, use_selenium=True, **kwargs)
+    def __init__(
+        self,
+        url: str = LEGISLACAO_FEDERAL_URL,
+        use_selenium: bool = True,
+        capture: str = "pdf",
+        **kwargs,
+    ):
+        if capture not in CAPTURE_MODES:
+            raise Exception(f"Capture mode must be one of {CAPTURE_MODES}")
+
+        super().__init__(url, use_selenium=use_selenium, **kwargs)
+        self.capture = capture
         self.main_window_handle = ""
+        self.session_bootstrap = SessionBootstrap(
+            self.url,
+            self.__class__.__name__,
+            driver_factory=self.session_driver,
+            probe=self.probe_session,
+        )
+        self.senado_resolver = SenadoResolver(self.requester)
+
+    def session_driver(self) -> SeleniumHelper:
+        """New browser apart from the scraper browser, for session harvests and reading filter fields. Callers quit it"""
+        return SeleniumHelper(blocking_profile=self.blocking_profile)
+
+    def parse_total_results(self, html: str) -> int:
+        """Total results of a search response, None if the response has no results header (ex: session was rejected)"""
+        return extract_total_results(html)
+
+    def probe_session(self, requester) -> bool:
+        """Cheap check that requester session cookies are accepted by the search endpoint"""
+        try:
+            response_html_text = requester.make_request(
+                SEARCH_URL, data=build_search_data(), method="POST"
+            )
+        except Exception as e:
+            print(f"Session probe failed: {e}")
+            return False
+
+        return self.parse_total_results(response_html_text) is not None
+
+    def search_total_results(self, data: dict, requester: Requester = None) -> int:
+        """Total results of search `data`, harvesting a new session while the current one is rejected. Call `session_bootstrap.bootstrap` on requester first"""
+        requester = requester or self.requester
+        total_results = self.parse_total_results(
+            requester.make_request(SEARCH_URL, data=data, method="POST")
+        )
+
+        while total_results is None:
+            print("Failed to find total_results. Harvesting a new session")
+            self.session_bootstrap.bootstrap(requester, force=True)
+
+            total_results = self.parse_total_results(
+                requester.make_request(SEARCH_URL, data=data, method="POST")
+            )
+
+        return total_results
+
+    def pdf_viewer_link(self, link: str, filename: str) -> str:
+        """Direct pdf link of a 'pesquisa.in.gov.br' viewer link"""
+        jornal = link.split("jornal=")[1].split("&")[0]
+        pagina = link.split("pagina=")[1].split("&")[0]
+
+        # date will be in filename: Ex: 'Decreto_Legislativo_no_74_de_28_de_junho_de_2023.pdf'. Need to get d+1 string: 29/06/2023
+        date_str = self.format_date(filename)
+
+        return f"https://pesquisa.in.gov.br/imprensa/servlet/INPDFViewer?jornal={jornal}&pagina={pagina}&data={date_str}&captchafield=firstAccess"
+
+    def card_item(
+        self,
+        card: CardRecord,
+        output_dir: str = OUTPUT_DIR,
+        filter_dir: str = PARENT_FOLDER_ID,
+    ) -> WorkItem:
+        return WorkItem(
+            card.link,
+            self.format_filename(card.title),
+            output_dir,
+            output_dir,
+            parent_folder_name=filter_dir,
+        )
+
+    def replay_item(self, failure: dict) -> WorkItem:
+        return WorkItem(
+            failure["url"],
+            failure["filename"],
+            failure.get("output_dir", OUTPUT_DIR),
+            failure.get("folder_name", OUTPUT_DIR),
+            parent_folder_name=failure.get("parent_folder_name", PARENT_FOLDER_ID),
+            mimetype=failure.get("mimetype", "application/pdf"),
+        )
+
+    def discover(self):
+        """Pipeline stage: yield a work item for every card of every search results page"""
+        # reuse persisted session cookies, a browser is only launched if they expired
+        self.session_bootstrap.bootstrap(self.requester)
+
+        total_results = self.search_total_results(build_search_data())
+        total_pages = total_results // RESULTS_PER_PAGE
+        if total_results % RESULTS_PER_PAGE != 0:
+            total_pages += 1
+
+        for page in tqdm(range(total_pages)):
+            for card in self.search_page(build_search_data(page)):
+                if card.link:
+                    yield self.card_item(card)
+
+    def filter_fields(self, filt: str) -> dict:
+        """Search form fields selecting filter `filt`, read from the page after checking its box. Kept in the checkpoints, so the browser is only needed once per filter"""
+        key = f"filter_fields/{filt}"
+        fields = self.load_checkpoint(key)
+        if fields:
+            return fields
+
+        # own browser, the scraper may run without one
+        driver = self.session_driver()
+        try:
+            driver.get(self.url)
+            self.wait_for_page_load(driver)
+            self.set_filter(filt, driver)
+
+            fields = {}
+            for name in FILTER_FIELDS:
+                elements = driver.get_driver().find_elements(By.NAME, name)
+                if elements and elements[0].get_attribute("value"):
+                    fields[name] = elements[0].get_attribute("value")
+        finally:
+            driver.get_driver().quit()
+
+        if not fields:
+            raise Exception(f"Filter {filt} not found in search form")
+
+        self.save_checkpoint(fields, key)
+        return fields
+
+    def discover_incremental(self, filt: str = None):
+        """Pipeline stage: yield acts published since the last incremental run, newest first. Stops at the first act already uploaded unchanged, changed acts are queued again"""
+        key = f"{INCREMENTAL_CHECKPOINT}/{filt or 'all'}"
+        checkpoint = self.load_checkpoint(key) or {}
+        today = datetime.now().strftime("%d/%m/%Y")
+
+        # last run day is searched again, acts may have been published after the run
+        fields = {
+            "dat_inicio": checkpoint.get("last_run", ""),
+            "dat_termino": today,
+            "ordenacao": "maior_data",
+        }
+        if filt:
+            fields.update(self.filter_fields(filt))
+
+        self.session_bootstrap.bootstrap(self.requester)
+        total_results = self.search_total_results(build_search_data(**fields))
+        total_pages = total_results // RESULTS_PER_PAGE
+        if total_results % RESULTS_PER_PAGE != 0:
+            total_pages += 1
+
+        for page in range(total_pages):
+            for card in self.search_page(build_search_data(page, **fields)):
+                if not card.link:
+                    continue
+
+                item = self.card_item(card, filter_dir=filt or PARENT_FOLDER_ID)
+                item.metadata["fingerprint"] = card.fingerprint
+
+                known = self.frontier.known(item.url)
+                if known is None:
+                    metrics.increment("incremental.new")
+                    yield item
+                    continue
+
+                state, metadata = known
+                # acts found by full crawls have no fingerprint
+                if metadata.get("fingerprint") not in (None, card.fingerprint):
+                    # claimed back from the frontier by the pipeline
+                    metrics.increment("incremental.changed")
+                    self.frontier.requeue([item])
+                elif state == UPLOADED:
+                    # older acts were handled by previous runs
+                    print(f"Reached known act {item.filename}")
+                    self.save_checkpoint({"last_run": today}, key)
+                    return
+
+        self.save_checkpoint({"last_run": today}, key)
+
+    def plan_shards(self, filt: str = None) -> list[dict]:
+        """Split the search of `filt` (None for every act type) into date windows of at most MAX_SHARD_RESULTS results. The plan is kept in the checkpoints, so cursors of a crawl keep pointing to the same shards"""
+        key = f"shards/{filt or 'all'}"
+        shards = self.load_checkpoint(key)
+        if shards:
+            return shards
+
+        fields = self.filter_fields(filt) if filt else {}
+        self.session_bootstrap.bootstrap(self.requester)
+
+        shards = []
+        windows = [(SHARD_START_DATE, date.today())]
+        while windows:
+            start, end = windows.pop()
+            total_results = self.search_total_results(
+                build_search_data(
+                    dat_inicio=date_str(start), dat_termino=date_str(end), **fields
+                )
+            )
+            if total_results == 0:
+                continue
+
+            days = (end - start).days
+            if total_results > MAX_SHARD_RESULTS and days > 0:
+                middle = start + timedelta(days=days // 2)
+                windows += [(start, middle), (middle + timedelta(days=1), end)]
+                continue
 
-    def download_law(self, card: BeautifulSoup, output_dir: str):
-        ul = card.find("ul", class_="list-inline p-0 m-0")
-        link = ul.find_all("a")[1]["href"]  # second link is 'texto integral'
+            shards.append(
+                {
+                    "filter": filt,
+                    "dat_inicio": date_str(start),
+                    "dat_termino": date_str(end),
+                    "total_results": total_results,
+                }
+            )
+
+        print(f"Search of {filt or 'all acts'} split in {len(shards)} shards")
+        self.save_checkpoint(shards, key)
+        return shards
+
+    def shard_session(self, shard_index: int, slot: int) -> SessionBootstrap:
+        """Session of a shard worker slot, persisted apart from the main session so concurrent shards never share a server session"""
+        return SessionBootstrap(
+            self.url,
+            f"{self.__class__.__name__}_shard{shard_index}_{slot}",
+            driver_factory=self.session_driver,
+            probe=self.probe_session,
+        )
 
-        filename = unidecode(card.find("h4", class_="card-title").text.strip()).replace(
-            " ", "_"
+    def crawl_shard(self, shard: dict, items: Queue, sessions: Queue):
+        """Walk the search pages of a shard with a session of `sessions` no other running shard uses. Cards of each page are merged into the frontier before the shard cursor moves, so an interrupted shard resumes at the first unrecorded page"""
+        key = f"shard/{shard['filter'] or 'all'}/{shard['dat_inicio']}-{shard['dat_termino']}"
+        cursor = self.load_checkpoint(key) or {"page": 0, "done": False}
+        if cursor["done"]:
+            return
+
+        # own cookie jar, and own sticky proxy when a proxy pool is used
+        requester = Requester(
+            proxy_pool=self.requester.proxy_pool,
+            response_cache=self.requester.response_cache,
         )
+        session_bootstrap = sessions.get()
+        try:
+            session_bootstrap.bootstrap(requester)
+            self.crawl_shard_pages(
+                shard, key, cursor, requester, items, session_bootstrap
+            )
+        finally:
+            sessions.put(session_bootstrap)
+
+    def search_shard_page(
+        self, data: dict, requester: Requester, session_bootstrap: SessionBootstrap
+    ) -> str:
+        """Html of search page `data`. A response without results header means the session was rejected, the page is requested again with a new session so it is never skipped"""
+        response_html_text = requester.make_request(
+            SEARCH_URL, data=data, method="POST"
+        )
+
+        retries = 0
+        while self.parse_total_results(response_html_text) is None:
+            if retries == SESSION_RETRIES:
+                raise Exception(f"Session rejected on search page {data['pagina']}")
+
+            retries += 1
+            print("Session rejected by search page. Harvesting a new one")
+            session_bootstrap.bootstrap(requester, force=True)
+            response_html_text = requester.make_request(
+                SEARCH_URL, data=data, method="POST"
+            )
+
+        return response_html_text
+
+    def crawl_shard_pages(
+        self,
+        shard: dict,
+        key: str,
+        cursor: dict,
+        requester: Requester,
+        items: Queue,
+        session_bootstrap: SessionBootstrap,
+    ):
+        """Search pages of a shard from its cursor, with a requester holding the shard session. Pages rejected by the server are requested again before the cursor moves"""
+        # copy, the filter fields may be the stored checkpoint
+        fields = dict(self.filter_fields(shard["filter"])) if shard["filter"] else {}
+        fields.update(dat_inicio=shard["dat_inicio"], dat_termino=shard["dat_termino"])
+        filter_dir = shard["filter"] or PARENT_FOLDER_ID
+
+        total_pages = shard["total_results"] // RESULTS_PER_PAGE
+        if shard["total_results"] % RESULTS_PER_PAGE != 0:
+            total_pages += 1
+
+        for page in range(cursor["page"], total_pages):
+            response_html_text = self.search_shard_page(
+                build_search_data(page, **fields), requester, session_bootstrap
+            )
+            page_items = [
+                self.card_item(card, filter_dir=filter_dir)
+                for card in extract_cards(response_html_text)
+                if card.link
+            ]
+
+            self.frontier.add(page_items)
+            self.save_checkpoint({"page": page + 1, "done": False}, key)
+            for item in page_items:
+                items.put(item)
+
+        self.save_checkpoint({"page": total_pages, "done": True}, key)
+        metrics.increment("shards.done")
+
+    def discover_sharded(
+        self,
+        filters: list,
+        shard_workers: int = 8,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ):
+        """Pipeline stage: crawl (filter, date window) shards concurrently and yield their cards. With `shard_count` processes, each one crawls the shards of its `shard_index`"""
+        shards = [shard for filt in filters for shard in self.plan_shards(filt)]
+        shards = shards[shard_index::shard_count]
+
+        # bounded, shard workers wait while the pipeline is behind
+        items = Queue(maxsize=RESULTS_PER_PAGE * shard_workers * 4)
+        # one session per worker, reused by the shards it crawls one after the other
+        sessions = Queue()
+        for slot in range(shard_workers):
+            sessions.put(self.shard_session(shard_index, slot))
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=shard_workers
+        ) as shards_executor:
+            futures = {
+                shards_executor.submit(self.crawl_shard, shard, items, sessions): shard
+                for shard in shards
+            }
+
+            while True:
+                try:
+                    yield items.get(timeout=1)
+                except Empty:
+                    if all(future.done() for future in futures):
+                        # items put between the timeout and the check
+                        while not items.empty():
+                            yield items.get()
+                        break
+
+        for future, shard in futures.items():
+            if future.exception() is not None:
+                print(
+                    f"Failed shard {shard['filter']} {shard['dat_inicio']}-{shard['dat_termino']}: {future.exception()}"
+                )
+
+    def run_sharded(
+        self,
+        filters: list = [None],
+        shard_workers: int = 8,
+        workers: dict = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+    ):
+        """Full crawl split in (filter, date window) shards, crawled concurrently with one session per shard worker. Run the same call in `shard_count` processes, with a different `shard_index` each, to scale out"""
+        self.run_pipeline(
+            workers,
+            discover_func=lambda: self.discover_sharded(
+                filters, shard_workers, shard_index, shard_count
+            ),
+        )
+
+    def run_incremental(self, filters: list = [None], workers: dict = None):
+        """Process only acts published or changed since the last incremental run. `None` filter searches every act type"""
+        for filt in filters:
+            self.run_pipeline(
+                workers, discover_func=lambda: self.discover_incremental(filt)
+            )
+
+    def fetch(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: download pdf links, get html of the other links to be rendered"""
+        link = item.url
+        if "pesquisa.in.gov.br/" in link:  # already embedded pdf, don't need to convert
+            item.output_path = self.requester.download_file(
+                self.pdf_viewer_link(link, item.filename),
+                f"{item.filename}.pdf",
+                item.output_dir,
+            )
+
+        elif ".pdf" in link:
+            item.output_path = self.requester.download_file(
+                link, f"{item.filename}.pdf", item.output_dir
+            )
+
+        elif "legis.senado.leg.br" in link:
+            return self.fetch_senado(item)
+
+        else:
+            item.html = self.requester.make_request(link)
+
+        return item
+
+    def fetch_senado(self, item: WorkItem) -> WorkItem:
+        """legis.senado page is not the target html. Follow its 2 inner links over HTTP, falling back to a pooled browser when the links are built by javascript. None if there's no doc associated with the law"""
+        try:
+            document_link = self.senado_resolver.resolve(item.url)
+        except NeedsBrowserError as e:
+            print(f"{e}. Falling back to browser")
+            output_path = Path(item.output_dir) / f"{item.filename}.pdf"
+            with self.get_browser_pool().browser() as browser:
+                if not self.download_senado_selenium(browser, item.url, output_path):
+                    return None
+
+            item.output_path = output_path
+            return item
+
+        if document_link is None:
+            return None
+
+        if ".pdf" in document_link.lower():
+            item.output_path = self.requester.download_file(
+                document_link, f"{item.filename}.pdf", item.output_dir
+            )
+            return item
+
+        response = self.requester.request(document_link)
+        content_type = next(
+            (
+                value
+                for name, value in response.headers.items()
+                if name.lower() == "content-type"
+            ),
+            "",
+        )
+        if "application/pdf" not in content_type:
+            item.html = response.text
+            return item
+
+        # pdf served without extension
+        item.output_path = Path(item.output_dir) / f"{item.filename}.pdf"
+        item.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(item.output_path, "wb") as f:
+            f.write(response.content)
+
+        return item
+
+    def run_pipeline(self, *args, **kwargs):
+        pipeline = super().run_pipeline(*args, **kwargs)
+        self.senado_resolver.report()
+
+        return pipeline
+
+    def render(self, item: WorkItem) -> WorkItem:
+        """Pipeline stage: in "html" capture mode, store html pages compressed and extract their text to the raw text corpus instead of rendering them"""
+        if self.capture != "html" or item.html is None:
+            return super().render(item)
+
+        start = time.perf_counter()
+        capture_path, text_path = write_capture(
+            item.html, item.output_dir, item.filename
+        )
+        metrics.observe("capture", time.perf_counter() - start)
+        metrics.increment("capture.bytes", capture_path.stat().st_size)
+        metrics.increment("capture.text_bytes", text_path.stat().st_size)
+        # compressed html differs between captures of the same act, its text does not
+        item.metadata["text_sha256"] = text_sha256(text_path.read_text("utf-8"))
+
+        item.output_path = capture_path
+        item.mimetype = "application/gzip"
+        item.attachments.append(
+            {
+                "file_path": text_path,
+                "folder_name": item.folder_name,
+                "parent_folder_name": RAW_TEXT_DIR,
+                "mimetype": "text/plain",
+            }
+        )
+        item.html = None
+
+        return item
+
+    def capture_to_pdf(self, capture_path: Path, output_path: Path = None) -> Path:
+        """Render a stored html capture to pdf, for the documents whose pdf is actually needed"""
+        capture_path = Path(capture_path)
+        if output_path is None:
+            output_path = capture_path.with_name(
+                capture_path.name.removesuffix(CAPTURE_SUFFIX) + ".pdf"
+            )
+
+        if not self.html_to_pdf(
+            html_str=read_capture(capture_path), output_path=output_path
+        ):
+            raise Exception(f"Failed to convert {capture_path}")
+
+        return output_path
+
+    def download_law(self, card: CardRecord, output_dir: str):
+        link = card.link
+
+        filename = unidecode(card.title).replace(" ", "_")
 
         output_path = Path(output_dir) / f"{filename}.pdf"
 
@@ -83,7 +656,7 @@ class LegislacaoFederalScraper(BaseScraper):
 
     def download_laws_parallel(
         self,
-        cards: list[BeautifulSoup],
+        cards: list[CardRecord],
         output_dir: str,
         cards_executor: concurrent.futures.ThreadPoolExecutor,
     ):
@@ -95,132 +668,77 @@ class LegislacaoFederalScraper(BaseScraper):
         for future in futures:
             future.result()
 
-    def search_page(self, data: dict) -> list[BeautifulSoup]:
+    def search_page(self, data: dict) -> list[CardRecord]:
         # send request
         response_html_text = self.requester.make_request(
             SEARCH_URL, data=data, method="POST"
         )
 
-        # set soup
-        self.set_soup(response_html_text)
-
         # return all laws
-        return self.soup.find_all("div", class_="card p-2 pr-3 pl-3 w-100")
+        return extract_cards(response_html_text)
 
-    def parallel_run(self):
-        """Run the scraper: Use concurrentt.futures to download all html files from the website concurrently, filter laws by active only"""
-        # First request to URL using selenium to set cookies to requester
-        self.driver.get(self.url)
-        time.sleep(30)
-        self.html = self.driver.get_driver().page_source
-        self.set_soup()
-
-        # close driver
-        self.driver.close()
+    def search_pages(self, datas: list[dict]) -> list[list[CardRecord]]:
+        """Search many pages. With an `AsyncRequester` all pages are requested concurrently on its event loop"""
+        if not isinstance(self.requester, AsyncRequester):
+            return [self.search_page(data) for data in datas]
 
-        # set cookies to requester
-        cookies = self.driver.get_driver().get_cookies()
-        for cookie_obj in cookies:
-            cookie = self.requester.cookie_dict_to_cookie(cookie_obj)
-            self.requester.set_cookie(cookie)
-
-        # make first search request to get total number of pages
-        content_filter: str = "NÃO CONSTA REVOGAÇÃO EXPRESSA|1;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO ALTERAÇÃO)|13;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO CORRELAÇÃO)|14;NÃO CONSTA REVOGAÇÃO EXPRESSA (VER CAMPO OBSERVAÇÃO)|15"
-        situacao_ato = ",".join([x.split("|")[1] for x in content_filter.split(";")])
-
-        page = 0
-        offset = 0
-
-        # set data to be sent in request
-        data = {
-            "pagina": page,
-            "posicao": offset,
-            "termo": "",
-            "num_ato": "",
-            "ano_ato": "",
-            "dat_inicio": "",
-            "dat_termino": "",
-            "tipo_macro_ato": "",
-            "tipo_ato": "",
-            "situacao_ato": situacao_ato,
-            "presidente_exercicio": "",
-            "chefe_governo": "",
-            "dsc_referenda_ministerial": "",
-            "referenda_ministerial": "",
-            "origem": "",
-            "diario_extra": "",
-            "data_resenha": "",
-            "num_mes_resenha": "",
-            "num_ano_resenha": "",
-            "ordenacao": "maior_data",
-            "conteudo_tipo_macro_ato": "",
-            "conteudo_tipo_ato": "",
-            "conteudo_situacao_ato": content_filter,
-            "conteudo_presidente_exercicio": "",
-            "conteudo_chefe_governo": "",
-            "conteudo_referenda_ministerial": "",
-            "conteudo_origem": "",
-            "conteudo_diario_extra": "",
-        }
-
-        # send request
-        response_html_text = self.requester.make_request(
-            SEARCH_URL, data=data, method="POST"
+        responses_html_text = self.requester.make_requests(
+            [{"url": SEARCH_URL, "data": data, "method": "POST"} for data in datas]
         )
 
-        # set soup
-        self.set_soup(response_html_text)
+        return [extract_cards(html_text) for html_text in responses_html_text]
 
-        # calculate total number of pages
-        while True:
-            try:
-                total_results = self.soup.find("h4", class_="pb-2 fw-bold").text
-                break
-            except AttributeError:
-                print("Failed to find total_results. Trying again in 30 seconds")
-                self.driver.set_driver()
-                self.driver.get(self.url)
-                time.sleep(30)
-                self.html = self.driver.get_driver().page_source
-                self.set_soup()
-
-                # close driver
-                self.driver.close()
-
-                # set cookies to requester
-                cookies = self.driver.get_driver().get_cookies()
-                for cookie_obj in cookies:
-                    cookie = self.requester.cookie_dict_to_cookie(cookie_obj)
-                    self.requester.set_cookie(cookie)
-
-                # send request
-                response_html_text = self.requester.make_request(
-                    SEARCH_URL, data=data, method="POST"
-                )
+    def parallel_run(self):
+        """Run the scraper: Use concurrentt.futures to download all html files from the website concurrently, filter laws by active only"""
+        # reuse persisted session cookies, a browser is only launched if they expired
+        self.session_bootstrap.bootstrap(self.requester)
 
-                # set soup
-                self.set_soup(response_html_text)
+        # make first search request to get total number of pages
+        total_results = self.search_total_results(build_search_data())
 
-        total_results = int(total_results.split(" ")[0].replace(".", ""))
         total_pages = total_results // RESULTS_PER_PAGE
         if total_results % RESULTS_PER_PAGE != 0:
             total_pages += 1
 
         total_finished = 0
 
-        # iterate over pages by CONCURRENT_REQUESTS amount of pages
-        with concurrent.futures.ThreadPoolExecutor() as pages_executor:
-            cards_executor = concurrent.futures.ThreadPoolExecutor()
+        # iterate over pages, as many at once as the search host currently tolerates
+        search_host = urlsplit(SEARCH_URL).netloc
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_REQUESTS
+        ) as pages_executor:
+            cards_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_REQUESTS
+            )
 
             while total_finished < total_pages:
+                concurrent_requests = self.requester.rate_limiter.concurrency_limit(
+                    search_host
+                )
+
+                pages = range(
+                    total_finished,
+                    min(total_finished + concurrent_requests, total_pages),
+                )
+
+                if isinstance(self.requester, AsyncRequester):
+                    # one submit for the whole batch, pages are requested concurrently by the event loop
+                    batch = [build_search_data(page) for page in pages]
+                    results = self.search_pages(batch)
+                    total_finished += concurrent_requests
+
+                    for cards in tqdm(results, total=len(results)):
+                        self.download_laws_parallel(cards, OUTPUT_DIR, cards_executor)
+
+                    print(f"Total finished: {total_finished}")
+                    continue
+
                 responses = [
-                    pages_executor.submit(self.search_page, data)
-                    for page in range(
-                        total_finished, total_finished + CONCURRENT_REQUESTS
-                    )
+                    pages_executor.submit(self.search_page, build_search_data(page))
+                    for page in pages
                 ]
 
-                total_finished += CONCURRENT_REQUESTS
+                total_finished += concurrent_requests
 
                 # iterate over responses
                 for response in tqdm(
@@ -235,23 +753,25 @@ class LegislacaoFederalScraper(BaseScraper):
 
         cards_executor.shutdown(wait=True)
 
-    def set_filter(self, filter: str):
-        filter_button = self.driver.get_driver().find_element(By.ID, "btn-tipo-ato")
+    def set_filter(self, filter: str, driver: SeleniumHelper = None):
+        """Check filter box in the search form of `driver`, the scraper browser by default"""
+        driver = driver or self.driver
+        filter_button = driver.get_driver().find_element(By.ID, "btn-tipo-ato")
         # if button is not expanded, click it
         if filter_button.get_attribute("aria-expanded") == "false":
             filter_button.click()
 
-        time.sleep(2)
+        driver.wait_element_to_be_visible(By.CLASS_NAME, "form-check-sign", replaces=2)
 
         # set filter
-        dropdown = self.driver.get_driver().find_element(By.CLASS_NAME, "dropdown-menu")
+        dropdown = driver.get_driver().find_element(By.CLASS_NAME, "dropdown-menu")
         filters_checkboxes = dropdown.find_elements(By.CLASS_NAME, "form-check-sign")
         for checkbox in filters_checkboxes:
             if filter.lower() in checkbox.text.lower():
                 checkbox.click()
                 break
 
-        time.sleep(2)
+        self.wait_search_results(replaces=2, driver=driver)
 
     def format_date(self, filename: str) -> str:
         """Format date from 'de_dd_de_MONTH_de_yyyy' to d+1 string. Ex: 'de_28_de_junho_de_2023' to  29/06/2023'"""
@@ -272,15 +792,18 @@ class LegislacaoFederalScraper(BaseScraper):
 
         return f"{day}/{month}/{year}"
 
-    def download_pdf_selenium(self, link: str, output_path: Path):
-        pdf = self.driver.get_driver().execute_cdp_cmd(
+    def download_pdf_selenium(
+        self, link: str, output_path: Path, browser: SeleniumHelper = None
+    ):
+        """Print page loaded in `browser` (default: main driver) to `output_path`. Raises if the page can't be printed, so no caller reports a file that was not written"""
+        browser = browser or self.driver
+        pdf = browser.get_driver().execute_cdp_cmd(
             "Page.printToPDF", {"printBackground": True}
         )
 
         converted_ok = pdf.get("data")
         if not converted_ok:
-            print(f"Failed to convert {link}")
-            return None
+            raise Exception(f"Failed to convert {link}")
 
         if not output_path.parent.exists():
             output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -288,36 +811,70 @@ class LegislacaoFederalScraper(BaseScraper):
         with open(output_path, "wb") as f:
             f.write(base64.b64decode(pdf["data"]))
 
-    def check_whitelabel_error(self):
-        body = self.driver.get_driver().find_element(By.TAG_NAME, "body")
+    def check_whitelabel_error(self, browser: SeleniumHelper = None):
+        browser = browser or self.driver
+        body = browser.get_driver().find_element(By.TAG_NAME, "body")
         if "Whitelabel Error Page" in body.text or "Sistema Inexistente" in body.text:
             return True
 
         return False
 
-    def check_law_not_found(self):
+    def check_law_not_found(self, browser: SeleniumHelper = None):
         # check if 'não foram encontra' is in page. If so, close tab and return because there's no doc associated with this law
-        return self.driver.check_if_element_exists(  # type: ignore
+        browser = browser or self.driver
+        return browser.check_if_element_exists(  # type: ignore
             By.XPATH, "//div[contains(text(), 'Não foram encontr')]"
         )
 
-    def close_secondary_tabs(self):  # close tabs and change to main window handle tab
-        for window in self.driver.get_driver().window_handles:
-            if window != self.main_window_handle:
-                self.driver.get_driver().switch_to.window(window)
-                self.driver.get_driver().close()
+    def download_senado_selenium(
+        self, browser: SeleniumHelper, link: str, output_path: Path
+    ) -> bool:
+        """legis.senado page is not the target html, need to follow 2 inner links. False if there's no doc associated with the law, True once the pdf is written"""
+        browser.get(link)
+        if self.check_whitelabel_error(browser) or self.check_law_not_found(browser):
+            return False
 
-    def download_law_selenium(
-        self, card: BeautifulSoup, output_dir: str, filter_dir: str
-    ):
+        table = browser.get_driver().find_element(By.CLASS_NAME, "table")
+        table.find_element(By.CLASS_NAME, "linknorma").click()
+
+        # wait for the norm page to replace the search page
+        browser.wait_element_stale(table, replaces=1)
+        browser.wait_element_present(By.CLASS_NAME, "table")
+        browser.page_loads += 1
+
+        # follow inner link and get pdf
+        inner_table = browser.get_driver().find_element(By.CLASS_NAME, "table")
+        inner_link = inner_table.find_elements(By.TAG_NAME, "a")
+
+        if not inner_link:
+            print(f"No document link in norm page of {link}")
+            return False
+
+        inner_link = inner_link[0].get_attribute("href")
+        browser.get(inner_link)
+
+        self.download_pdf_selenium(inner_link, output_path, browser)
+
+        return True
+
+    def download_html_selenium(
+        self, browser: SeleniumHelper, link: str, output_path: Path
+    ) -> bool:
+        """Print planalto html page to pdf. False if there's no doc associated with the law"""
+        browser.get(link)
+        if self.check_whitelabel_error(browser) or self.check_law_not_found(browser):
+            return False
+
+        self.download_pdf_selenium(link, output_path, browser)
+
+        return True
+
+    def download_law_selenium(self, card: CardRecord, output_dir: str, filter_dir: str):
+        """Download law of `card`. Pages that need a browser are loaded in a browser leased from the browser pool, so many cards are processed concurrently"""
         try:
-            ul = card.find("ul", class_="list-inline p-0 m-0")
-            a_element = ul.find_all("a")[1]  # second link is 'texto integral'
-            link = a_element["href"]
+            link = card.links[1]  # second link is 'texto integral'
 
-            filename = self.format_filename(
-                card.find("h4", class_="card-title").text.strip()
-            )
+            filename = self.format_filename(card.title)
             output_path = Path(output_dir) / f"{filename}.pdf"
 
             # check if `output_path` already exists and skip file download
@@ -335,13 +892,7 @@ class LegislacaoFederalScraper(BaseScraper):
             if (
                 "pesquisa.in.gov.br/" in link
             ):  # already embedded pdf, don't need to convert
-                jornal = link.split("jornal=")[1].split("&")[0]
-                pagina = link.split("pagina=")[1].split("&")[0]
-
-                # date will be in filename: Ex: 'Decreto_Legislativo_no_74_de_28_de_junho_de_2023.pdf'. Need to get d+1 string: 29/06/2023
-                date_str = self.format_date(filename)
-
-                real_link = f"https://pesquisa.in.gov.br/imprensa/servlet/INPDFViewer?jornal={jornal}&pagina={pagina}&data={date_str}&captchafield=firstAccess"
+                real_link = self.pdf_viewer_link(link, filename)
 
                 self.requester.download_file(real_link, f"{filename}.pdf", output_dir)
 
@@ -350,62 +901,22 @@ class LegislacaoFederalScraper(BaseScraper):
                 print(f"File already pdf: {filename}.pdf")
                 self.requester.download_file(link, f"{filename}.pdf", output_dir)
 
-            elif (
-                "legis.senado.leg.br" in link
-            ):  # page is not the target html, need to click 2 inner links
-                w_handle = self.change_to_new_tab(link)
-
-                if self.check_whitelabel_error() or self.check_law_not_found():
-                    # close tab and  change to first tab
-                    self.driver.get_driver().close()
-                    self.driver.get_driver().switch_to.window(self.main_window_handle)
-
-                    return card
-
-                table = self.driver.get_driver().find_element(By.CLASS_NAME, "table")
-                table.find_element(By.CLASS_NAME, "linknorma").click()
-
-                # wait for page to load
-                time.sleep(1)
-
-                # change to inner link and get pdf
-                inner_table = self.driver.get_driver().find_element(
-                    By.CLASS_NAME, "table"
+            elif "legis.senado.leg.br" in link:
+                item = self.fetch_senado(
+                    WorkItem(link, filename, output_dir, output_dir)
                 )
-                inner_link = inner_table.find_elements(By.TAG_NAME, "a")
-
-                if len(inner_link) > 0:
-                    inner_link = inner_link[0].get_attribute("href")
-                    self.change_to_new_tab(inner_link)
-
-                    # wait for page to load
-                    time.sleep(1)
-
-                    self.download_pdf_selenium(inner_link, output_path)
-
-                # close tabs and change to main window handle tab
-                self.close_secondary_tabs()
+                if item is None:
+                    return card
 
-                self.driver.get_driver().switch_to.window(self.main_window_handle)
-                self.set_soup(self.driver.get_driver().page_source)
+                if item.html is not None and not self.html_to_pdf(
+                    html_str=item.html, output_path=output_path
+                ):
+                    raise Exception(f"Failed to convert {link}")
 
             else:
-                self.change_to_new_tab(link)
-
-                if self.check_whitelabel_error() or self.check_law_not_found():
-                    # close tab and  change to first tab
-                    self.driver.get_driver().close()
-                    self.driver.get_driver().switch_to.window(self.main_window_handle)
-
-                    return None
-
-                self.download_pdf_selenium(link, output_path)
-
-                # close tab and  change to first tab
-                self.close_secondary_tabs()
-
-                self.driver.get_driver().switch_to.window(self.main_window_handle)
-                self.set_soup(self.driver.get_driver().page_source)
+                with self.get_browser_pool().browser() as browser:
+                    if not self.download_html_selenium(browser, link, output_path):
+                        return None
 
             # upload to google drive.
             self.upload_file(
@@ -418,52 +929,52 @@ class LegislacaoFederalScraper(BaseScraper):
             return card
         except Exception as e:
             # add card to failed links, card may not have link, that's why the exception is caught here
-            link = card.find("ul", class_="list-inline p-0 m-0").find_all("a")
-            if len(link) > 1:
-                link = link[1]["href"]
-            else:
-                link = ""
-
-            filename = self.format_filename(
-                card.find("h4", class_="card-title").text.strip()
-            )
-            self.add_failed_link(link, filename)
+            filename = self.format_filename(card.title)
+            self.add_failed_link(card.link, filename, e)
 
             print(f"Failed to download {filename} | Error: {e}")
             return None
 
     def download_laws_selenium(
-        self, cards: list[BeautifulSoup], output_dir: str, filter_dir: str
+        self, cards: list[CardRecord], output_dir: str, filter_dir: str
     ):
-        results = []
-        for card in cards:
-            results.append(self.download_law_selenium(card, output_dir, filter_dir))
-
-        return results
+        """Download cards of a results page concurrently, one worker per pooled browser. Results keep the order of `cards`"""
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.get_browser_pool().size
+        ) as executor:
+            return list(
+                executor.map(
+                    lambda card: self.download_law_selenium(
+                        card, output_dir, filter_dir
+                    ),
+                    cards,
+                )
+            )
 
-    def wait_for_page_load(self):
+    def wait_for_page_load(self, driver: SeleniumHelper = None):
+        driver = driver or self.driver
         # while body has no other tags than canvas and style, reload page
         body = None
         while not body or len(body.contents) <= 2:
             try:
                 # wait for  p tag to be visible
-                self.driver.wait_element_to_be_visible(
+                driver.wait_element_to_be_visible(
                     By.XPATH,
                     "//p[contains(text(), 'ENCONTRE AQUI A CONSTITUIÇÃO BRASILEIRA')]",
                     timeout=15,
                 )
 
-                self.set_soup(self.driver.get_driver().page_source)
+                self.set_soup(driver.get_driver().page_source)
 
                 body = self.soup.find("body")
 
                 if not body:
-                    self.driver.get_driver().refresh()
+                    driver.get_driver().refresh()
 
             except Exception as e:
                 print(e)
 
-                self.driver.get_driver().refresh()
+                driver.get_driver().refresh()
                 continue
 
     def resume_from_date(self, checkpoint: dict):
@@ -472,7 +983,7 @@ class LegislacaoFederalScraper(BaseScraper):
         )
         advanced_search_button.click()
 
-        time.sleep(2)
+        self.driver.wait_element_to_be_visible(By.ID, "dat_inicio", replaces=2)
 
         start_date = checkpoint.get("start_date")
         end_date = checkpoint.get("end_date")
@@ -484,16 +995,17 @@ class LegislacaoFederalScraper(BaseScraper):
         end_date_input = self.driver.get_driver().find_element(By.ID, "dat_termino")
         self.driver.type_text(end_date_input, end_date)
 
-        time.sleep(2)
         self.driver.get_driver().execute_script("pesquisaLegislacao('0');")
 
-        time.sleep(2)
+        self.wait_search_results(replaces=4)
 
     def set_ordering(self, ordering: str = "Menor data de publicação"):
         dropdown = self.driver.get_driver().find_element(By.ID, "dropdownOrdenacao")
         dropdown.click()
 
-        time.sleep(2)
+        self.driver.wait_element_to_be_visible(
+            By.XPATH, "//a[contains(@onclick, 'selecionaOrdenacao')]", replaces=2
+        )
 
         dropdown_menu = self.driver.get_driver().find_element(
             By.CLASS_NAME, "dropdown-menu"
@@ -507,7 +1019,26 @@ class LegislacaoFederalScraper(BaseScraper):
                 item.click()
                 break
 
-        time.sleep(2)
+        self.wait_search_results(replaces=2)
+
+    def wait_search_results(
+        self,
+        timeout: float = SEARCH_LOAD_TIMEOUT,
+        replaces: float = 0,
+        driver: SeleniumHelper = None,
+    ):
+        """Wait for the search results of `driver`, the scraper browser by default, to finish loading after a form action"""
+        driver = driver or self.driver
+        start = time.perf_counter()
+        driver.wait_element_absent(By.XPATH, LOADING_XPATH, timeout)
+        driver.wait_network_idle(
+            timeout=max(timeout - (time.perf_counter() - start), 1)
+        )
+        # only waits that replaced a fixed sleep save time
+        if replaces:
+            metrics.increment(
+                "wait.saved_seconds", replaces - (time.perf_counter() - start)
+            )
 
     def run_scraper(
         self,
@@ -529,17 +1060,13 @@ class LegislacaoFederalScraper(BaseScraper):
         for filt in filters:
             self.set_filter(filt)
             self.set_ordering()
-            self.set_soup(self.driver.get_driver().page_source)
 
             checkpoint = self.load_checkpoint(filt)
             if checkpoint:
                 self.resume_from_date(checkpoint)
 
-            self.set_soup(self.driver.get_driver().page_source)
-
             # calculate total number of pages
-            total_results = self.soup.find("h4", class_="pb-2 fw-bold").text
-            total_results = int(total_results.split(" ")[0].replace(".", ""))
+            total_results = extract_total_results(self.driver.get_driver().page_source)
             total_pages = total_results // RESULTS_PER_PAGE
 
             if total_results > 1 and total_results % RESULTS_PER_PAGE != 0:
@@ -547,60 +1074,46 @@ class LegislacaoFederalScraper(BaseScraper):
 
             # iterate over pages
             for page in tqdm(range(total_pages)):
-                cards = self.soup.find_all("div", class_="card p-2 pr-3 pl-3 w-100")
+                cards = extract_cards(self.driver.get_driver().page_source)
 
                 # download laws
                 finished_futures = self.download_laws_selenium(
                     cards, OUTPUT_DIR, filter_dir=filt
                 )
 
-                time.sleep(1)
-
-                self.set_soup(self.driver.get_driver().page_source)
-
+                self.driver.wait_element_to_be_clickable(
+                    By.XPATH, "//i[contains(@class, 'ti-angle-right')]", replaces=1
+                )
                 next_page_button = self.driver.get_driver().find_element(
                     By.XPATH, "//i[contains(@class, 'ti-angle-right')]"
                 )
                 next_page_button.click()
 
                 # wait until 'Carregando' vanishes
-                retries = 10
-                while retries > 0:
-                    try:
-                        self.driver.get_driver().find_element(
-                            By.XPATH, "//div[contains(text(), 'Carregando...')]"
-                        )
-                        time.sleep(3)
-
-                        retries -= 1
-
-                    except:
-                        self.set_soup(self.driver.get_driver().page_source)
-                        break
+                try:
+                    self.wait_search_results()
+                    loaded = True
+                except TimeoutException:
+                    loaded = False
 
-                if retries == 0:
+                if not loaded:
                     print("Failed to load page. Trying again")
                     self.wait_for_page_load()
 
                     # set filter again
                     self.set_filter(filt)
                     self.set_ordering()
-                    self.set_soup(self.driver.get_driver().page_source)
 
                     # refresh will come back to first page. Need to go to `page` again
                     checkpoint = self.load_checkpoint(filt)
                     if checkpoint:
                         self.resume_from_date(checkpoint)
 
-                    self.set_soup(self.driver.get_driver().page_source)
-
                 # save checkpoint each page. Get last future's card info that have finished without errors
                 result_cards = list(filter(lambda x: x is not None, finished_futures))
                 if len(result_cards) > 0:
                     last_card = result_cards[-1]
-                    filename = self.format_filename(
-                        last_card.find("h4", class_="card-title").text.strip()
-                    )
+                    filename = self.format_filename(last_card.title)
 
                     date_str = self.format_date(filename)
 
@@ -614,6 +1127,10 @@ class LegislacaoFederalScraper(BaseScraper):
                     self.save_checkpoint(checkpoint, filt)
 
         self.driver.close()
+        metrics.report("wait")
+        report_pages()
+        self.senado_resolver.report()
+        self.close_browsers()
 
     def run(
         self,
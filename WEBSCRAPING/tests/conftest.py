@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# modules import each other from the WEBSCRAPING folder, ex: `from utils.metrics import metrics`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
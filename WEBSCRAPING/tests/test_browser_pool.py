@@ -0,0 +1,108 @@
+import pytest
+from utils.selenium_helper import BrowserPool
+
+
+class FakeBrowser:
+    """Stand-in for `SeleniumHelper`, fails to start while `FakeBrowser.fail` is set"""
+
+    fail = False
+    started = 0
+
+    def __init__(self):
+        if FakeBrowser.fail:
+            raise Exception("Chrome failed to start")
+
+        FakeBrowser.started += 1
+        self.page_loads = 0
+        self.alive = True
+        self.quit_called = False
+
+    def get_driver(self):
+        return self
+
+    def execute_cdp_cmd(self, command, params):
+        return {"metrics": []}
+
+    def is_alive(self):
+        return self.alive
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_browser():
+    FakeBrowser.fail = False
+    FakeBrowser.started = 0
+
+
+def slots(pool: BrowserPool) -> int:
+    return pool.idle.qsize()
+
+
+def test_failed_starts_keep_their_slot():
+    FakeBrowser.fail = True
+    pool = BrowserPool(size=2, driver_factory=FakeBrowser)
+
+    for _ in range(3):
+        with pytest.raises(Exception):
+            pool.lease(timeout=0.1)
+
+    assert slots(pool) == 2
+
+    # browsers of empty slots are started on the next lease
+    FakeBrowser.fail = False
+    browsers = [pool.lease(timeout=0.1), pool.lease(timeout=0.1)]
+    assert all(isinstance(browser, FakeBrowser) for browser in browsers)
+
+
+def test_failed_recycle_keeps_the_slot():
+    pool = BrowserPool(size=1, max_pages=1, driver_factory=FakeBrowser)
+    browser = pool.lease(timeout=0.1)
+
+    FakeBrowser.fail = True
+    pool.release(browser, pages=1)
+
+    assert browser.quit_called
+    assert slots(pool) == 1
+    # the quit browser is never leased again
+    assert list(pool.idle.queue) == [None]
+
+    FakeBrowser.fail = False
+    new_browser = pool.lease(timeout=0.1)
+    assert new_browser is not browser
+
+
+def test_dead_browser_is_replaced():
+    pool = BrowserPool(size=1, driver_factory=FakeBrowser)
+    browser = pool.lease(timeout=0.1)
+    browser.alive = False
+    pool.release(browser, pages=0)
+
+    FakeBrowser.fail = True
+    with pytest.raises(Exception):
+        pool.lease(timeout=0.1)
+    assert browser.quit_called
+    assert slots(pool) == 1
+
+    FakeBrowser.fail = False
+    assert pool.lease(timeout=0.1).alive
+
+
+def test_browser_that_raised_is_recycled():
+    pool = BrowserPool(size=1, driver_factory=FakeBrowser)
+    with pytest.raises(ValueError):
+        with pool.browser(timeout=0.1) as browser:
+            raise ValueError("page failed")
+
+    assert browser.quit_called
+    assert slots(pool) == 1
+    assert pool.lease(timeout=0.1) is not browser
+
+
+def test_lease_times_out_when_all_browsers_are_leased():
+    pool = BrowserPool(size=1, driver_factory=FakeBrowser)
+    pool.lease(timeout=0.1)
+
+    with pytest.raises(Exception, match="No browser released"):
+        pool.lease(timeout=0.1)
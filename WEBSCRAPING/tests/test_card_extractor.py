@@ -0,0 +1,97 @@
+from bs4 import BeautifulSoup
+from utils.card_extractor import (
+    CARD_CLASS,
+    extract_cards,
+    extract_total_results,
+    results_fragment,
+)
+
+CARD = """
+<div class="card p-2 pr-3 pl-3 w-100">
+    <div class="card-body">
+        <h4 class="card-title"> Lei nº {number}, de 28 de junho de 2023 </h4>
+        <p class="card-text">Dispõe sobre o programa {number}.</p>
+        <ul class="list-inline p-0 m-0">
+            <li class="list-inline-item"><a href="https://legislacao.presidencia.gov.br/atos/?numero={number}">Detalhes</a></li>
+            <li class="list-inline-item"><a href="http://www.planalto.gov.br/ccivil_03/leis/L{number}.htm">Texto integral</a></li>
+        </ul>
+    </div>
+</div>
+"""
+
+PAGE = """
+<html><body>
+<nav><a href="/">Início</a></nav>
+<h4 class="pb-2 fw-bold">1.234 resultados encontrados</h4>
+<div class="results">{cards}</div>
+</body></html>
+"""
+
+
+def results_page(numbers) -> str:
+    return PAGE.format(cards="".join(CARD.format(number=number) for number in numbers))
+
+
+def test_extract_cards():
+    cards = extract_cards(results_page([1, 2]))
+
+    assert [card.title for card in cards] == [
+        "Lei nº 1, de 28 de junho de 2023",
+        "Lei nº 2, de 28 de junho de 2023",
+    ]
+    assert cards[0].link == "http://www.planalto.gov.br/ccivil_03/leis/L1.htm"
+    assert "Dispõe sobre o programa 1." in cards[0].text
+
+
+def test_cards_match_soup_extraction():
+    page = results_page(range(10))
+    soup = BeautifulSoup(page, "lxml")
+    soup_cards = [
+        (
+            card.find("h4").text.strip(),
+            [a["href"] for a in card.find("ul").find_all("a")],
+        )
+        for card in soup.find_all("div", class_=CARD_CLASS)
+    ]
+
+    assert [
+        (card.title, list(card.links)) for card in extract_cards(page)
+    ] == soup_cards
+
+
+def test_card_without_links():
+    page = PAGE.format(
+        cards=f'<div class="{CARD_CLASS}"><h4 class="card-title">Lei</h4></div>'
+    )
+    (card,) = extract_cards(page)
+
+    assert card.links == ()
+    assert card.link == ""
+
+
+def test_fingerprint_changes_with_card():
+    (card,) = extract_cards(results_page([1]))
+    (same,) = extract_cards(results_page([1]))
+    (revoked,) = extract_cards(results_page([1]).replace("Dispõe", "Revogada. Dispõe"))
+
+    assert card.fingerprint == same.fingerprint
+    assert card.fingerprint != revoked.fingerprint
+
+
+def test_page_without_results():
+    assert extract_cards("<html><body>Sessão expirada</body></html>") == []
+    assert extract_total_results("<html><body>Sessão expirada</body></html>") is None
+
+
+def test_extract_total_results():
+    assert extract_total_results(results_page([])) == 1234
+
+
+def test_results_fragment_starts_at_marker_element():
+    html = '<body><p>before</p><div class="marker">after</div></body>'
+
+    assert (
+        results_fragment(html, 'class="marker"')
+        == '<div class="marker">after</div></body>'
+    )
+    assert results_fragment(html, "missing") is None
@@ -0,0 +1,67 @@
+import json
+import pytest
+from utils.checkpoint_store import CheckpointStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite", commit_interval=60)
+    yield store
+    store.close()
+
+
+def test_save_and_load_copies(store):
+    checkpoint = {"page": 1}
+    store.save("key", checkpoint)
+    checkpoint["page"] = 2
+    assert store.load("key") == {"page": 1}
+
+    loaded = store.load("key")
+    loaded["page"] = 3
+    assert store.load("key") == {"page": 1}
+
+    store.commit()
+    loaded = store.load("key")
+    loaded["page"] = 4
+    assert store.load("key") == {"page": 1}
+
+
+def test_load_default(store):
+    assert store.load("missing") is None
+    assert store.load("missing", {"page": 0}) == {"page": 0}
+
+
+def test_value_that_is_not_json_raises_on_save(store):
+    store.save("good", [1])
+    with pytest.raises(TypeError):
+        store.save("bad", {"value": object()})
+
+    # a bad value never reaches the buffer, so it can't poison later commits
+    store.save("later", [2])
+    store.commit()
+    assert sorted(store.keys()) == ["good", "later"]
+    assert store.load("later") == [2]
+
+
+def test_saves_survive_reopen(tmp_path):
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite", commit_interval=60)
+    store.save("key", {"page": 5})
+    store.close()
+
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite", commit_interval=60)
+    assert store.load("key") == {"page": 5}
+    store.close()
+
+
+def test_migrate_json_once(store, tmp_path):
+    json_path = tmp_path / "checkpoint.json"
+    json_path.write_text(json.dumps({"a": 1, "b": {"page": 2}}))
+    store.save("a", 10)
+
+    store.migrate_json(json_path)
+
+    # keys already in the store are kept
+    assert store.load("a") == 10
+    assert store.load("b") == {"page": 2}
+    assert not json_path.exists()
+    assert (tmp_path / "checkpoint.json.migrated").exists()
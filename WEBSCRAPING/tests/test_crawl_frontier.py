@@ -0,0 +1,111 @@
+import time
+import pytest
+from utils.pipeline import WorkItem
+from utils.crawl_frontier import (
+    CrawlFrontier,
+    DISCOVERED,
+    FETCHED,
+    UPLOADED,
+    FAILED,
+)
+
+
+def work_item(index: int, **fields) -> WorkItem:
+    return WorkItem(
+        f"http://example.com/{index}", f"law {index}", "output", "folder", **fields
+    )
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = CrawlFrontier("test", tmp_path / "frontier.sqlite", max_attempts=2)
+    yield frontier
+    frontier.close()
+
+
+def test_add_keeps_known_items(frontier):
+    assert frontier.add([work_item(0), work_item(1)]) == 2
+    frontier.mark(work_item(0).url, UPLOADED)
+
+    assert frontier.add([work_item(0), work_item(2)]) == 1
+    assert frontier.state(work_item(0).url) == UPLOADED
+    assert frontier.counts() == {DISCOVERED: 2, UPLOADED: 1}
+
+
+def test_claim_rebuilds_items(frontier):
+    frontier.add([work_item(0, metadata={"fingerprint": "abc"})])
+
+    (item,) = frontier.claim()
+    assert item.url == work_item(0).url
+    assert item.filename == "law 0"
+    assert item.metadata == {"fingerprint": "abc"}
+    assert frontier.known(item.url) == (DISCOVERED, {"fingerprint": "abc"})
+
+
+def test_claimed_items_are_not_claimed_again(frontier):
+    frontier.add([work_item(index) for index in range(3)])
+
+    assert len(frontier.claim(limit=2)) == 2
+    assert len(frontier.claim()) == 1
+    assert frontier.claim() == []
+
+
+def test_abandoned_claims_expire(tmp_path):
+    frontier = CrawlFrontier("test", tmp_path / "frontier.sqlite", claim_timeout=0)
+    frontier.add([work_item(0)])
+    frontier.claim()
+    time.sleep(0.01)
+
+    assert len(frontier.claim()) == 1
+    frontier.close()
+
+
+def test_fail_releases_until_max_attempts(frontier):
+    url = work_item(0).url
+    frontier.add([work_item(0)])
+
+    frontier.claim()
+    assert not frontier.fail(url, Exception("timeout"))
+    assert frontier.state(url) == DISCOVERED
+
+    frontier.claim()
+    assert frontier.fail(url, Exception("timeout"))
+    assert frontier.state(url) == FAILED
+    assert frontier.claim() == []
+
+
+def test_in_flight(frontier):
+    frontier.add([work_item(index) for index in range(3)])
+    started = time.time()
+    first, second, third = frontier.claim()
+
+    frontier.mark(first.url, UPLOADED)
+    frontier.mark(second.url, FETCHED)
+    frontier.fail(third.url, Exception("timeout"))
+
+    # fetched item is still being processed, the failed one was released
+    assert frontier.in_flight(since=started) == 1
+    assert frontier.in_flight(since=time.time() + 1) == 0
+
+
+def test_requeue_resets_final_items(frontier):
+    frontier.add([work_item(0)])
+    frontier.claim()
+    frontier.mark(work_item(0).url, UPLOADED)
+
+    frontier.requeue([work_item(0, metadata={"fingerprint": "new"})])
+
+    (item,) = frontier.claim()
+    assert item.metadata == {"fingerprint": "new"}
+
+
+def test_crawls_are_apart(tmp_path):
+    frontier_path = tmp_path / "frontier.sqlite"
+    first = CrawlFrontier("first", frontier_path)
+    second = CrawlFrontier("second", frontier_path)
+    first.add([work_item(0)])
+
+    assert second.claim() == []
+    assert second.state(work_item(0).url) is None
+    first.close()
+    second.close()
@@ -0,0 +1,76 @@
+import pytest
+from utils.document_store import DocumentStore, file_sha256, text_sha256
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DocumentStore(tmp_path / "documents.sqlite")
+    yield store
+    store.close()
+
+
+def document(tmp_path, name: str, content: bytes):
+    file_path = tmp_path / name
+    file_path.write_bytes(content)
+    return file_path
+
+
+def test_text_sha256_ignores_rendering_differences():
+    assert text_sha256("Lei  nº 1\nArt. 1º") == text_sha256("LEI Nº 1 art. 1º ")
+    assert text_sha256(" \n ") is None
+
+
+def test_same_bytes_are_stored_once(store, tmp_path):
+    first = document(tmp_path, "a.html", b"<p>Lei 1</p>")
+    copy = document(tmp_path, "b.html", b"<p>Lei 1</p>")
+
+    sha256, stored = store.put(first, "planalto", "lei 1", mimetype="text/html")
+    assert (sha256, stored) == (file_sha256(first), False)
+    store.mark_uploaded(sha256)
+
+    assert store.put(copy, "senado", "lei 1 senado", mimetype="text/html") == (
+        sha256,
+        True,
+    )
+    assert store.lookup("senado", "lei 1 senado") == sha256
+    assert store.names(sha256) == [("planalto", "lei 1"), ("senado", "lei 1 senado")]
+
+
+def test_blob_is_a_duplicate_only_once_uploaded(store, tmp_path):
+    first = document(tmp_path, "a.html", b"<p>Lei 1</p>")
+
+    sha256, _ = store.put(first, "planalto", "lei 1", mimetype="text/html")
+    # upload failed, the next copy is uploaded again
+    assert store.put(first, "planalto", "lei 1", mimetype="text/html") == (
+        sha256,
+        False,
+    )
+
+
+def test_same_text_is_an_alias(store, tmp_path):
+    first = document(tmp_path, "a.pdf", b"first rendering")
+    second = document(tmp_path, "b.pdf", b"second rendering")
+    text_hash = text_sha256("Lei nº 1")
+
+    sha256, _ = store.put(first, "planalto", "lei 1", text_hash=text_hash)
+    store.mark_uploaded(sha256)
+
+    assert store.put(second, "senado", "lei 1", text_hash=text_hash) == (sha256, True)
+    assert store.canonical(file_sha256(second)) == sha256
+
+
+def test_copies_are_processed_once(store, tmp_path):
+    first = document(tmp_path, "a.pdf", b"first rendering")
+    second = document(tmp_path, "b.pdf", b"second rendering")
+    text_hash = text_sha256("Lei nº 1")
+    sha256, _ = store.put(first, "planalto", "lei 1", text_hash=text_hash)
+    store.mark_uploaded(sha256)
+    store.put(second, "senado", "lei 1", text_hash=text_hash)
+
+    assert not store.is_processed(sha256, "raw_text")
+    store.mark_processed(sha256, "raw_text")
+
+    assert store.is_processed(file_sha256(second), "raw_text")
+    assert not store.is_processed(sha256, "questions")
+    # documents not in the store are their own blob
+    assert not store.is_processed("unknown", "raw_text")
@@ -0,0 +1,43 @@
+import json
+from utils.failure_journal import FailureJournal, LEGACY_SCRAPER
+
+
+def test_pending_keeps_latest_unresolved_failure(tmp_path):
+    journal = FailureJournal(tmp_path / "failed.jsonl", tmp_path / "missing.json")
+    journal.record("http://a", "a", "Scraper", Exception("first"), attempts=1)
+    journal.record("http://a", "a", "Scraper", TimeoutError("second"), attempts=2)
+    journal.record("http://b", "b", "Scraper", output_dir="out")
+    journal.record("http://c", "c", "Other")
+
+    pending = {record["url"]: record for record in journal.pending("Scraper")}
+    assert sorted(pending) == ["http://a", "http://b"]
+    assert pending["http://a"]["error"] == "TimeoutError"
+    assert pending["http://a"]["attempts"] == 2
+    assert pending["http://b"]["output_dir"] == "out"
+
+    journal.resolve(["http://a"], "Scraper")
+    assert [record["url"] for record in journal.pending("Scraper")] == ["http://b"]
+    assert len(journal.pending()) == 2
+
+
+def test_partial_line_is_skipped(tmp_path):
+    journal_path = tmp_path / "failed.jsonl"
+    journal = FailureJournal(journal_path, tmp_path / "missing.json")
+    journal.record("http://a", "a", "Scraper")
+    with open(journal_path, "a") as f:
+        f.write('{"url": "http://b", "filen')
+
+    assert [record["url"] for record in journal.pending()] == ["http://a"]
+
+
+def test_legacy_file_is_imported_once(tmp_path):
+    legacy_path = tmp_path / "failed_links.json"
+    legacy_path.write_text(json.dumps([{"url": "http://a", "filename": "a"}]))
+    journal_path = tmp_path / "failed.jsonl"
+
+    journal = FailureJournal(journal_path, legacy_path)
+    assert [record["scraper"] for record in journal.pending()] == [LEGACY_SCRAPER]
+
+    journal.resolve(["http://a"], LEGACY_SCRAPER)
+    # journal exists, legacy file is not imported again
+    assert FailureJournal(journal_path, legacy_path).pending() == []
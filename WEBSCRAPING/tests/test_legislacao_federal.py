@@ -0,0 +1,106 @@
+import pytest
+from queue import Queue
+
+# the scraper uploads to Google Drive
+pytest.importorskip("googleapiclient")
+
+from scrapers.legislacao_federal import LegislacaoFederalScraper, SESSION_RETRIES
+from utils.checkpoint_saver import CheckpointSaver
+from utils.crawl_frontier import CrawlFrontier
+
+CARD = """
+<div class="card p-2 pr-3 pl-3 w-100">
+    <h4 class="card-title">Lei nº {number}</h4>
+    <ul class="list-inline p-0 m-0">
+        <li><a href="https://legislacao.presidencia.gov.br/atos/?numero={number}">Detalhes</a></li>
+        <li><a href="http://www.planalto.gov.br/ccivil_03/leis/L{number}.htm">Texto integral</a></li>
+    </ul>
+</div>
+"""
+REJECTED_PAGE = "<html><body>Sessão expirada</body></html>"
+
+
+def results_page(page: int) -> str:
+    cards = "".join(CARD.format(number=page * 10 + index) for index in range(10))
+    return f'<h4 class="pb-2 fw-bold">20 resultados</h4>{cards}'
+
+
+class FakeRequester:
+    """Answers search pages, rejecting the requests whose index is in `rejected`"""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.pages = []
+
+    def make_request(self, url, data=None, headers=None, method="GET"):
+        self.pages.append(data["pagina"])
+        if len(self.pages) - 1 in self.rejected:
+            return REJECTED_PAGE
+
+        return results_page(data["pagina"])
+
+
+class FakeSessionBootstrap:
+    def __init__(self):
+        self.forced = 0
+
+    def bootstrap(self, requester, force=False):
+        self.forced += force
+
+
+@pytest.fixture
+def scraper(tmp_path):
+    # only the state used by the shard crawl, no browser nor Drive service
+    scraper = LegislacaoFederalScraper.__new__(LegislacaoFederalScraper)
+    scraper.checkpoint_saver = CheckpointSaver(tmp_path / "checkpoints.json")
+    scraper.frontier = CrawlFrontier("test", tmp_path / "frontier.sqlite")
+    yield scraper
+    scraper.frontier.close()
+    scraper.checkpoint_saver.store.close()
+
+
+SHARD = {
+    "filter": None,
+    "dat_inicio": "01/01/2000",
+    "dat_termino": "31/12/2000",
+    "total_results": 20,
+}
+
+
+def test_rejected_page_is_requested_again(scraper):
+    requester = FakeRequester(rejected=[1])
+    session_bootstrap = FakeSessionBootstrap()
+    items = Queue()
+
+    scraper.crawl_shard_pages(
+        SHARD, "shard", {"page": 0}, requester, items, session_bootstrap
+    )
+
+    # second page was rejected once, then crawled with a new session
+    assert requester.pages == [0, 1, 1]
+    assert session_bootstrap.forced == 1
+    assert items.qsize() == 20
+    assert scraper.load_checkpoint("shard") == {"page": 2, "done": True}
+
+
+def test_cursor_stays_on_page_rejected_by_every_session(scraper):
+    requester = FakeRequester(rejected=range(1, 2 + SESSION_RETRIES))
+    items = Queue()
+
+    with pytest.raises(Exception, match="Session rejected"):
+        scraper.crawl_shard_pages(
+            SHARD, "shard", {"page": 0}, requester, items, FakeSessionBootstrap()
+        )
+
+    assert items.qsize() == 10
+    # resumed run starts at the rejected page
+    assert scraper.load_checkpoint("shard") == {"page": 1, "done": False}
+
+
+def test_shard_resumes_at_cursor(scraper):
+    requester = FakeRequester()
+    scraper.crawl_shard_pages(
+        SHARD, "shard", {"page": 1}, requester, Queue(), FakeSessionBootstrap()
+    )
+
+    assert requester.pages == [1]
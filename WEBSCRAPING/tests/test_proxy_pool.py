@@ -0,0 +1,67 @@
+from utils.proxy_pool import ProxyPool, ProxyStats, normalize_proxy
+
+
+def validated_pool(proxies: list[str], **kwargs) -> ProxyPool:
+    pool = ProxyPool(lambda: proxies, **kwargs)
+    for proxy in proxies:
+        pool.report(proxy, ok=True, latency=0.1, validation=True)
+
+    return pool
+
+
+def test_normalize_proxy():
+    assert normalize_proxy("https://94.142.27.4:3128/") == "94.142.27.4:3128"
+    assert normalize_proxy(" 94.142.27.4:3128 ") == "94.142.27.4:3128"
+
+
+def test_score_prefers_fast_reliable_proxies():
+    fast, slow, failing = ProxyStats("fast"), ProxyStats("slow"), ProxyStats("failing")
+    fast.record(True, 0.1)
+    slow.record(True, 2)
+    failing.record(True, 0.1)
+    failing.record(False)
+    failing.record(False)
+
+    assert fast.score > slow.score
+    assert fast.score > failing.score
+
+
+def test_only_validated_proxies_join_the_pool():
+    pool = ProxyPool(lambda: [])
+    pool.report("1.1.1.1:80", ok=True, latency=0.1)
+    pool.report("2.2.2.2:80", ok=False, validation=True)
+
+    assert len(pool) == 0
+    assert pool.get() is None
+    assert "2.2.2.2:80" in pool.evicted
+
+
+def test_proxy_is_evicted_after_consecutive_failures():
+    pool = validated_pool(["1.1.1.1:80"], max_consecutive_failures=2)
+    pool.report("1.1.1.1:80", ok=False)
+    assert len(pool) == 1
+
+    pool.report("1.1.1.1:80", ok=False)
+    assert len(pool) == 0
+    assert pool.get() is None
+
+
+def test_sessions_keep_their_proxy_while_healthy():
+    pool = validated_pool([f"1.1.1.{index}:80" for index in range(8)])
+    proxy = pool.get(session_key="session")
+
+    assert all(pool.get(session_key="session") == proxy for _ in range(10))
+
+    # evicted proxy is replaced
+    pool.report(proxy, ok=False)
+    pool.report(proxy, ok=False)
+    pool.report(proxy, ok=False)
+    assert pool.get(session_key="session") not in (proxy, None)
+
+
+def test_release_session():
+    pool = validated_pool(["1.1.1.1:80"])
+    pool.get(session_key="session")
+    pool.release_session("session")
+
+    assert "session" not in pool.sessions
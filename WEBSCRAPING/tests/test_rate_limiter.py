@@ -0,0 +1,82 @@
+import time
+from utils.rate_limiter import AIMDController, HostRateLimiter, TokenBucket
+from utils.retry_policy import SERVER_ERROR, CLIENT_ERROR
+
+
+def test_token_bucket_allows_bursts_then_waits():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    assert 0 < bucket.try_take() <= 0.1
+
+
+def test_aimd_limits_concurrency():
+    controller = AIMDController(initial_limit=2)
+
+    assert controller.try_acquire()
+    assert controller.try_acquire()
+    assert not controller.try_acquire()
+
+    controller.release(0.1, overloaded=False)
+    assert controller.try_acquire()
+
+
+def test_aimd_increases_additively_and_decreases_multiplicatively():
+    controller = AIMDController(initial_limit=4, cooldown=0)
+    for _ in range(4):
+        controller.try_acquire()
+        assert controller.release(0.1, overloaded=False) == "increase"
+    assert 4.9 < controller.limit < 5
+
+    controller.try_acquire()
+    assert controller.release(0.1, overloaded=True) == "decrease"
+    assert 2.4 < controller.limit < 2.5
+
+
+def test_aimd_decreases_once_per_cooldown():
+    controller = AIMDController(initial_limit=8, cooldown=60)
+    for _ in range(3):
+        controller.try_acquire()
+        controller.release(0.1, overloaded=True)
+
+    assert controller.limit == 4
+
+
+def test_aimd_slow_responses_count_as_overload():
+    controller = AIMDController(initial_limit=8, cooldown=0)
+    controller.try_acquire()
+    controller.release(0.2, overloaded=False)
+
+    for _ in range(5):
+        controller.try_acquire()
+        change = controller.release(5, overloaded=False)
+
+    assert change == "decrease"
+    assert controller.limit < 8
+
+
+def test_host_limiter_shrinks_on_server_errors():
+    limiter = HostRateLimiter(rate=100, initial_limit=8)
+    started = limiter.acquire("host")
+    limiter.release("host", started, SERVER_ERROR, 503)
+    assert limiter.concurrency_limit("host") == 4
+
+    # plain 4xx means the request is wrong, not that the host is overloaded
+    started = limiter.acquire("other")
+    limiter.release("other", started, CLIENT_ERROR, 404)
+    assert limiter.concurrency_limit("other") == 8
+
+
+def test_latency_is_measured_to_headers():
+    limiter = HostRateLimiter(rate=100)
+    limiter.configure("host", initial_limit=8)
+    _, controller = limiter.hosts["host"]
+
+    started = limiter.acquire("host")
+    headers_at = time.perf_counter()
+    # body transfer of a streamed download
+    time.sleep(0.05)
+    limiter.release("host", started, headers_at=headers_at)
+
+    assert controller.min_latency < 0.05
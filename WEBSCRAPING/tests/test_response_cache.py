@@ -0,0 +1,77 @@
+import time
+import pytest
+from email.utils import formatdate
+from utils.response_cache import ResponseCache, freshness_lifetime
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite")
+    yield cache
+    cache.close()
+
+
+def test_freshness_lifetime():
+    now = time.time()
+
+    assert freshness_lifetime({"cache-control": "max-age=60"}, now) == 60
+    assert freshness_lifetime({"cache-control": "no-cache, max-age=60"}, now) == 0
+    assert 110 < freshness_lifetime({"expires": formatdate(now + 120)}, now) <= 120
+    assert freshness_lifetime({"expires": "0"}, now) == 0
+    assert freshness_lifetime({}, now) == 0
+
+
+def test_responses_without_validators_are_not_stored(cache):
+    cache.store("POST", "http://example.com/search", {"page": 1}, 200, {}, b"results")
+
+    assert cache.get("POST", "http://example.com/search", {"page": 1}) is None
+
+
+def test_no_store_is_honoured(cache):
+    headers = {"ETag": '"v1"', "Cache-Control": "no-store"}
+    cache.store("GET", "http://example.com/", None, 200, headers, b"page")
+
+    assert cache.get("GET", "http://example.com/") is None
+
+
+def test_fresh_response_is_served(cache):
+    headers = {"Cache-Control": "max-age=60"}
+    cache.store("GET", "http://example.com/", None, 200, headers, b"page")
+
+    cached, conditional = cache.lookup("GET", "http://example.com/")
+    assert cached.body == b"page"
+    assert conditional is None
+
+
+def test_stale_response_is_revalidated(cache):
+    headers = {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    cache.store("GET", "http://example.com/", None, 200, headers, b"page")
+
+    cached, conditional = cache.lookup("GET", "http://example.com/")
+    assert conditional == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+
+    assert cache.revalidated(cached, {"ETag": '"v2"'}) == b"page"
+    assert cache.get("GET", "http://example.com/").etag == '"v2"'
+
+
+def test_entry_that_lost_its_validators_is_deleted(cache):
+    cache.store("GET", "http://example.com/", None, 200, {"ETag": '"v1"'}, b"old")
+    previous = cache.get("GET", "http://example.com/")
+
+    cache.store("GET", "http://example.com/", None, 200, {}, b"new", previous)
+
+    assert cache.get("GET", "http://example.com/") is None
+    assert cache.size() == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite", max_size=10, max_age=60)
+    cache.store("GET", "http://example.com/a", None, 200, {}, b"a" * 6)
+    cache.store("GET", "http://example.com/b", None, 200, {}, b"b" * 6)
+
+    assert cache.get("GET", "http://example.com/a") is None
+    assert cache.get("GET", "http://example.com/b").body == b"b" * 6
+    cache.close()
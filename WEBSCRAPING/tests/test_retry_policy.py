@@ -0,0 +1,117 @@
+import time
+import pytest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from utils.retry_policy import (
+    CLIENT_ERROR,
+    SERVER_ERROR,
+    NETWORK_ERROR,
+    VERIFICATION_ERROR,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    classify_status,
+    parse_retry_after,
+    full_jitter_backoff,
+)
+
+
+def test_classify_status():
+    assert classify_status(404) == CLIENT_ERROR
+    assert classify_status(503) == SERVER_ERROR
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
+
+    date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30))
+    assert 25 <= parse_retry_after(date) <= 30
+
+
+def test_full_jitter_backoff_is_capped():
+    for attempt in range(10):
+        assert 0 <= full_jitter_backoff(attempt, base=1, cap=8) <= 8
+
+
+def test_circuit_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker("host", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    # a single probe goes through while half open
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_probe_outcome():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+    # failed probe opens the circuit again
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    # host answered the probe, even with a plain 4xx
+    breaker.record_answer()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_lost_probe_is_replaced():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # probe never reported back
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+
+def test_record_answer_keeps_closed_failure_count():
+    breaker = CircuitBreaker("host", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_answer()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_next_delay_gives_up():
+    policy = RetryPolicy(max_attempts=3, backoff_base=0.01)
+
+    assert policy.next_delay("host", 0, SERVER_ERROR) is not None
+    assert policy.next_delay("host", 2, SERVER_ERROR) is None
+    # plain 4xx is not retried, throttling is
+    assert policy.next_delay("host", 0, CLIENT_ERROR, 404) is None
+    assert policy.next_delay("host", 0, CLIENT_ERROR, 429) is not None
+
+
+def test_next_delay_honours_retry_after():
+    policy = RetryPolicy(backoff_base=0.01, backoff_max=0.01)
+
+    assert policy.next_delay("host", 0, CLIENT_ERROR, 429, retry_after=5) == 5
+
+
+def test_only_host_failures_open_the_circuit():
+    policy = RetryPolicy(failure_threshold=2)
+    policy.next_delay("host", 0, VERIFICATION_ERROR)
+    policy.next_delay("host", 0, CLIENT_ERROR, 404)
+    policy.before_attempt("http://host/", "host")
+
+    policy.next_delay("host", 0, NETWORK_ERROR)
+    policy.next_delay("host", 0, SERVER_ERROR, 500)
+    with pytest.raises(CircuitOpenError):
+        policy.before_attempt("http://host/", "host")
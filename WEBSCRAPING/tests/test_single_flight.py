@@ -0,0 +1,136 @@
+import time
+import http.server
+import pytest
+from threading import Thread, Barrier
+from requester import Requester
+from utils.single_flight import SingleFlight, normalize_url
+from utils.rate_limiter import HostRateLimiter
+from utils.retry_policy import RetryPolicy
+
+
+class EchoCookieHandler(http.server.BaseHTTPRequestHandler):
+    """Answers slowly with the request cookies, so concurrent requests overlap"""
+
+    requests = 0
+
+    def do_GET(self):
+        EchoCookieHandler.requests += 1
+        time.sleep(0.3)
+        body = (self.headers.get("Cookie") or "").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    EchoCookieHandler.requests = 0
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EchoCookieHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/page"
+    server.shutdown()
+    server.server_close()
+
+
+def session_cookie(requester: Requester, value: str):
+    requester.set_cookie(
+        requester.cookie_dict_to_cookie(
+            {"name": "session", "value": value, "domain": "127.0.0.1", "path": "/"}
+        )
+    )
+
+
+def concurrent_requests(requesters: list, url: str) -> list[str]:
+    results = [None] * len(requesters)
+
+    def request(index):
+        results[index] = requesters[index].make_request(url)
+
+    threads = [
+        Thread(target=request, args=(index,)) for index in range(len(requesters))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def new_requester(single_flight: SingleFlight) -> Requester:
+    return Requester(
+        retry_policy=RetryPolicy(),
+        rate_limiter=HostRateLimiter(rate=100),
+        single_flight=single_flight,
+    )
+
+
+def test_normalize_url():
+    assert (
+        normalize_url("HTTP://Example.com:80/a?b=2&a=1#top")
+        == "http://example.com/a?a=1&b=2"
+    )
+    assert normalize_url("https://example.com:8443") == "https://example.com:8443/"
+
+
+def test_concurrent_calls_share_one_call():
+    single_flight = SingleFlight("test")
+    barrier = Barrier(4)
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    def caller(results):
+        barrier.wait()
+        results.append(single_flight.do("key", slow_call))
+
+    results = []
+    threads = [Thread(target=caller, args=(results,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_error_is_shared_and_not_cached():
+    single_flight = SingleFlight("test")
+
+    def failing_call():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        single_flight.do("key", failing_call)
+
+    # finished calls are forgotten, the next one runs again
+    assert single_flight.do("key", lambda: "result") == "result"
+
+
+def test_requests_of_different_sessions_are_not_coalesced(server):
+    single_flight = SingleFlight("test")
+    session_a, session_b = new_requester(single_flight), new_requester(single_flight)
+    session_cookie(session_a, "A")
+    session_cookie(session_b, "B")
+
+    assert concurrent_requests([session_a, session_b], server) == [
+        "session=A",
+        "session=B",
+    ]
+    assert EchoCookieHandler.requests == 2
+
+
+def test_anonymous_requests_are_coalesced(server):
+    single_flight = SingleFlight("test")
+    requesters = [new_requester(single_flight) for _ in range(3)]
+
+    assert concurrent_requests(requesters, server) == ["", "", ""]
+    assert EchoCookieHandler.requests == 1
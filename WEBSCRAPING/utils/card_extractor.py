@@ -0,0 +1,82 @@
+import hashlib
+from dataclasses import dataclass
+from lxml import etree, html
+
+CARD_CLASS = "card p-2 pr-3 pl-3 w-100"  # result card of legislacao.presidencia.gov.br
+TOTAL_RESULTS_CLASS = "pb-2 fw-bold"
+
+# compiled once, evaluated on every page
+CARDS_XPATH = etree.XPath(f"//div[@class='{CARD_CLASS}']")
+TITLE_XPATH = etree.XPath(".//h4[@class='card-title']")
+LINKS_XPATH = etree.XPath(".//ul[@class='list-inline p-0 m-0']//a/@href")
+TOTAL_RESULTS_XPATH = etree.XPath(f"//h4[@class='{TOTAL_RESULTS_CLASS}']")
+
+
+@dataclass(frozen=True)
+class CardRecord:
+    """Search result card"""
+
+    title: str
+    links: tuple  # hrefs of the card links list
+    text: str = ""  # whole card text, whitespace normalized
+
+    @property
+    def link(self) -> str:
+        """'texto integral' link, the second one of the card. Empty if the card has none"""
+        return self.links[1] if len(self.links) > 1 else ""
+
+    @property
+    def fingerprint(self) -> str:
+        """Changes whenever the card text or links change, ex: act was revoked or amended"""
+        return hashlib.sha256(
+            "\n".join((self.text, *self.links)).encode("utf-8")
+        ).hexdigest()
+
+
+def results_fragment(html_text: str, marker: str) -> str:
+    """Part of the page starting at the first element containing `marker`, so only the results container is parsed. None if marker is not in the page"""
+    start = html_text.find(marker)
+    if start == -1:
+        return None
+
+    # back to the opening tag of the element
+    return html_text[html_text.rfind("<", 0, start) :]
+
+
+def extract_cards(html_text: str) -> list[CardRecord]:
+    """Card records of a search results page (html or ajax response)"""
+    fragment = results_fragment(html_text, f'class="{CARD_CLASS}"')
+    if fragment is None:
+        return []
+
+    root = html.fragment_fromstring(fragment, create_parent="div")
+
+    records = []
+    for card in CARDS_XPATH(root):
+        title = TITLE_XPATH(card)
+        records.append(
+            CardRecord(
+                title=title[0].text_content().strip() if title else "",
+                links=tuple(LINKS_XPATH(card)),
+                text=" ".join(card.text_content().split()),
+            )
+        )
+
+    return records
+
+
+def extract_total_results(html_text: str) -> int:
+    """Total results of a search response, None if the response has no results header"""
+    fragment = results_fragment(html_text, f'class="{TOTAL_RESULTS_CLASS}"')
+    if fragment is None:
+        return None
+
+    # header is a single element, parse only up to its end
+    fragment = fragment[: fragment.find("</h4>") + len("</h4>")]
+    header = TOTAL_RESULTS_XPATH(
+        html.fragment_fromstring(fragment, create_parent="div")
+    )
+    if not header:
+        return None
+
+    return int(header[0].text_content().strip().split(" ")[0].replace(".", ""))
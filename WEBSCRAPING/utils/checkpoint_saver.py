@@ -1,45 +1,20 @@
-import os
-import json
 from pathlib import Path
 from unidecode import unidecode
+from utils.checkpoint_store import CheckpointStore
+
 
 class CheckpointSaver:
-    """Class for saving and loading checkpoints for scrapers. JSON format is used."""
+    """Class for saving and loading checkpoints for scrapers. Checkpoints are kept in a `CheckpointStore` next to `checkpoint_path`, the old JSON file is imported on first use."""
 
     def __init__(self, checkpoint_path):
-        self.checkpoint_path = checkpoint_path
+        self.checkpoint_path = Path(checkpoint_path)
+        self.store = CheckpointStore(self.checkpoint_path.with_suffix(".sqlite"))
+        self.store.migrate_json(self.checkpoint_path)
 
     def save_checkpoint(self, checkpoint: dict, filt: str):
-        """Save checkpoint to file."""
-
-        # check if dirs and subdirs in checkpoint_path exists or create them
-        path = Path(self.checkpoint_path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-
-        # read checkpoint
-        if os.path.exists(self.checkpoint_path):
-            with open(self.checkpoint_path, "r") as f:
-                checkpoint_json = json.load(f)
-
-        else:
-            checkpoint_json = {}
-
-        # Save checkpoint
-        checkpoint_json[unidecode(filt)] = checkpoint
-
-        with open(self.checkpoint_path, "w") as f:
-            json.dump(checkpoint_json, f, indent=4)
+        """Save checkpoint of filter."""
+        self.store.save(unidecode(filt), checkpoint)
 
     def load_checkpoint(self, filt: str):
-        """Load checkpoint from file."""
-        if not os.path.exists(self.checkpoint_path):
-            return None
-
-        with open(self.checkpoint_path, "r") as f:
-            checkpoint = json.load(f)
-
-        filt = unidecode(filt)
-        if filt in checkpoint:
-            return checkpoint[filt]
-
-        return None
+        """Load checkpoint of filter, None if there is none."""
+        return self.store.load(unidecode(filt))
@@ -0,0 +1,137 @@
+import json
+import atexit
+import sqlite3
+from pathlib import Path
+from threading import Thread, Lock, Event
+
+
+class CheckpointStore:
+    """Key-value checkpoint store on SQLite (WAL). Saves are buffered in memory and written together in a single transaction every `commit_interval` seconds or `max_pending` keys (group commit), so frequent saves are cheap. Each transaction is atomic, a killed process loses at most the last interval but never corrupts saved checkpoints. Reads load only the requested key"""
+
+    def __init__(
+        self, store_path: Path, commit_interval: float = 1.0, max_pending: int = 100
+    ):
+        self.store_path = Path(store_path)
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.pending = {}  # key -> serialized checkpoint waiting for the next commit
+        self.committing = {}  # keys being written, still visible to `load`
+        self.lock = Lock()  # guards pending and committing
+        self.connection_lock = Lock()
+        self.commit_requested = Event()
+        self.closed = False
+
+        self.connection = sqlite3.connect(
+            self.store_path, check_same_thread=False, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.connection.commit()
+
+        self.committer = Thread(target=self.run, daemon=True)
+        self.committer.start()
+        atexit.register(self.close)
+
+    def save(self, key: str, checkpoint):
+        """Buffer checkpoint, it is committed with the next group. Serialized now, so values that are not JSON raise here and later changes of `checkpoint` are not saved"""
+        value = json.dumps(checkpoint)
+        with self.lock:
+            self.pending[key] = value
+            full = len(self.pending) >= self.max_pending
+
+        if full:
+            self.commit_requested.set()
+
+    def load(self, key: str, default=None):
+        """New copy of the checkpoint of `key`, changing it doesn't change the store"""
+        with self.lock:
+            value = self.pending.get(key, self.committing.get(key))
+
+        if value is None:
+            with self.connection_lock:
+                row = self.connection.execute(
+                    "SELECT value FROM checkpoints WHERE key = ?", (key,)
+                ).fetchone()
+            value = row[0] if row else None
+
+        return json.loads(value) if value is not None else default
+
+    def keys(self) -> list[str]:
+        self.commit()
+        with self.connection_lock:
+            return [
+                row[0] for row in self.connection.execute("SELECT key FROM checkpoints")
+            ]
+
+    def commit(self):
+        """Write buffered checkpoints in a single transaction"""
+        with self.connection_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                self.committing, self.pending = self.pending, {}
+
+            try:
+                with self.connection:  # commits, or rolls back on error
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                        self.committing.items(),
+                    )
+            except Exception:
+                # keep checkpoints for the next commit, newer saves win
+                with self.lock:
+                    self.pending = {**self.committing, **self.pending}
+                raise
+            finally:
+                with self.lock:
+                    self.committing = {}
+
+    def migrate_json(self, json_path: Path, key: str = None):
+        """Import a legacy JSON checkpoint file once, then rename it to `*.migrated` so later runs skip it. With `key` the whole file is the checkpoint of `key`, otherwise each top level key is a checkpoint. Keys already in the store are kept"""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return
+
+        try:
+            with open(json_path, "r") as f:
+                checkpoints = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Ignoring corrupted checkpoint {json_path}")
+            return
+
+        if key is not None:
+            checkpoints = {key: checkpoints}
+
+        self.commit()
+        with self.connection_lock:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO checkpoints VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in checkpoints.items()],
+                )
+
+        json_path.rename(json_path.with_name(f"{json_path.name}.migrated"))
+
+    def run(self):
+        while not self.closed:
+            self.commit_requested.wait(self.commit_interval)
+            self.commit_requested.clear()
+            try:
+                self.commit()
+            except Exception as e:
+                print(f"Error while committing checkpoints: {e}")
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.commit_requested.set()
+        self.committer.join()
+        self.commit()
+        with self.connection_lock:
+            self.connection.close()
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from utils.metrics import metrics
+from utils.pipeline import WorkItem
+
+FRONTIER_PATH = Path("checkpoints") / "frontier.sqlite"
+
+DISCOVERED = "discovered"
+FETCHED = "fetched"
+RENDERED = "rendered"
+UPLOADED = "uploaded"
+SKIPPED = "skipped"  # dropped by a stage, nothing to upload
+FAILED = "failed"
+FINAL_STATES = (UPLOADED, SKIPPED, FAILED)
+
+
+class CrawlFrontier:
+    """SQLite crawl frontier. Records every discovered item with its state, attempts and timestamps. Workers in several threads or processes atomically claim batches of pending items, and items claimed by a worker that died are claimed again after `claim_timeout` seconds, so a crawl resumes exactly where it stopped"""
+
+    def __init__(
+        self,
+        crawl: str,
+        frontier_path: Path = FRONTIER_PATH,
+        max_attempts: int = 3,
+        claim_timeout: float = 30 * 60,
+    ):
+        self.crawl = crawl  # items of different crawls share the database
+        self.frontier_path = Path(frontier_path)
+        self.frontier_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = Lock()
+
+        # autocommit mode, transactions are explicit so claims can take the write lock upfront
+        self.connection = sqlite3.connect(
+            self.frontier_path,
+            check_same_thread=False,
+            timeout=30,
+            isolation_level=None,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS items (
+                crawl TEXT,
+                url TEXT,
+                filename TEXT,
+                payload TEXT,
+                state TEXT,
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                claimed_by TEXT,
+                claimed_at REAL,
+                discovered_at REAL,
+                updated_at REAL,
+                PRIMARY KEY (crawl, url)
+            )""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS items_state ON items (crawl, state, claimed_at)"
+        )
+
+    @staticmethod
+    def payload(item: WorkItem) -> str:
+        """Item fields kept to rebuild it when claimed"""
+        return json.dumps(
+            {
+                "output_dir": item.output_dir,
+                "folder_name": item.folder_name,
+                "parent_folder_name": item.parent_folder_name,
+                "mimetype": item.mimetype,
+                "metadata": item.metadata,
+            }
+        )
+
+    def add(self, items: list[WorkItem]) -> int:
+        """Record discovered items. Items already in the frontier keep their state. Returns amount of new items"""
+        now = time.time()
+        rows = [
+            (
+                self.crawl,
+                item.url,
+                item.filename,
+                self.payload(item),
+                DISCOVERED,
+                now,
+                now,
+            )
+            for item in items
+        ]
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO items (crawl, url, filename, payload, state, discovered_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.execute("COMMIT")
+            added = self.connection.total_changes - before
+
+        metrics.increment("frontier.discovered", added)
+        return added
+
+    def requeue(self, items: list[WorkItem]):
+        """Make items pending again with a fresh attempt count and their current fields, even if they already reached a final state"""
+        self.add(items)
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "UPDATE items SET filename = ?, payload = ?, state = ?, attempts = 0, error = NULL, claimed_at = NULL, updated_at = ? WHERE crawl = ? AND url = ?",
+                [
+                    (
+                        item.filename,
+                        self.payload(item),
+                        DISCOVERED,
+                        now,
+                        self.crawl,
+                        item.url,
+                    )
+                    for item in items
+                ],
+            )
+            self.connection.execute("COMMIT")
+
+    def claim(self, limit: int = 100) -> list[WorkItem]:
+        """Atomically claim up to `limit` pending items: unclaimed or abandoned items that did not reach a final state"""
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.connection.execute(
+                    f"SELECT url, filename, payload FROM items WHERE crawl = ? AND state NOT IN ({', '.join('?' * len(FINAL_STATES))}) AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY discovered_at LIMIT ?",
+                    (self.crawl, *FINAL_STATES, now - self.claim_timeout, limit),
+                ).fetchall()
+
+                self.connection.executemany(
+                    "UPDATE items SET claimed_by = ?, claimed_at = ?, attempts = attempts + 1, updated_at = ? WHERE crawl = ? AND url = ?",
+                    [(self.worker_id, now, now, self.crawl, url) for url, _, _ in rows],
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        metrics.increment("frontier.claimed", len(rows))
+        return [
+            WorkItem(url, filename, **json.loads(payload))
+            for url, filename, payload in rows
+        ]
+
+    def mark(self, url: str, state: str):
+        """Record that item reached `state`. Final states release the claim"""
+        claimed_at = "NULL" if state in FINAL_STATES else "claimed_at"
+        with self.lock:
+            self.connection.execute(
+                f"UPDATE items SET state = ?, error = NULL, claimed_at = {claimed_at}, updated_at = ? WHERE crawl = ? AND url = ?",
+                (state, time.time(), self.crawl, url),
+            )
+
+        metrics.increment(f"frontier.{state}")
+
+    def fail(self, url: str, error: Exception) -> bool:
+        """Release claim of a failed item so it is retried, or mark it failed after `max_attempts`. Returns True if item won't be retried"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT attempts FROM items WHERE crawl = ? AND url = ?",
+                (self.crawl, url),
+            ).fetchone()
+            gave_up = row is None or row[0] >= self.max_attempts
+
+            self.connection.execute(
+                "UPDATE items SET state = ?, error = ?, claimed_at = NULL, updated_at = ? WHERE crawl = ? AND url = ?",
+                (
+                    FAILED if gave_up else DISCOVERED,
+                    f"{error.__class__.__name__}: {error}",
+                    time.time(),
+                    self.crawl,
+                    url,
+                ),
+            )
+
+        metrics.increment("frontier.failed" if gave_up else "frontier.released")
+        return gave_up
+
+    def in_flight(self, since: float = 0) -> int:
+        """Amount of items claimed by this worker since `since` that did not reach a final state nor were released"""
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM items WHERE crawl = ? AND claimed_by = ? AND claimed_at >= ? AND state NOT IN ({', '.join('?' * len(FINAL_STATES))})",
+                (self.crawl, self.worker_id, since, *FINAL_STATES),
+            ).fetchone()[0]
+
+    def state(self, url: str) -> str:
+        """State of item or None if it was never discovered"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT state FROM items WHERE crawl = ? AND url = ?",
+                (self.crawl, url),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def known(self, url: str):
+        """(state, metadata) of item or None if it was never discovered"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT state, payload FROM items WHERE crawl = ? AND url = ?",
+                (self.crawl, url),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0], json.loads(row[1])["metadata"]
+
+    def counts(self) -> dict:
+        """Amount of items per state"""
+        with self.lock:
+            return dict(
+                self.connection.execute(
+                    "SELECT state, COUNT(*) FROM items WHERE crawl = ? GROUP BY state",
+                    (self.crawl,),
+                ).fetchall()
+            )
+
+    def report(self):
+        counts = self.counts()
+        print(
+            f"Frontier {self.crawl}: "
+            + " | ".join(f"{state} {count}" for state, count in sorted(counts.items()))
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,255 @@
+import time
+import hashlib
+import sqlite3
+import unicodedata
+from pathlib import Path
+from threading import Lock
+from utils.metrics import metrics
+
+DOCUMENT_STORE_PATH = Path("checkpoints") / "documents.sqlite"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Text without the differences between two renderings of the same act: unicode forms, case and whitespace"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def text_sha256(text: str) -> str:
+    """Hash of normalized text, None if there is no text (ex: scanned pdf)"""
+    text = normalize_text(text)
+    if not text:
+        return None
+
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pdf_text(file_path: Path) -> str:
+    # only needed for pdfs whose bytes are not in the store yet
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        return "".join(page.get_text() for page in doc)
+
+
+class DocumentStore:
+    """Content addressed index of the documents of every scraper. A blob is keyed by the SHA-256 of its bytes and indexed by the SHA-256 of its normalized text, and every (source, name) points to a blob, so an act found by several scrapers under different filenames is uploaded, extracted and processed once"""
+
+    def __init__(self, store_path: Path = DOCUMENT_STORE_PATH):
+        self.store_path = Path(store_path)
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+
+        # autocommit mode, transactions are explicit so lookups and inserts of a document are atomic across processes
+        self.connection = sqlite3.connect(
+            self.store_path,
+            check_same_thread=False,
+            timeout=30,
+            isolation_level=None,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # `canonical` is the blob an alias has the same text as, NULL for stored blobs
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                canonical TEXT,
+                text_sha256 TEXT,
+                size INTEGER,
+                mimetype TEXT,
+                source TEXT,
+                name TEXT,
+                folder_name TEXT,
+                uploaded INTEGER DEFAULT 0,
+                created_at REAL
+            )""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS blobs_text ON blobs (text_sha256)"
+        )
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS names (
+                source TEXT,
+                name TEXT,
+                sha256 TEXT,
+                updated_at REAL,
+                PRIMARY KEY (source, name)
+            )""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS names_blob ON names (sha256)"
+        )
+        # blobs already processed by each consumer of the documents, ex: text extraction
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS processed (
+                sha256 TEXT,
+                consumer TEXT,
+                processed_at REAL,
+                PRIMARY KEY (sha256, consumer)
+            )""")
+
+    def find(self, sha256: str = None, text_hash: str = None) -> str:
+        """Stored blob with these bytes or, failing that, this text. None if there is none"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COALESCE(canonical, sha256) FROM blobs WHERE sha256 = ? AND uploaded = 1",
+                (sha256,),
+            ).fetchone()
+            if row is None and text_hash is not None:
+                row = self.connection.execute(
+                    "SELECT sha256 FROM blobs WHERE text_sha256 = ? AND canonical IS NULL AND uploaded = 1 LIMIT 1",
+                    (text_hash,),
+                ).fetchone()
+
+        return row[0] if row else None
+
+    def put(
+        self,
+        file_path: Path,
+        source: str,
+        name: str,
+        mimetype: str = "application/pdf",
+        text_hash: str = None,
+        folder_name: str = "",
+    ) -> tuple:
+        """Point `name` of `source` to the blob of `file_path`. Returns (blob sha256, True if the blob is already stored). Text of pdfs is only hashed when their bytes are new"""
+        file_path = Path(file_path)
+        sha256 = file_sha256(file_path)
+        blob = self.find(sha256)
+
+        if blob is None and text_hash is None and mimetype == "application/pdf":
+            try:
+                text_hash = text_sha256(pdf_text(file_path))
+            except Exception as e:
+                print(f"Can't read text of {file_path}: {e}")
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                if blob is None and text_hash is not None:
+                    row = self.connection.execute(
+                        "SELECT sha256 FROM blobs WHERE text_sha256 = ? AND canonical IS NULL AND uploaded = 1 LIMIT 1",
+                        (text_hash,),
+                    ).fetchone()
+                    blob = row[0] if row else None
+
+                alias = blob is not None and blob != sha256
+                if blob is None or alias:
+                    # new blob, or alias of the stored blob with the same text
+                    self.connection.execute(
+                        "INSERT INTO blobs (sha256, canonical, text_sha256, size, mimetype, source, name, folder_name, uploaded, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (sha256) DO UPDATE SET text_sha256 = COALESCE(text_sha256, excluded.text_sha256)",
+                        (
+                            sha256,
+                            blob,
+                            text_hash,
+                            file_path.stat().st_size,
+                            mimetype,
+                            source,
+                            name,
+                            folder_name,
+                            int(alias),
+                            now,
+                        ),
+                    )
+
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO names (source, name, sha256, updated_at) VALUES (?, ?, ?, ?)",
+                    (source, name, blob or sha256, now),
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        stored = blob is not None
+        metrics.increment("documents.duplicate" if stored else "documents.new")
+        return blob or sha256, stored
+
+    def mark_uploaded(self, sha256: str):
+        """Blob is stored, later copies of it are duplicates"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE blobs SET uploaded = 1 WHERE sha256 = ?", (sha256,)
+            )
+
+    def lookup(self, source: str, name: str) -> str:
+        """Blob sha256 of `name` of `source`, None if unknown"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT sha256 FROM names WHERE source = ? AND name = ?",
+                (source, name),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def names(self, sha256: str) -> list[tuple]:
+        """(source, name) of every copy of a blob"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT source, name FROM names WHERE sha256 = ? ORDER BY source, name",
+                (sha256,),
+            ).fetchall()
+
+    def canonical(self, sha256: str) -> str:
+        """Blob a document is a copy of. Documents that are not an alias, or not in the store, are their own blob"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COALESCE(canonical, sha256) FROM blobs WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+
+        return row[0] if row else sha256
+
+    def is_processed(self, sha256: str, consumer: str) -> bool:
+        """True if `consumer` already processed this document or another copy of it"""
+        blob = self.canonical(sha256)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM processed WHERE sha256 = ? AND consumer = ?",
+                (blob, consumer),
+            ).fetchone()
+
+        if row is not None:
+            metrics.increment(f"documents.{consumer}.skipped")
+
+        return row is not None
+
+    def mark_processed(self, sha256: str, consumer: str):
+        """Record that `consumer` processed the document, later copies of it are skipped"""
+        blob = self.canonical(sha256)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO processed (sha256, consumer, processed_at) VALUES (?, ?, ?)",
+                (blob, consumer, time.time()),
+            )
+
+        metrics.increment(f"documents.{consumer}.processed")
+
+    def report(self):
+        new = metrics.get("documents.new")
+        duplicate = metrics.get("documents.duplicate")
+        if new + duplicate:
+            print(
+                f"Documents: {new} new, {duplicate} already stored | duplicate ratio {metrics.ratio('documents.duplicate', 'documents.new'):.2%}"
+            )
+
+        with self.lock:
+            consumers = self.connection.execute(
+                "SELECT DISTINCT consumer FROM processed"
+            ).fetchall()
+
+        for (consumer,) in consumers:
+            processed = metrics.get(f"documents.{consumer}.processed")
+            skipped = metrics.get(f"documents.{consumer}.skipped")
+            if processed + skipped:
+                print(
+                    f"Documents {consumer}: {processed} processed, {skipped} copies skipped"
+                )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,111 @@
+import json
+import time
+from pathlib import Path
+from threading import Lock
+from utils.metrics import metrics
+
+JOURNAL_PATH = Path("failed_links.jsonl")
+LEGACY_JSON_PATH = Path("failed_links.json")
+LEGACY_SCRAPER = "LegislacaoFederalScraper"  # only scraper that wrote the legacy file
+
+
+class FailureJournal:
+    """Append-only JSONL journal of failed items. Each failure is a single appended line with the error class and attempt count, and replayed items are marked resolved with another line, so the file is never rewritten"""
+
+    def __init__(
+        self, journal_path: Path = JOURNAL_PATH, legacy_path: Path = LEGACY_JSON_PATH
+    ):
+        self.journal_path = Path(journal_path)
+        self.lock = Lock()
+
+        if not self.journal_path.exists():
+            self.import_legacy(Path(legacy_path))
+
+    def append(self, records: list[dict]):
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self.lock:
+            # one write per call in append mode, lines of concurrent processes don't interleave
+            with open(self.journal_path, "a") as f:
+                f.write(lines)
+
+    def import_legacy(self, legacy_path: Path):
+        """Copy entries of the old `failed_links.json` list into a new journal"""
+        records = []
+        if legacy_path.exists():
+            with open(legacy_path, "r") as f:
+                records = [
+                    {
+                        "url": failed_link["url"],
+                        "filename": failed_link["filename"],
+                        "scraper": LEGACY_SCRAPER,
+                        "error": None,
+                        "attempts": None,
+                        "failed_at": legacy_path.stat().st_mtime,
+                    }
+                    for failed_link in json.load(f)
+                ]
+
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self.append(records)
+
+    def record(
+        self,
+        url: str,
+        filename: str,
+        scraper: str,
+        error: Exception = None,
+        attempts: int = 1,
+        **fields,
+    ):
+        """Append a failure. `fields` are extra item fields needed to replay it, ex: output_dir"""
+        self.append(
+            [
+                {
+                    "url": url,
+                    "filename": filename,
+                    "scraper": scraper,
+                    "error": error.__class__.__name__ if error is not None else None,
+                    "message": str(error) if error is not None else None,
+                    "attempts": attempts,
+                    "failed_at": time.time(),
+                    **fields,
+                }
+            ]
+        )
+        metrics.increment("journal.failed")
+
+    def resolve(self, urls: list[str], scraper: str):
+        """Mark failures as resolved after a successful replay"""
+        now = time.time()
+        self.append(
+            [
+                {"url": url, "scraper": scraper, "resolved": True, "resolved_at": now}
+                for url in urls
+            ]
+        )
+        metrics.increment("journal.resolved", len(urls))
+
+    def pending(self, scraper: str = None) -> list[dict]:
+        """Latest failure record of every unresolved url, optionally of a single scraper"""
+        if not self.journal_path.exists():
+            return []
+
+        latest = {}  # (scraper, url) -> {filename: latest failure}
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # partial line of a killed process
+                    continue
+
+                if scraper is not None and record.get("scraper") != scraper:
+                    continue
+
+                key = (record.get("scraper"), record["url"])
+                if record.get("resolved"):
+                    latest.pop(key, None)
+                    continue
+
+                latest.setdefault(key, {})[record.get("filename")] = record
+
+        return [record for failures in latest.values() for record in failures.values()]
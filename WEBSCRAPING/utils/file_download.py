@@ -0,0 +1,104 @@
+import os
+import re
+import hashlib
+from pathlib import Path
+from unidecode import unidecode
+
+CHUNK_SIZE = 64 * 1024  # bytes written per chunk, bounds memory used by a download
+
+
+class DownloadVerificationError(Exception):
+    """Raised when a downloaded file does not match the expected size or checksum"""
+
+
+def download_path(filename: str, output_dir: str) -> Path:
+    """Final path of a downloaded file. Replaces spaces with underscores and slashes with hifen from filename"""
+    filename = unidecode(filename.replace(" ", "_").replace("/", "-"))
+    file_path = Path(output_dir) / filename
+
+    # check if dirs and subdirs exists
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    return file_path
+
+
+def part_path(file_path: Path) -> Path:
+    """Temporary path where `file_path` is downloaded before being renamed"""
+    return file_path.with_name(f"{file_path.name}.part")
+
+
+def hash_file(file_path: Path, hasher=None):
+    """Feed file contents to hasher chunk by chunk. Returns the hasher"""
+    hasher = hasher if hasher else hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+
+    return hasher
+
+
+def resume_headers(part: Path, headers: dict = None) -> dict:
+    """Headers to resume the download of `part` with an HTTP Range request"""
+    headers = dict(headers) if headers else {}
+
+    # ranges and Content-Length refer to the encoded body, so ask for it unencoded
+    headers["Accept-Encoding"] = "identity"
+    if part.exists() and part.stat().st_size > 0:
+        headers["Range"] = f"bytes={part.stat().st_size}-"
+
+    return headers
+
+
+def open_part(part: Path, status: int, response_headers):
+    """Open part file for the response. Returns (file, hasher, expected total size or None).
+
+    A 206 response continues the existing part, any other response restarts it.
+    """
+    hasher = hashlib.sha256()
+    offset = 0
+    if status == 206 and part.exists():
+        offset = part.stat().st_size
+        hash_file(part, hasher)
+
+    expected_size = None
+    content_range = response_headers.get("Content-Range")
+    content_length = response_headers.get("Content-Length")
+    match = re.search(r"/(\d+)$", content_range) if content_range else None
+    if status == 206 and match:
+        expected_size = int(match.group(1))
+    elif content_length and content_length.isdigit():
+        expected_size = offset + int(content_length)
+
+    return open(part, "ab" if offset else "wb"), hasher, expected_size
+
+
+def finalize_part(
+    part: Path,
+    file_path: Path,
+    hasher,
+    expected_size: int = None,
+    expected_sha256: str = None,
+) -> str:
+    """Verify downloaded part and atomically rename it to `file_path`. Returns sha256 hexdigest.
+
+    A short part is kept so the next attempt resumes it, an oversized part or one with a wrong checksum is deleted.
+    """
+    size = part.stat().st_size
+    if expected_size is not None and size != expected_size:
+        if size > expected_size:
+            part.unlink()
+
+        raise DownloadVerificationError(
+            f"{file_path.name}: downloaded {size} bytes, expected {expected_size}"
+        )
+
+    digest = hasher.hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        part.unlink()
+        raise DownloadVerificationError(
+            f"{file_path.name}: sha256 {digest} does not match {expected_sha256}"
+        )
+
+    os.replace(part, file_path)
+
+    return digest
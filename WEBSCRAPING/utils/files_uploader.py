@@ -5,6 +5,8 @@ from unidecode import unidecode
 from pathlib import Path
 from utils.files_remover import FilesRemover
 from g_drive_service import *
+from utils.rate_limiter import default_rate_limiter, DRIVE_HOST
+from utils.retry_policy import NETWORK_ERROR, classify_status
 
 PARENT_FOLDER_ID = "1vRRmyecRE71qKmHlmSbW29G1cPDj3E2t"
 
@@ -21,9 +23,40 @@ class FilesUploader:
     #     self.queue.put(file_info)
 
     def upload_file(
-        self, file_path: Path, folder_name: str, parent_folder_name: str = "", **kwargs
+        self,
+        file_path: Path,
+        folder_name: str,
+        parent_folder_name: str = "",
+        remove_local: bool = True,
+        **kwargs,
     ):
-        """Upload file to Google Drive. Thread safe by creating service on every call"""
+        """Upload file to Google Drive, going through the shared rate limiter of the Drive API host"""
+        status = None
+        error_kind = None
+        started = default_rate_limiter.acquire(DRIVE_HOST)
+        try:
+            return self.upload_file_unlimited(
+                file_path, folder_name, parent_folder_name, remove_local, **kwargs
+            )
+        except HttpError as error:
+            status = error.resp.status
+            error_kind = classify_status(status)
+            raise
+        except (ConnectionError, TimeoutError):
+            error_kind = NETWORK_ERROR
+            raise
+        finally:
+            default_rate_limiter.release(DRIVE_HOST, started, error_kind, status)
+
+    def upload_file_unlimited(
+        self,
+        file_path: Path,
+        folder_name: str,
+        parent_folder_name: str = "",
+        remove_local: bool = True,
+        **kwargs,
+    ):
+        """Upload file to Google Drive. Thread safe by creating service on every call. With `remove_local` the local file is deleted by the files remover after upload"""
         self.service = create_service()
 
         # try find parent folder id
@@ -63,13 +96,15 @@ class FilesUploader:
             if file_id is not None:
                 # update file and add it file remover's queue remove file from local
                 update_file(self.service, file_id, str(file_path), **kwargs)
-                self.files_remover.add_file_to_queue(file_path)
+                if remove_local:
+                    self.files_remover.add_file_to_queue(file_path)
 
                 return True
 
             # upload file and add it to file remover's queue remove file from local
             upload_file(self.service, str(file_path), folder_id, **kwargs)
-            self.files_remover.add_file_to_queue(file_path)
+            if remove_local:
+                self.files_remover.add_file_to_queue(file_path)
 
         except Exception as e:
             print(f"Error while uploading file {file_path}: {e}")
@@ -0,0 +1,68 @@
+import gzip
+from pathlib import Path
+from lxml import etree, html
+
+RAW_TEXT_DIR = "RAW_TEXT"  # raw text corpus folder, next to the documents
+CAPTURE_SUFFIX = ".html.gz"
+COMPRESS_LEVEL = 6  # close to the size of level 9 at a fraction of the cpu
+
+# elements without readable text
+DROP_TAGS = ("script", "style", "noscript", "head", "iframe", "object")
+
+# elements that start a new line of text
+BLOCK_TAGS = (
+    "p",
+    "div",
+    "br",
+    "li",
+    "tr",
+    "table",
+    "blockquote",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "pre",
+    "center",
+    "hr",
+)
+
+
+def extract_text(html_text: str) -> str:
+    """Readable text of an html document, one line per block element and whitespace normalized"""
+    root = html.document_fromstring(html_text)
+    etree.strip_elements(root, *DROP_TAGS, etree.Comment, with_tail=False)
+
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+
+    lines = (" ".join(line.split()) for line in root.text_content().splitlines())
+
+    return "\n".join(line for line in lines if line)
+
+
+def compress_html(html_text: str) -> bytes:
+    return gzip.compress(html_text.encode("utf-8"), COMPRESS_LEVEL)
+
+
+def read_capture(capture_path: Path) -> str:
+    """Html of a stored capture"""
+    with gzip.open(capture_path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def write_capture(html_text: str, output_dir: str, filename: str) -> tuple:
+    """Store compressed html as `{filename}.html.gz` and its text as `RAW_TEXT/{filename}.txt` in `output_dir`. Returns both paths"""
+    capture_path = Path(output_dir) / f"{filename}{CAPTURE_SUFFIX}"
+    text_path = Path(output_dir) / RAW_TEXT_DIR / f"{filename}.txt"
+    text_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(capture_path, "wb") as f:
+        f.write(compress_html(html_text))
+
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(extract_text(html_text))
+
+    return capture_path, text_path
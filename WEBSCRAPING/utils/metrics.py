@@ -0,0 +1,88 @@
+import time
+from threading import Lock
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread safe counters and timings shared by requesters, scrapers and helpers"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = Counter()
+        self.timings = {}  # name -> [count, total seconds, max seconds]
+        self.gauges = {}  # name -> last value
+
+    def increment(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set(self, name: str, value: float):
+        """Set gauge `name` to its current value"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration for `name`"""
+        with self.lock:
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Context manager that records the duration of its block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str) -> int:
+        with self.lock:
+            return self.counters[name]
+
+    def ratio(self, name: str, other: str) -> float:
+        """Ratio of counter `name` over the sum of `name` and `other`. Ex: hits / (hits + misses)"""
+        with self.lock:
+            total = self.counters[name] + self.counters[other]
+            return self.counters[name] / total if total else 0.0
+
+    def snapshot(self, prefix: str = "") -> dict:
+        """Copy of counters, gauges and timings, optionally filtered by name prefix"""
+        with self.lock:
+            counters = {
+                name: value
+                for name, value in self.counters.items()
+                if name.startswith(prefix)
+            }
+            gauges = {
+                name: value
+                for name, value in self.gauges.items()
+                if name.startswith(prefix)
+            }
+            timings = {
+                name: {"count": count, "total": total, "max": max_seconds}
+                for name, (count, total, max_seconds) in self.timings.items()
+                if name.startswith(prefix)
+            }
+
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+    def report(self, prefix: str = ""):
+        """Print counters, gauges and timings"""
+        snapshot = self.snapshot(prefix)
+        for name, value in sorted(
+            {**snapshot["counters"], **snapshot["gauges"]}.items()
+        ):
+            print(f"{name}: {value}")
+
+        for name, timing in sorted(snapshot["timings"].items()):
+            mean = timing["total"] / timing["count"] if timing["count"] else 0
+            print(
+                f"{name}: count={timing['count']} total={timing['total']:.2f}s mean={mean:.3f}s max={timing['max']:.3f}s"
+            )
+
+
+metrics = Metrics()
@@ -0,0 +1,198 @@
+import time
+import base64
+from queue import Queue
+from pathlib import Path
+from threading import Thread, Lock, Event
+from functools import partial
+from multiprocessing import cpu_count
+from utils.metrics import metrics
+from utils.selenium_helper import SeleniumHelper
+
+PRINT_OPTIONS = {"printBackground": True}
+
+
+class RenderTimeoutError(Exception):
+    """Render did not finish within the job timeout"""
+
+
+class RenderJob:
+    """Html string or url to be printed to `output_path`"""
+
+    def __init__(self, output_path: Path, html_str: str = None, url: str = None):
+        self.output_path = Path(output_path)
+        self.html_str = html_str
+        self.url = url
+        self.worker = None
+        self.started = Event()
+        self.done = Event()
+        self.cancelled = False
+        self.error = None
+
+
+class RenderWorker(Thread):
+    """Keeps a headless Chrome warm and prints jobs with CDP `Page.printToPDF`. The browser is recycled after `max_jobs` renders or when a job times out"""
+
+    def __init__(self, jobs: Queue, driver_factory, max_jobs: int):
+        Thread.__init__(self, daemon=True)
+        self.jobs = jobs
+        self.driver_factory = driver_factory
+        self.max_jobs = max_jobs
+        self.driver = None
+        self.job = None  # job being rendered
+        self.rendered = 0
+        self.lock = Lock()  # guards driver and job between render and kill
+
+    def start_driver(self):
+        with self.lock:
+            self.driver = self.driver_factory()
+            self.rendered = 0
+
+    def kill(self, job: RenderJob = None):
+        """Quit browser, aborting the job in progress. A new one is started for the next job. With `job`, only if that job is still the one in progress"""
+        with self.lock:
+            if job is not None and self.job is not job:
+                return
+
+            driver, self.driver = self.driver, None
+
+        if driver is not None:
+            try:
+                driver.get_driver().quit()
+            except Exception:
+                pass
+            metrics.increment("render.recycled")
+
+    def render(self, job: RenderJob):
+        driver = self.driver.get_driver()
+        if job.url:
+            driver.get(job.url)
+        else:
+            driver.get("about:blank")
+            frame_id = driver.execute_cdp_cmd("Page.getFrameTree", {})["frameTree"][
+                "frame"
+            ]["id"]
+            driver.execute_cdp_cmd(
+                "Page.setDocumentContent", {"frameId": frame_id, "html": job.html_str}
+            )
+
+        pdf = driver.execute_cdp_cmd("Page.printToPDF", PRINT_OPTIONS)
+
+        job.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(job.output_path, "wb") as f:
+            f.write(base64.b64decode(pdf["data"]))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+
+            with self.lock:
+                self.job = job
+            job.worker = self
+            job.started.set()
+            start = time.perf_counter()
+            try:
+                if self.driver is None:
+                    self.start_driver()
+
+                self.render(job)
+                metrics.increment("render.ok")
+                metrics.observe("render", time.perf_counter() - start)
+            except Exception as e:
+                job.error = e
+                if not job.cancelled:
+                    metrics.increment("render.failed")
+                # browser may be broken, start a fresh one for the next job
+                self.kill()
+            finally:
+                with self.lock:
+                    self.job = None
+                job.done.set()
+
+            self.rendered += 1
+            if self.rendered >= self.max_jobs:
+                self.kill()
+
+        self.kill()
+
+
+class PdfRenderer:
+    """Pool of warm headless Chrome renderers fed by a queue. Avoids starting a converter process per document, enforces a timeout per job and reports renders/sec"""
+
+    def __init__(
+        self,
+        workers: int = cpu_count(),
+        timeout: float = 60,
+        max_jobs_per_worker: int = 200,
+        driver_factory=partial(SeleniumHelper, blocking_profile="print-fidelity"),
+    ):
+        self.timeout = timeout
+        self.jobs = Queue()
+        self.workers = [
+            RenderWorker(self.jobs, driver_factory, max_jobs_per_worker)
+            for _ in range(workers)
+        ]
+        self.started_at = None
+        self.lock = Lock()
+
+    def start(self):
+        """Start workers. Browsers start in parallel, each in its worker thread"""
+        with self.lock:
+            if self.started_at is not None:
+                return
+
+            self.started_at = time.perf_counter()
+            for worker in self.workers:
+                worker.start()
+
+    def submit(
+        self, output_path: Path, html_str: str = None, url: str = None
+    ) -> RenderJob:
+        if not url and not html_str:
+            raise Exception("Either url or html_str must be provided")
+
+        self.start()
+        job = RenderJob(output_path, html_str, url)
+        self.jobs.put(job)
+
+        return job
+
+    def wait(self, job: RenderJob):
+        """Wait for job to finish. The timeout only counts once a worker took the job"""
+        job.started.wait()
+        if not job.done.wait(self.timeout):
+            job.cancelled = True
+            metrics.increment("render.timeout")
+            # the worker may have finished the job and started the next one meanwhile
+            job.worker.kill(job)
+            raise RenderTimeoutError(f"Render of {job.output_path} timed out")
+
+        if job.error is not None:
+            raise job.error
+
+    def render(self, output_path: Path, html_str: str = None, url: str = None) -> bool:
+        """Print html string or url to `output_path`. Blocks until done"""
+        self.wait(self.submit(output_path, html_str, url))
+
+        return True
+
+    def renders_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        return metrics.get("render.ok") / (time.perf_counter() - self.started_at)
+
+    def report(self):
+        print(f"Renderer: {self.renders_per_second():.2f} renders/s")
+        metrics.report("render")
+
+    def close(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+
+        if self.started_at is not None:
+            for worker in self.workers:
+                worker.join()
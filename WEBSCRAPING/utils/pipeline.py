@@ -0,0 +1,150 @@
+import time
+from queue import Queue
+from pathlib import Path
+from threading import Thread, Lock
+from dataclasses import dataclass, field
+from utils.metrics import metrics
+
+STOP = object()  # sentinel telling a stage worker there are no more items
+
+
+@dataclass
+class WorkItem:
+    """Document flowing through the scraping pipeline"""
+
+    url: str
+    filename: str  # without extension
+    output_dir: str
+    folder_name: str  # Google Drive folder
+    parent_folder_name: str = ""
+    mimetype: str = "application/pdf"
+    html: str = None  # set by fetch when the document must be rendered
+    output_path: Path = None  # set once the document is on disk
+    # extra files uploaded along with the document, `upload_file` kwargs of each
+    attachments: list = field(default_factory=list)
+    metadata: dict = field(default_factory=dict)
+
+
+class Stage:
+    """Pipeline stage: `workers` threads applying `func` to items from a bounded input queue. `func` returns the item for the next stage, or None to drop it"""
+
+    def __init__(self, name: str, func, workers: int = 1, queue_size: int = 100):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = Queue(maxsize=queue_size)  # full queue blocks upstream stage
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.busy_seconds = 0.0
+        self.lock = Lock()
+
+    def record(self, outcome: str, seconds: float):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.busy_seconds += seconds
+
+        metrics.increment(f"pipeline.{self.name}.{outcome}")
+        metrics.observe(f"pipeline.{self.name}", seconds)
+
+
+class Pipeline:
+    """Staged producer/consumer pipeline. Items produced by `discover` flow through the stages, each with its own workers, connected by bounded queues so a slow stage applies backpressure instead of piling items in memory"""
+
+    def __init__(self, discover, stages: list[Stage], on_error=None):
+        self.discover = discover  # callable returning an iterable of items
+        self.stages = stages
+        self.on_error = on_error  # callable(stage_name, item, exception)
+        self.discovered = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def produce(self):
+        first = self.stages[0]
+        try:
+            for item in self.discover():
+                self.discovered += 1
+                metrics.increment("pipeline.discover.processed")
+                first.queue.put(item)
+        except Exception as e:
+            print(f"Error while discovering items: {e}")
+            metrics.increment("pipeline.discover.failed")
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(STOP)
+
+    def report_error(self, stage_name: str, item, error: Exception):
+        """Call `on_error`, a failing handler (ex: database is locked) must not kill the worker"""
+        if not self.on_error:
+            return
+
+        try:
+            self.on_error(stage_name, item, error)
+        except Exception as e:
+            print(f"Error handler of stage {stage_name} failed: {e}")
+
+    def work(self, index: int, finished: list, lock: Lock):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        try:
+            while True:
+                item = stage.queue.get()
+                if item is STOP:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    result = stage.func(item)
+                except Exception as e:
+                    stage.record("failed", time.perf_counter() - start)
+                    self.report_error(stage.name, item, e)
+                    continue
+
+                if result is None:
+                    stage.record("dropped", time.perf_counter() - start)
+                    continue
+
+                stage.record("processed", time.perf_counter() - start)
+                if next_stage:
+                    next_stage.queue.put(result)
+        finally:
+            # last worker of this stage to finish stops the next stage, even if this one died
+            with lock:
+                finished[index] += 1
+                last = finished[index] == stage.workers
+
+            if last and next_stage:
+                for _ in range(next_stage.workers):
+                    next_stage.queue.put(STOP)
+
+    def run(self):
+        """Run until every discovered item went through all stages"""
+        self.started_at = time.perf_counter()
+        finished = [0] * len(self.stages)
+        lock = Lock()
+
+        threads = [Thread(target=self.produce, daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(
+                    Thread(target=self.work, args=(index, finished, lock), daemon=True)
+                )
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.finished_at = time.perf_counter()
+        self.report()
+
+    def report(self):
+        """Print items processed per stage and their throughput"""
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        print(f"Pipeline: {self.discovered} items discovered in {elapsed:.1f}s")
+        for stage in self.stages:
+            throughput = stage.processed / elapsed if elapsed else 0
+            print(
+                f"  {stage.name}: {stage.processed} processed, {stage.failed} failed, {stage.dropped} dropped | {throughput:.2f} items/s | {stage.workers} workers busy {stage.busy_seconds:.1f}s"
+            )
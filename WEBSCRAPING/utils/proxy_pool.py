@@ -0,0 +1,225 @@
+import time
+import random
+from pathlib import Path
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import build_opener, ProxyHandler
+from utils.metrics import metrics
+
+VALIDATE_URL = "https://legislacao.presidencia.gov.br/"
+VALIDATION_WORKERS = 16
+
+
+def normalize_proxy(proxy: str) -> str:
+    """Proxies are kept as `host:port`. Ex: 'https://94.142.27.4:3128' -> '94.142.27.4:3128'"""
+    return proxy.split("//")[-1].strip().rstrip("/")
+
+
+class ProxyStats:
+    """Measured health of a single proxy"""
+
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # exponentially weighted moving average, seconds
+        self.checked_at = 0.0
+
+    def record(self, ok: bool, latency: float = None):
+        self.checked_at = time.monotonic()
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else 0.7 * self.latency + 0.3 * latency
+                )
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    @property
+    def success_rate(self) -> float:
+        # laplace smoothing so new proxies are neither perfect nor dead
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self) -> float:
+        """Higher is better: success rate per second of latency"""
+        return self.success_rate / (self.latency if self.latency else 1.0)
+
+
+class ProxyPool(Thread):
+    """Background pool of proxies. Validates proxies against `validate_url`, ranks them by measured latency and success rate, evicts bad ones, refills from `source` when it runs low and keeps sticky proxies per session (cookie jar)"""
+
+    def __init__(
+        self,
+        source,
+        validate_url: str = VALIDATE_URL,
+        min_size: int = 5,
+        validate_interval: float = 60,
+        timeout: float = 5,
+        max_consecutive_failures: int = 3,
+        min_success_rate: float = 0.3,
+    ):
+        Thread.__init__(self, daemon=True)
+        self.source = source  # callable returning a list of proxies
+        self.validate_url = validate_url
+        self.min_size = min_size
+        self.validate_interval = validate_interval
+        self.timeout = timeout
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_success_rate = min_success_rate
+        self.proxies = {}  # proxy -> ProxyStats, validated proxies only
+        self.evicted = set()
+        self.sessions = {}  # session key -> proxy
+        self.lock = Lock()
+        self.stop = False
+
+    @classmethod
+    def from_file(cls, proxies_path: Path, **kwargs):
+        """Pool fed by a local proxy list, one `host:port` per line. Useful as a stand-in for tests"""
+
+        def read_proxies():
+            with open(proxies_path, "r") as f:
+                return [line.strip() for line in f if line.strip()]
+
+        return cls(read_proxies, **kwargs)
+
+    def validate(self, proxy: str) -> bool:
+        """Request `validate_url` through proxy and record the result"""
+        opener = build_opener(
+            ProxyHandler({"http": f"http://{proxy}", "https": f"http://{proxy}"})
+        )
+        start = time.perf_counter()
+        try:
+            with opener.open(self.validate_url, timeout=self.timeout) as response:
+                response.read(1024)
+            ok = True
+        except Exception:
+            ok = False
+
+        self.report(proxy, ok, time.perf_counter() - start, validation=True)
+        metrics.increment(f"proxy.validation_{'ok' if ok else 'failed'}")
+
+        return ok
+
+    def refill(self):
+        """Validate new proxies from source until the pool has `min_size` proxies"""
+        try:
+            candidates = [normalize_proxy(proxy) for proxy in self.source()]
+        except Exception as e:
+            print(f"Error while getting proxies: {e}")
+            return
+
+        with self.lock:
+            candidates = [
+                proxy
+                for proxy in candidates
+                if proxy not in self.proxies and proxy not in self.evicted
+            ]
+
+        # validate candidates in parallel batches, a dead proxy costs a full timeout
+        random.shuffle(candidates)
+        with ThreadPoolExecutor(max_workers=VALIDATION_WORKERS) as executor:
+            for start in range(0, len(candidates), VALIDATION_WORKERS):
+                if len(self) >= self.min_size or self.stop:
+                    break
+
+                batch = candidates[start : start + VALIDATION_WORKERS]
+                list(executor.map(self.validate, batch))
+
+        metrics.increment("proxy.refills")
+
+    def revalidate(self):
+        """Validate pool proxies not checked in the last `validate_interval` seconds"""
+        now = time.monotonic()
+        with self.lock:
+            stale = [
+                stats.proxy
+                for stats in self.proxies.values()
+                if now - stats.checked_at >= self.validate_interval
+            ]
+
+        for proxy in stale:
+            if self.stop:
+                break
+            self.validate(proxy)
+
+    def report(
+        self, proxy: str, ok: bool, latency: float = None, validation: bool = False
+    ):
+        """Record the outcome of a request through proxy. Unhealthy proxies are evicted"""
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if stats is None:
+                if not (validation and ok):
+                    # unknown proxies only join the pool after a successful validation
+                    if validation:
+                        self.evicted.add(proxy)
+                    return
+
+                stats = self.proxies[proxy] = ProxyStats(proxy)
+
+            stats.record(ok, latency)
+
+            if (
+                stats.consecutive_failures >= self.max_consecutive_failures
+                or stats.success_rate < self.min_success_rate
+            ):
+                self.evict(proxy)
+
+    def evict(self, proxy: str):
+        """Not thread safe, call with lock"""
+        self.proxies.pop(proxy, None)
+        self.evicted.add(proxy)
+        self.sessions = {
+            key: session_proxy
+            for key, session_proxy in self.sessions.items()
+            if session_proxy != proxy
+        }
+        metrics.increment("proxy.evicted")
+
+    def get(self, session_key=None) -> str:
+        """Get a proxy, `host:port`, or None if the pool is empty. Proxies are picked at random among the best ranked ones and stick to `session_key` while healthy"""
+        with self.lock:
+            if session_key is not None and session_key in self.sessions:
+                metrics.increment("proxy.sticky")
+                return self.sessions[session_key]
+
+            ranked = sorted(
+                self.proxies.values(), key=lambda stats: stats.score, reverse=True
+            )
+            if not ranked:
+                metrics.increment("proxy.empty")
+                return None
+
+            proxy = random.choice(ranked[: max(1, len(ranked) // 4)]).proxy
+            if session_key is not None:
+                self.sessions[session_key] = proxy
+
+            return proxy
+
+    def release_session(self, session_key):
+        """Forget the sticky proxy of a session, the next `get` picks a new one"""
+        with self.lock:
+            self.sessions.pop(session_key, None)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.proxies)
+
+    def run(self):
+        while not self.stop:
+            try:
+                if len(self) < self.min_size:
+                    self.refill()
+
+                self.revalidate()
+            except Exception as e:
+                print(f"Error while validating proxies: {e}")
+
+            time.sleep(1)
@@ -0,0 +1,217 @@
+import time
+import asyncio
+from threading import Lock
+from utils.metrics import metrics
+from utils.retry_policy import SERVER_ERROR, NETWORK_ERROR
+
+DRIVE_HOST = "www.googleapis.com"
+THROTTLE_STATUS = {429, 503}
+WAIT_INTERVAL = 0.05  # seconds between checks while waiting for a free request slot
+
+
+class TokenBucket:
+    """Token bucket: allows `rate` requests per second on average with bursts of up to `capacity` requests"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take a token. Returns 0 if taken, or seconds until a token is available. Not thread safe"""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+
+class AIMDController:
+    """Additive increase / multiplicative decrease concurrency limit. The limit grows by one every `limit` healthy responses and is multiplied by `decrease_factor` on 5xx, throttling, timeouts or latency above `latency_tolerance` times the best latency seen"""
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 3.0,
+        cooldown: float = 2.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        # min seconds between decreases, so a burst of errors counts once
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.min_latency = None
+        self.latency_ewma = None
+        self.decreased_at = 0.0
+
+    def try_acquire(self) -> bool:
+        """Not thread safe"""
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+
+        return False
+
+    def release(self, latency: float, overloaded: bool) -> str:
+        """Not thread safe. Returns 'increase', 'decrease' or None"""
+        self.in_flight -= 1
+
+        if not overloaded:
+            self.min_latency = (
+                latency if self.min_latency is None else min(self.min_latency, latency)
+            )
+            self.latency_ewma = (
+                latency
+                if self.latency_ewma is None
+                else 0.8 * self.latency_ewma + 0.2 * latency
+            )
+            overloaded = (
+                self.latency_ewma > self.latency_tolerance * self.min_latency
+                and self.latency_ewma > 0.5  # ignore jitter of very fast responses
+            )
+
+        if overloaded:
+            now = time.monotonic()
+            if now - self.decreased_at < self.cooldown:
+                return None
+
+            self.decreased_at = now
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            return "decrease"
+
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            return "increase"
+
+        return None
+
+
+class HostRateLimiter:
+    """Per host token bucket and AIMD concurrency controller, shared by every `Requester` and the Drive uploads so all threads respect the capacity of each host"""
+
+    def __init__(
+        self,
+        rate: float = 10,
+        capacity: float = None,
+        initial_limit: int = 4,
+        max_limit: int = 64,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.hosts = {}  # host -> (TokenBucket, AIMDController)
+        self.lock = Lock()
+
+    def configure(
+        self,
+        host: str,
+        rate: float = None,
+        capacity: float = None,
+        initial_limit: int = None,
+        max_limit: int = None,
+    ):
+        """Override the defaults of a single host"""
+        with self.lock:
+            self.hosts[host] = (
+                TokenBucket(rate or self.rate, capacity or self.capacity),
+                AIMDController(
+                    initial_limit=initial_limit or self.initial_limit,
+                    max_limit=max_limit or self.max_limit,
+                ),
+            )
+
+    def host_state(self, host: str):
+        """Not thread safe, call with lock"""
+        if host not in self.hosts:
+            self.hosts[host] = (
+                TokenBucket(self.rate, self.capacity),
+                AIMDController(
+                    initial_limit=self.initial_limit, max_limit=self.max_limit
+                ),
+            )
+
+        return self.hosts[host]
+
+    def try_acquire(self, host: str) -> float:
+        """Take a request slot for host. Returns 0 if taken or seconds to wait before trying again"""
+        with self.lock:
+            bucket, controller = self.host_state(host)
+            if not controller.try_acquire():
+                return WAIT_INTERVAL
+
+            wait = bucket.try_take()
+            if wait:
+                controller.in_flight -= 1
+
+            return wait
+
+    def acquire(self, host: str) -> float:
+        """Wait for a request slot for host. Returns start time to be passed to `release`"""
+        start = time.perf_counter()
+        while True:
+            wait = self.try_acquire(host)
+            if not wait:
+                break
+            time.sleep(wait)
+
+        now = time.perf_counter()
+        metrics.observe("ratelimit.wait", now - start)
+        return now
+
+    async def acquire_async(self, host: str) -> float:
+        """Same as `acquire`, without blocking the event loop"""
+        start = time.perf_counter()
+        while True:
+            wait = self.try_acquire(host)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+
+        now = time.perf_counter()
+        metrics.observe("ratelimit.wait", now - start)
+        return now
+
+    def release(
+        self,
+        host: str,
+        started: float,
+        error_kind: str = None,
+        status=None,
+        headers_at: float = None,
+    ):
+        """Release slot taken at `started`. 5xx, throttling and network errors shrink the host concurrency, healthy responses grow it. Streamed downloads pass `headers_at`, the time their response headers arrived, so the body transfer time is not taken for server latency"""
+        latency = (headers_at or time.perf_counter()) - started
+        overloaded = (
+            error_kind in (SERVER_ERROR, NETWORK_ERROR) or status in THROTTLE_STATUS
+        )
+        with self.lock:
+            _, controller = self.host_state(host)
+            change = controller.release(latency, overloaded)
+            limit = controller.limit
+
+        if change:
+            metrics.increment(f"ratelimit.{change}")
+            metrics.set(f"ratelimit.{host}.limit", int(limit))
+
+    def concurrency_limit(self, host: str) -> int:
+        """Current number of requests allowed in flight for host"""
+        with self.lock:
+            _, controller = self.host_state(host)
+            return int(controller.limit)
+
+
+default_rate_limiter = HostRateLimiter()
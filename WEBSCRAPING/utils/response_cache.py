@@ -0,0 +1,302 @@
+import time
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from urllib.parse import urlencode
+from threading import Lock
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from utils.metrics import metrics
+
+CACHE_PATH = Path("cache") / "responses.sqlite"
+
+
+@dataclass
+class CachedResponse:
+    key: str
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+    etag: str
+    last_modified: str
+    stored_at: float
+
+
+def cache_control(headers: dict) -> dict:
+    """Directives of the Cache-Control header, ex: {"max-age": "60", "no-store": None}"""
+    directives = {}
+    for directive in headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+
+    return directives
+
+
+def freshness_lifetime(headers: dict, stored_at: float) -> float:
+    """Seconds the server allows a response to be served without revalidation, 0 if it didn't say"""
+    directives = cache_control(headers)
+    if "no-cache" in directives:
+        return 0
+
+    if (directives.get("max-age") or "").isdigit():
+        return int(directives["max-age"])
+
+    try:
+        expires = parsedate_to_datetime(headers["expires"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+    return max(0, expires - stored_at)
+
+
+class ResponseCache:
+    """On-disk HTTP response cache, keyed by method + url + body. Only responses with validators or a freshness lifetime are stored, `Cache-Control: no-store` is honoured. Stores ETag/Last-Modified so stale entries are revalidated with conditional requests, and evicts least recently used entries when the cache grows over `max_size` bytes. Thread and process safe (SQLite)"""
+
+    def __init__(
+        self,
+        cache_path: Path = CACHE_PATH,
+        max_size: int = 2 * 1024**3,
+        max_age: float = 0,
+    ):
+        self.cache_path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.max_age = max_age  # seconds an entry is served without revalidation
+        self.lock = Lock()
+
+        self.connection = sqlite3.connect(
+            self.cache_path, check_same_thread=False, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL,
+                accessed_at REAL
+            )""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self.connection.commit()
+        self.total_size = self.size()
+
+    @staticmethod
+    def make_key(method: str, url: str, data=None) -> str:
+        if isinstance(data, dict):
+            data = urlencode(data)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        hasher = hashlib.sha256(f"{method.upper()} {url}\n".encode("utf-8"))
+        hasher.update(data or b"")
+
+        return hasher.hexdigest()
+
+    def get(self, method: str, url: str, data=None) -> CachedResponse:
+        """Get cached response or None"""
+        key = self.make_key(method, url, data)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self.connection.commit()
+
+        url, status, headers, body, etag, last_modified, stored_at = row
+        return CachedResponse(
+            key, url, status, json.loads(headers), body, etag, last_modified, stored_at
+        )
+
+    def is_fresh(self, cached: CachedResponse) -> bool:
+        lower_headers = {name.lower(): value for name, value in cached.headers.items()}
+        lifetime = max(
+            self.max_age, freshness_lifetime(lower_headers, cached.stored_at)
+        )
+
+        return time.time() - cached.stored_at < lifetime
+
+    def is_cacheable(self, headers: dict) -> bool:
+        """Responses are stored only if they can be served later: they have validators or a freshness lifetime, and `no-store` is not set. `headers` has lower case names"""
+        if "no-store" in cache_control(headers):
+            return False
+
+        return bool(
+            headers.get("etag")
+            or headers.get("last-modified")
+            or self.max_age > 0
+            or freshness_lifetime(headers, time.time()) > 0
+        )
+
+    def conditional_headers(self, cached: CachedResponse) -> dict:
+        """Headers that turn a request into a conditional one. Empty if the response had no validators"""
+        headers = {}
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        return headers
+
+    def lookup(self, method: str, url: str, data=None):
+        """Returns (cached response or None, extra request headers or None if cached response is fresh)"""
+        cached = self.get(method, url, data)
+        if cached is None:
+            metrics.increment("cache.miss")
+            return None, {}
+
+        if self.is_fresh(cached):
+            metrics.increment("cache.hit")
+            return cached, None
+
+        conditional = self.conditional_headers(cached)
+        if not conditional:
+            # can't revalidate, treat as a miss
+            metrics.increment("cache.miss")
+
+        return cached, conditional
+
+    def revalidated(self, cached: CachedResponse, headers=None) -> bytes:
+        """Server answered 304: refresh entry and return cached body"""
+        metrics.increment("cache.revalidated")
+
+        etag = headers.get("ETag") if headers else None
+        last_modified = headers.get("Last-Modified") if headers else None
+        with self.lock:
+            self.connection.execute(
+                "UPDATE responses SET stored_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE key = ?",
+                (time.time(), etag, last_modified, cached.key),
+            )
+            self.connection.commit()
+
+        return cached.body
+
+    def store(
+        self,
+        method: str,
+        url: str,
+        data,
+        status: int,
+        headers,
+        body: bytes,
+        previous: CachedResponse = None,
+    ):
+        """Store response if it can be served later (see `is_cacheable`). `headers` is any header mapping, `previous` the stale entry that was revalidated, if any"""
+        if previous is not None and self.conditional_headers(previous):
+            # conditional request answered with a new body
+            metrics.increment("cache.changed")
+
+        key = self.make_key(method, url, data)
+        now = time.time()
+        headers = dict(headers)
+        lower_headers = {name.lower(): value for name, value in headers.items()}
+        if not self.is_cacheable(lower_headers):
+            metrics.increment("cache.not_stored")
+            if previous is not None:
+                # stale entry would never be served again
+                self.delete(key)
+            return
+
+        with self.lock:
+            old_size = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.total_size += len(body) - (old_size[0] if old_size else 0)
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    status,
+                    json.dumps(headers),
+                    body,
+                    len(body),
+                    lower_headers.get("etag"),
+                    lower_headers.get("last-modified"),
+                    now,
+                    now,
+                ),
+            )
+            self.connection.commit()
+
+        metrics.increment("cache.stored")
+        self.evict()
+
+    def delete(self, key: str):
+        with self.lock:
+            old_size = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if old_size is None:
+                return
+
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.connection.commit()
+            self.total_size -= old_size[0]
+
+    def size(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in `max_size`"""
+        if self.total_size <= self.max_size:
+            return
+
+        # other processes may share the cache file, so use the real size
+        self.total_size = self.size()
+        excess = self.total_size - self.max_size
+        if excess <= 0:
+            return
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"
+            )
+            keys = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                keys.append((key,))
+                excess -= size
+
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+            self.connection.commit()
+            self.total_size = self.max_size + excess
+
+        metrics.increment("cache.evicted", len(keys))
+
+    def hit_ratio(self) -> float:
+        """Share of lookups answered from the cache, either fresh or revalidated with a 304"""
+        hits = metrics.get("cache.hit") + metrics.get("cache.revalidated")
+        total = hits + metrics.get("cache.miss") + metrics.get("cache.changed")
+
+        return hits / total if total else 0.0
+
+    def report(self):
+        print(
+            f"Cache: {self.hit_ratio():.1%} hit ratio | {self.size() / 1024**2:.1f} MB"
+        )
+        metrics.report("cache.")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
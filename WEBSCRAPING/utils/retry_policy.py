@@ -0,0 +1,224 @@
+import time
+import random
+from threading import Lock
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from utils.metrics import metrics
+
+CLIENT_ERROR = "client_error"  # 4xx
+SERVER_ERROR = "server_error"  # 5xx
+NETWORK_ERROR = "network_error"  # connection refused/reset, dns, timeouts
+VERIFICATION_ERROR = "verification_error"  # bad downloaded size/checksum
+
+# 4xx statuses that are worth retrying (timeouts and throttling)
+RETRYABLE_CLIENT_STATUS = {408, 425, 429}
+
+
+class RequestFailedError(Exception):
+    """Raised when a request failed and the retry policy decided to give up"""
+
+    def __init__(self, url: str, error_kind: str, status: int = None):
+        super().__init__(f"Request to {url} failed ({error_kind}, status={status})")
+        self.url = url
+        self.error_kind = error_kind
+        self.status = status
+
+
+class CircuitOpenError(RequestFailedError):
+    """Raised when the circuit breaker of the request host is open"""
+
+    def __init__(self, url: str, host: str):
+        super().__init__(url, "circuit_open")
+        self.host = host
+
+
+def classify_status(status: int) -> str:
+    """Classify HTTP error status as client or server error"""
+    return CLIENT_ERROR if 400 <= status < 500 else SERVER_ERROR
+
+
+def parse_retry_after(value: str) -> float:
+    """Parse Retry-After header, which is either seconds or an HTTP date. Returns seconds to wait or None"""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+def full_jitter_backoff(attempt: int, base: float = 1, cap: float = 60) -> float:
+    """Exponential backoff with full jitter: random value in [0, min(cap, base * 2 ** attempt)]"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitBreaker:
+    """Circuit breaker of a single host. Opens after `failure_threshold` consecutive failures, rejecting requests for `reset_timeout` seconds. Then lets a single probe request through (half open) and closes again if the host answers it, a probe without outcome is replaced after `reset_timeout` seconds"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self, host: str, failure_threshold: int = 5, reset_timeout: float = 60
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self.lock = Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            now = time.monotonic()
+            if (
+                self.state == self.OPEN and now - self.opened_at >= self.reset_timeout
+            ) or (
+                # probe never reported back (ex: uncaught exception), let another one through
+                self.state == self.HALF_OPEN
+                and now - self.probe_at >= self.reset_timeout
+            ):
+                # let this request probe the host, others keep being rejected
+                self.state = self.HALF_OPEN
+                self.probe_at = now
+                metrics.increment("circuit.half_open")
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                metrics.increment("circuit.closed")
+                print(f"Circuit breaker closed for {self.host}")
+
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_answer(self):
+        """Host answered, but the request failed for its own reasons (plain 4xx, bad content). Closes a half open circuit, consecutive failures count is kept otherwise"""
+        with self.lock:
+            if self.state != self.HALF_OPEN:
+                return
+
+            metrics.increment("circuit.closed")
+            print(f"Circuit breaker closed for {self.host}")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                metrics.increment("circuit.opened")
+                print(
+                    f"Circuit breaker opened for {self.host} after {self.failures} failures"
+                )
+
+
+class RetryPolicy:
+    """Retry decisions for scraper I/O: classifies failures, caps attempts, computes exponential backoff with jitter honouring Retry-After and keeps one circuit breaker per host, shared by every requester using this policy"""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        backoff_base: float = 1,
+        backoff_max: float = 60,
+        retry_client_errors: bool = False,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_client_errors = retry_client_errors
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(
+                    host, self.failure_threshold, self.reset_timeout
+                )
+
+            return self.breakers[host]
+
+    def before_attempt(self, url: str, host: str):
+        """Raise `CircuitOpenError` if host is failing, so callers stop hammering it"""
+        if not self.breaker(host).allow_request():
+            metrics.increment("retry.circuit_rejected")
+            raise CircuitOpenError(url, host)
+
+        metrics.increment("retry.attempts")
+
+    def record_success(self, host: str):
+        metrics.increment("retry.success")
+        self.breaker(host).record_success()
+
+    def is_retryable(self, error_kind: str, status: int = None) -> bool:
+        if error_kind == CLIENT_ERROR:
+            return self.retry_client_errors or status in RETRYABLE_CLIENT_STATUS
+
+        return True
+
+    def next_delay(
+        self,
+        host: str,
+        attempt: int,
+        error_kind: str,
+        status: int = None,
+        retry_after: float = None,
+    ) -> float:
+        """Record failed `attempt` (0 based) and return seconds to wait before the next one, or None to give up"""
+        metrics.increment(f"retry.{error_kind}")
+
+        # plain 4xx or bad content means the request itself is wrong, the host is healthy
+        if (
+            error_kind in (SERVER_ERROR, NETWORK_ERROR)
+            or status in RETRYABLE_CLIENT_STATUS
+        ):
+            self.breaker(host).record_failure()
+        else:
+            self.breaker(host).record_answer()
+
+        if not self.is_retryable(error_kind, status):
+            metrics.increment("retry.not_retryable")
+            return None
+
+        if attempt + 1 >= self.max_attempts:
+            metrics.increment("retry.gave_up")
+            return None
+
+        delay = full_jitter_backoff(attempt, self.backoff_base, self.backoff_max)
+        if retry_after is not None:
+            metrics.increment("retry.retry_after")
+            delay = max(delay, retry_after)
+
+        metrics.increment("retry.retried")
+        return delay
+
+
+default_retry_policy = RetryPolicy()
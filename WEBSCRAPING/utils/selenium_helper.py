@@ -4,15 +4,84 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import TimeoutException
 
 # from webdriver_manager.chrome import ChromeDriverManager
 # from undetected_chromedriver import Chrome
 
-from threading import Thread
+from threading import Thread, Lock
+from queue import Queue, Empty
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from utils.metrics import metrics
 import time
 import json
 
 USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.50 Safari/537.36'
+WAIT_POLL_FREQUENCY = 0.1  # seconds between two checks of a wait condition
+NETWORK_IDLE_TIME = 0.5  # seconds without finished requests to consider the network idle
+
+# document state and end time of the last finished request, from the resource timing api
+NETWORK_STATE_SCRIPT = """
+const ends = performance.getEntriesByType('resource').map(entry => entry.responseEnd);
+return [document.readyState, performance.now(), Math.max(0, ...ends)];
+"""
+
+# bytes transferred by the current page: document and every finished subresource
+PAGE_BYTES_SCRIPT = """
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return entries.reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
+
+ANALYTICS_URLS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*hotjar.com*",
+    "*facebook.net*",
+    "*vlibras.gov.br*",
+    "*barra.sistema.gov.br*",
+]
+MEDIA_URLS = ["*.mp4*", "*.webm*", "*.mp3*", "*youtube.com*"]
+
+# url patterns blocked with CDP Network.setBlockedURLs
+BLOCKING_PROFILES = {
+    "none": [],
+    # only html and scripts, for pages that are read or scraped
+    "text-only": ANALYTICS_URLS + MEDIA_URLS + [
+        "*.css*",
+        "*.png*",
+        "*.jpg*",
+        "*.jpeg*",
+        "*.gif*",
+        "*.webp*",
+        "*.svg*",
+        "*.ico*",
+        "*.woff*",
+        "*.ttf*",
+        "*.otf*",
+        "*.eot*",
+    ],
+    # keeps styles, images and fonts, for pages printed to pdf
+    "print-fidelity": ANALYTICS_URLS + MEDIA_URLS,
+}
+
+
+def report_pages():
+    """Print pages loaded, KB per page and load time per blocking profile"""
+    snapshot = metrics.snapshot("page.")
+    for profile in BLOCKING_PROFILES:
+        pages = snapshot["counters"].get(f"page.{profile}.loaded", 0)
+        if not pages:
+            continue
+
+        kilobytes = snapshot["counters"].get(f"page.{profile}.bytes", 0) / 1024
+        timing = snapshot["timings"][f"page.{profile}"]
+        print(
+            f"Profile {profile}: {pages} pages | {kilobytes / pages:.1f} KB/page | {timing['total'] / timing['count']:.2f}s/page"
+        )
+
 
 class CloseDriverThread(Thread):
     def __init__(self, driver):
@@ -46,6 +115,7 @@ class SeleniumHelper:
                 }
             ),
         },
+        blocking_profile: str = "none",
     ):
         self.options = options
         self.chrome_options = None
@@ -53,11 +123,15 @@ class SeleniumHelper:
         self.set_options(self.options)
         self.close_driver_thread = CloseDriverThread(self.driver)
         self.actions = ActionChains(self.driver)
+        self.set_blocking_profile(blocking_profile)
+        # pages loaded by `get`, callers add pages loaded by clicking links
+        self.page_loads = 0
 
     def set_driver(self):
         self.driver = webdriver.Chrome(options=self.chrome_options) # type: ignore
         self.close_driver_thread = CloseDriverThread(self.driver)
         self.actions = ActionChains(self.driver)
+        self.set_blocking_profile(self.blocking_profile)
         
 
     def set_options(self, options: dict, headless: bool = True, **kwargs):
@@ -88,12 +162,43 @@ class SeleniumHelper:
         else:
             self.driver.options = self.chrome_options
 
+    def set_blocking_profile(self, profile: str):
+        """Block requests matching the url patterns of a BLOCKING_PROFILES profile"""
+        if profile not in BLOCKING_PROFILES:
+            raise Exception(f"Blocking profile must be one of {list(BLOCKING_PROFILES)}")
+
+        self.blocking_profile = profile
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKING_PROFILES[profile]})
+
     def get(self, url: str):
+        start = time.perf_counter()
         self.driver.get(url)
+        self.page_loads += 1
+        self.record_page(time.perf_counter() - start)
+
+    def record_page(self, seconds: float):
+        """Record load time and bytes transferred of the current page under its blocking profile"""
+        try:
+            transferred = self.driver.execute_script(PAGE_BYTES_SCRIPT)
+        except Exception:
+            return
+
+        metrics.increment(f"page.{self.blocking_profile}.loaded")
+        metrics.increment(f"page.{self.blocking_profile}.bytes", transferred)
+        metrics.observe(f"page.{self.blocking_profile}", seconds)
 
     def get_driver(self):
         return self.driver
 
+    def is_alive(self) -> bool:
+        """Check if browser is still running and reachable"""
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
     def click(self, by, value):
         self.driver.find_element(by, value).click()
 
@@ -105,23 +210,236 @@ class SeleniumHelper:
         self.actions.move_to_element(element).click().send_keys(Keys.CONTROL + "a").send_keys(Keys.DELETE).perform()
         self.actions.move_to_element(element).click().send_keys(text).perform()
     
-    def wait_element_to_be_clickable(self, by, value, timeout: int = 5):
-        WebDriverWait(self.driver, timeout).until(
-            EC.element_to_be_clickable((by, value))
-        )
+    def wait_element_to_be_clickable(self, by, value, timeout: int = 5, replaces: float = 0):
+        self.wait("element_clickable", EC.element_to_be_clickable((by, value)), timeout, replaces)
         
-    def wait_element_to_be_visible(self, by, value, timeout: int = 5):
-        WebDriverWait(self.driver, timeout).until(
-            EC.visibility_of_element_located((by, value))
-        )
+    def wait_element_to_be_visible(self, by, value, timeout: int = 5, replaces: float = 0):
+        self.wait("element_visible", EC.visibility_of_element_located((by, value)), timeout, replaces)
     
     def wait_number_of_windows_to_be(self, number: int, timeout: int = 5):
-        WebDriverWait(self.driver, timeout).until(EC.number_of_windows_to_be(number))
+        self.wait("number_of_windows", EC.number_of_windows_to_be(number), timeout)
 
     def wait_frame_to_be_available_and_switch_to_it(self, by, value, timeout: int = 5):
-        WebDriverWait(self.driver, timeout).until(
-            EC.frame_to_be_available_and_switch_to_it((by, value))
+        self.wait("frame_available", EC.frame_to_be_available_and_switch_to_it((by, value)), timeout)
+
+    def wait(self, name: str, condition, timeout: float = 10, replaces: float = 0):
+        """Wait until `condition(driver)` is truthy, polling every WAIT_POLL_FREQUENCY seconds. Wait duration is recorded as `wait.{name}`, `replaces` is the fixed sleep this wait replaced, the difference is added to `wait.saved_seconds`"""
+        start = time.perf_counter()
+        try:
+            return WebDriverWait(self.driver, timeout, WAIT_POLL_FREQUENCY).until(condition)
+        except TimeoutException:
+            metrics.increment(f"wait.{name}.timeout")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe(f"wait.{name}", elapsed)
+            if replaces:
+                metrics.increment("wait.saved_seconds", replaces - elapsed)
+
+    def wait_document_ready(self, timeout: float = 10, replaces: float = 0):
+        self.wait(
+            "document_ready",
+            lambda driver: driver.execute_script("return document.readyState") == "complete",
+            timeout,
+            replaces,
+        )
+
+    def wait_element_present(self, by, value, timeout: float = 10, replaces: float = 0):
+        return self.wait(
+            "element_present", EC.presence_of_element_located((by, value)), timeout, replaces
+        )
+
+    def wait_element_absent(self, by, value, timeout: float = 10, replaces: float = 0):
+        self.wait(
+            "element_absent", lambda driver: not driver.find_elements(by, value), timeout, replaces
+        )
+
+    def wait_element_stale(self, element, timeout: float = 10, replaces: float = 0):
+        """Wait for `element` to be removed from the DOM, ex: page navigated away"""
+        self.wait("element_stale", EC.staleness_of(element), timeout, replaces)
+
+    def wait_new_window(self, handles: list, timeout: float = 10, replaces: float = 0) -> str:
+        """Wait for a window that is not in `handles` to open and return its handle"""
+        return self.wait(
+            "new_window",
+            lambda driver: next((h for h in driver.window_handles if h not in handles), False),
+            timeout,
+            replaces,
         )
 
+    def wait_network_idle(
+        self, idle_time: float = NETWORK_IDLE_TIME, timeout: float = 10, replaces: float = 0
+    ):
+        """Wait for document to be loaded and no request to finish for `idle_time` seconds. Quiet time is counted from the call at the earliest, so requests started by a click just before it are waited for"""
+        since = []  # page time of the first check
+
+        def network_idle(driver):
+            ready_state, now, last_response_end = driver.execute_script(NETWORK_STATE_SCRIPT)
+            # page time restarts when the page navigates
+            if not since or now < since[0]:
+                since[:] = [now]
+
+            return ready_state == "complete" and now - max(last_response_end, since[0]) >= idle_time * 1000
+
+        self.wait("network_idle", network_idle, timeout, replaces)
+
     def close(self):
+        # threads can only be started once, a driver closed again needs a new one
+        self.close_driver_thread = CloseDriverThread(self.driver)
         self.close_driver_thread.start()
+
+
+class BrowserPool:
+    """Pool of headless Chrome instances leased to worker threads. Browsers are started in parallel, health checked on lease and recycled after `max_pages` pages or when their JS heap grows over `max_memory_mb`. The pool has `size` slots: a slot whose browser failed to start stays in the pool, empty, and its browser is started again on the next lease"""
+
+    def __init__(
+        self,
+        size: int = cpu_count(),
+        max_pages: int = 100,
+        max_memory_mb: float = 512,
+        driver_factory=SeleniumHelper,
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.driver_factory = driver_factory
+        self.idle = Queue()  # idle browsers, and None for each empty slot
+        self.pages = {}  # pages loaded by each browser since it was started
+        self.started = False
+        self.closed = False
+        self.lock = Lock()
+
+    def new_browser(self) -> SeleniumHelper:
+        browser = self.driver_factory()
+        try:
+            # needed by Performance.getMetrics
+            browser.get_driver().execute_cdp_cmd("Performance.enable", {})
+        except Exception:
+            pass
+
+        with self.lock:
+            self.pages[browser] = 0
+        metrics.increment("browser_pool.started")
+
+        return browser
+
+    def start(self):
+        """Start all browsers in parallel, each browser takes seconds to launch"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+
+        with ThreadPoolExecutor(self.size) as executor:
+            for browser in executor.map(lambda _: self.try_new_browser(), range(self.size)):
+                self.idle.put(browser)
+
+    def try_new_browser(self) -> SeleniumHelper:
+        """New browser, None if it failed to start"""
+        try:
+            return self.new_browser()
+        except Exception as e:
+            print(f"Failed to start browser: {e}")
+            metrics.increment("browser_pool.start_failed")
+            return None
+
+    def quit(self, browser: SeleniumHelper):
+        with self.lock:
+            self.pages.pop(browser, None)
+
+        try:
+            browser.get_driver().quit()
+        except Exception:
+            pass
+
+    def memory_mb(self, browser: SeleniumHelper) -> float:
+        """JS heap used by the browser page, from CDP Performance.getMetrics"""
+        result = browser.get_driver().execute_cdp_cmd("Performance.getMetrics", {})
+        for metric in result["metrics"]:
+            if metric["name"] == "JSHeapUsedSize":
+                return metric["value"] / 1024 / 1024
+
+        return 0.0
+
+    def recycle(self, browser: SeleniumHelper) -> SeleniumHelper:
+        """Replace browser with a fresh one. None if it failed to start, the slot is empty"""
+        self.quit(browser)
+        metrics.increment("browser_pool.recycled")
+
+        return self.try_new_browser()
+
+    def needs_recycle(self, browser: SeleniumHelper) -> bool:
+        if self.pages.get(browser, 0) >= self.max_pages:
+            return True
+
+        try:
+            return self.memory_mb(browser) > self.max_memory_mb
+        except Exception:
+            # browser not answering CDP commands
+            return True
+
+    def lease(self, timeout: float = None) -> SeleniumHelper:
+        """Take an idle browser, waiting up to `timeout` seconds for one to be released. Dead browsers are replaced and empty slots get a new browser before being leased"""
+        self.start()
+
+        start = time.perf_counter()
+        try:
+            browser = self.idle.get(timeout=timeout)
+        except Empty:
+            raise Exception(f"No browser released within {timeout}s")
+        metrics.observe("browser_pool.lease", time.perf_counter() - start)
+
+        if browser is not None and not browser.is_alive():
+            metrics.increment("browser_pool.dead")
+            self.quit(browser)
+            browser = None
+
+        if browser is None:
+            try:
+                browser = self.new_browser()
+            except Exception:
+                # give the slot back, empty, so the pool keeps its size
+                self.idle.put(None)
+                raise
+
+        return browser
+
+    def release(self, browser: SeleniumHelper, pages: int = 1, broken: bool = False):
+        """Give browser back to the pool after loading `pages` pages. A `broken` browser is replaced"""
+        with self.lock:
+            self.pages[browser] = self.pages.get(browser, 0) + pages
+
+        if self.closed:
+            self.quit(browser)
+            return
+
+        if broken or self.needs_recycle(browser):
+            # None if the new browser failed to start, it is started again on the next lease
+            browser = self.recycle(browser)
+
+        self.idle.put(browser)
+
+    @contextmanager
+    def browser(self, timeout: float = None):
+        """Lease a browser for the duration of the with block, released with the pages it loaded in the block. Browsers that raised are replaced"""
+        browser = self.lease(timeout)
+        page_loads = browser.page_loads
+        try:
+            yield browser
+        except Exception:
+            self.release(browser, browser.page_loads - page_loads, broken=True)
+            raise
+
+        self.release(browser, browser.page_loads - page_loads)
+
+    def close(self):
+        """Quit all browsers. Leased browsers are quit when released back"""
+        self.closed = True
+        while True:
+            try:
+                browser = self.idle.get_nowait()
+            except Empty:
+                break
+
+            if browser is not None:
+                self.quit(browser)
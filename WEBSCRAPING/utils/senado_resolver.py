@@ -0,0 +1,71 @@
+from lxml import etree, html
+from urllib.parse import urljoin
+from utils.metrics import metrics
+
+SENADO_HOST = "legis.senado.leg.br"
+
+# texts of pages that have no document associated with the law
+NOT_FOUND_TEXTS = ("Whitelabel Error Page", "Sistema Inexistente", "Não foram encontr")
+
+HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+FIRST_TABLE = f"(//*[{HAS_CLASS.format('table')}])[1]"
+
+# compiled once, same elements the browser flow clicks: '.linknorma' of the first table, then the first link of the next page table
+LINKNORMA_XPATH = etree.XPath(
+    f"{FIRST_TABLE}//*[{HAS_CLASS.format('linknorma')}]/descendant-or-self::a/@href"
+)
+INNER_LINK_XPATH = etree.XPath(f"{FIRST_TABLE}//a/@href")
+
+
+class NeedsBrowserError(Exception):
+    """Page links are built by javascript, they can't be followed over HTTP"""
+
+
+class SenadoResolver:
+    """Follows the two hops of legis.senado.leg.br links (norm page, then the first link of its table) over HTTP, without a browser. Raises `NeedsBrowserError` when the pages don't have the links in their html so callers fall back to Selenium"""
+
+    def __init__(self, requester):
+        self.requester = requester
+
+    def table_link(self, url: str, xpath) -> str:
+        """Absolute url of the first `xpath` href of page `url`. None if the page has no document"""
+        response = self.requester.request(url)
+        if any(text in response.text for text in NOT_FOUND_TEXTS):
+            return None
+
+        hrefs = [
+            href
+            for href in xpath(html.document_fromstring(response.content))
+            if href.strip() and not href.lower().startswith(("javascript:", "#"))
+        ]
+        if not hrefs:
+            raise NeedsBrowserError(f"No link in page table: {url}")
+
+        return urljoin(response.url, hrefs[0].strip())
+
+    def resolve(self, link: str) -> str:
+        """Url of the document of a legis.senado link, None if the law has no document"""
+        try:
+            norma_link = self.table_link(link, LINKNORMA_XPATH)
+            document_link = (
+                self.table_link(norma_link, INNER_LINK_XPATH) if norma_link else None
+            )
+        except NeedsBrowserError:
+            metrics.increment("senado.fallback")
+            raise
+
+        metrics.increment("senado.http")
+        if document_link is None:
+            metrics.increment("senado.not_found")
+
+        return document_link
+
+    def report(self):
+        resolved = metrics.get("senado.http")
+        fallback = metrics.get("senado.fallback")
+        if not resolved + fallback:
+            return
+
+        print(
+            f"Senado links: {resolved} resolved over HTTP, {fallback} fell back to a browser | hit ratio {metrics.ratio('senado.http', 'senado.fallback'):.2%}"
+        )
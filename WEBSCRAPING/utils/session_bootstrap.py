@@ -0,0 +1,154 @@
+import os
+import json
+import time
+from pathlib import Path
+from utils.metrics import metrics
+from selenium.common.exceptions import TimeoutException
+
+SESSIONS_DIR = Path("checkpoints") / "sessions"
+LOCK_STALE_SECONDS = 300  # a lock older than this belongs to a dead process
+
+
+class SessionBootstrap:
+    """Harvests session cookies with a browser only when needed. Cookies are persisted with their expiries, reused across runs and processes and checked with a cheap probe request before being trusted"""
+
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        driver_factory,
+        probe=None,
+        page_load_wait: float = 30,  # upper bound, the harvest waits for network idle
+        min_ttl: float = 300,
+        session_max_age: float = 6 * 3600,
+    ):
+        self.url = url
+        self.session_path = SESSIONS_DIR / f"{name}.json"
+        self.lock_path = SESSIONS_DIR / f"{name}.lock"
+        self.driver_factory = driver_factory  # callable returning a new SeleniumHelper, quit after each harvest
+        self.probe = probe  # callable(requester) -> bool, True if session works
+        self.page_load_wait = page_load_wait
+        self.min_ttl = min_ttl  # cookies expiring sooner than this are expired
+        # lifetime assumed for cookies without expiry
+        self.session_max_age = session_max_age
+
+    def load(self) -> dict:
+        """Load persisted session: {"harvested_at": float, "cookies": [selenium cookie dicts]}"""
+        if not self.session_path.exists():
+            return None
+
+        try:
+            with open(self.session_path, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return None
+
+    def save(self, cookies: list[dict]) -> dict:
+        """Persist cookies atomically, other processes never read a partial file"""
+        session = {"harvested_at": time.time(), "cookies": cookies}
+
+        self.session_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.session_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(session, f, indent=4)
+        os.replace(tmp_path, self.session_path)
+
+        return session
+
+    def expired(self, session: dict) -> bool:
+        if not session or not session.get("cookies"):
+            return True
+
+        now = time.time()
+        if now - session["harvested_at"] > self.session_max_age:
+            return True
+
+        return any(
+            cookie.get("expiry") is not None and cookie["expiry"] < now + self.min_ttl
+            for cookie in session["cookies"]
+        )
+
+    def apply(self, requester, session: dict):
+        for cookie_obj in session["cookies"]:
+            requester.set_cookie(requester.cookie_dict_to_cookie(cookie_obj))
+
+    def harvest(self) -> dict:
+        """Open url in a browser, wait for the page to set its cookies and persist them"""
+        metrics.increment("session.harvests")
+        with metrics.timer("session.harvest"):
+            driver = self.driver_factory()
+            try:
+                driver.get(self.url)
+                try:
+                    # cookies are set by the page scripts, wait for their requests to settle
+                    driver.wait_network_idle(
+                        timeout=self.page_load_wait, replaces=self.page_load_wait
+                    )
+                except TimeoutException:
+                    print("Page did not settle, harvesting cookies anyway")
+                cookies = driver.get_driver().get_cookies()
+            finally:
+                # quit now, a harvest right after this one must not find the browser closing
+                driver.get_driver().quit()
+
+        return self.save(cookies)
+
+    def acquire_lock(self):
+        """Cross process lock, so only one process launches a browser at a time"""
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return
+            except FileExistsError:
+                try:
+                    if (
+                        time.time() - self.lock_path.stat().st_mtime
+                        > LOCK_STALE_SECONDS
+                    ):
+                        self.lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                time.sleep(1)
+
+    def release_lock(self):
+        try:
+            self.lock_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def is_valid(self, requester, session: dict) -> bool:
+        if self.expired(session):
+            return False
+
+        self.apply(requester, session)
+        return self.probe is None or self.probe(requester)
+
+    def bootstrap(self, requester, force: bool = False) -> dict:
+        """Set a working session on requester. Reuses persisted cookies and only launches a browser when they are expired, rejected by the probe or `force` is set"""
+        session = self.load()
+        if not force and self.is_valid(requester, session):
+            metrics.increment("session.reused")
+            return session
+
+        self.acquire_lock()
+        try:
+            # another process may have refreshed the session while we waited for the lock
+            refreshed = self.load()
+            if (
+                refreshed
+                and (not session or refreshed["harvested_at"] > session["harvested_at"])
+                and self.is_valid(requester, refreshed)
+            ):
+                metrics.increment("session.reused")
+                return refreshed
+
+            session = self.harvest()
+        finally:
+            self.release_lock()
+
+        self.apply(requester, session)
+        return session
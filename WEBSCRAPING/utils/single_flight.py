@@ -0,0 +1,111 @@
+import asyncio
+from pathlib import Path
+from threading import Lock, Event
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from utils.metrics import metrics
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize url so equivalent urls share a key: lowercase scheme and host, no default port, no fragment and sorted query params"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class Call:
+    """In flight call shared by every caller of the same key"""
+
+    def __init__(self):
+        self.event = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Request coalescing: concurrent calls with the same key run once and share the result (or exception)"""
+
+    def __init__(self, name: str = "requests"):
+        self.name = name
+        self.calls = {}
+        # key -> asyncio.Future, only touched by the event loop thread
+        self.async_calls = {}
+        self.lock = Lock()
+
+    def shared(self, result):
+        """Count a call answered by another caller's fetch"""
+        metrics.increment(f"singleflight.{self.name}.shared")
+        if isinstance(result, Path) and result.exists():  # downloaded file
+            size = result.stat().st_size
+        else:
+            size = len(getattr(result, "content", None) or b"")
+
+        metrics.increment(f"singleflight.{self.name}.saved_bytes", size)
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+
+            self.shared(call.result)
+            return call.result
+
+        metrics.increment(f"singleflight.{self.name}.fetched")
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    async def do_async(self, key, coroutine_func, *args, **kwargs):
+        """Same as `do` for coroutines. Must always be called from the same event loop"""
+        future = self.async_calls.get(key)
+        if future is not None:
+            result = await asyncio.shield(future)
+            self.shared(result)
+            return result
+
+        metrics.increment(f"singleflight.{self.name}.fetched")
+        future = self.async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coroutine_func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark exception as retrieved when nobody else awaits it
+            future.exception()
+            raise
+        finally:
+            del self.async_calls[key]
+
+    def dedup_ratio(self) -> float:
+        """Share of calls answered without a fetch of their own"""
+        return metrics.ratio(
+            f"singleflight.{self.name}.shared", f"singleflight.{self.name}.fetched"
+        )
+
+
+default_single_flight = SingleFlight()